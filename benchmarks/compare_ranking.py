@@ -0,0 +1,90 @@
+"""
+Compares the tf-idf ranking of the index against BM25. For a sample of queries, reports how many of the top 10
+results the two rankings share, how long the speeches they rank highest are, and how long each ranking takes.
+
+Run from the repository root, either on an existing index or on an index built from the processed speeches:
+    python -m benchmarks.compare_ranking [processed speeches file] [number of speeches] [k1] [b]
+    python -m benchmarks.compare_ranking --index [index name] [k1] [b]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from greparl.SearchEngine.backend.inverted.bm25 import BM25
+from greparl.SearchEngine.backend.inverted.builder import build_index_from_file
+from greparl.SearchEngine.backend.inverted.inverted_index import InvertedIndex
+
+# Number of results compared for every query
+TOP_RESULTS = 10
+# Number of sampled queries
+QUERY_COUNT = 200
+
+
+def sample_queries(index: InvertedIndex, query_count=QUERY_COUNT, seed=0) -> list[list[str]]:
+    """
+    Sample queries of one to three terms, among the terms appearing in at least two and at most a tenth of the
+    documents, so that both rankings have something to choose from.
+    """
+    terms = [index.lexicon.get_term(term_id) for term_id in range(len(index.lexicon))]
+    max_document_frequency = max(2, index.total_documents // 10)
+    candidates = [term for term in terms if 2 <= index.get_document_frequency(term) <= max_document_frequency]
+    if not candidates:
+        return []
+    rng = np.random.default_rng(seed)
+    return [rng.choice(candidates, rng.integers(1, 4)).tolist() for _ in range(query_count)]
+
+
+def compare(index: InvertedIndex, queries: list[list[str]], bm25: BM25) -> None:
+    overlaps = []
+    tf_idf_tokens = []
+    bm25_tokens = []
+    tf_idf_time = 0.0
+    bm25_time = 0.0
+    for query in queries:
+        start = time.perf_counter()
+        tf_idf_results = index.search(query, TOP_RESULTS)
+        tf_idf_time += time.perf_counter() - start
+        start = time.perf_counter()
+        bm25_results = index.search(query, TOP_RESULTS, bm25=bm25)
+        bm25_time += time.perf_counter() - start
+        overlaps.append(len(set(tf_idf_results) & set(bm25_results)) / max(len(tf_idf_results), 1))
+        tf_idf_tokens.extend(index.documents["tokens"][tf_idf_results].tolist())
+        bm25_tokens.extend(index.documents["tokens"][bm25_results].tolist())
+    print("{} speeches, average length {:.1f} tokens, {} queries".format(index.total_documents,
+                                                                         index.average_document_length, len(queries)))
+    print("BM25 with k1={}, b={}".format(bm25.k1, bm25.b))
+    print("Shared results in the top {}: {:.1%}".format(TOP_RESULTS, np.mean(overlaps)))
+    print("Median length of the top results: tf-idf {:.0f} tokens, BM25 {:.0f} tokens".format(
+        np.median(tf_idf_tokens), np.median(bm25_tokens)))
+    print("Average query time: tf-idf {:.2f}ms, BM25 {:.2f}ms".format(1000 * tf_idf_time / len(queries),
+                                                                      1000 * bm25_time / len(queries)))
+
+
+def main():
+    arguments = sys.argv[1:]
+    if arguments[:1] == ["--index"]:
+        index = InvertedIndex(arguments[1])
+        parameters = arguments[2:]
+        compare(index, sample_queries(index), BM25(*[float(parameter) for parameter in parameters]))
+        return
+    processed_speeches_file_name = os.path.abspath(arguments[0]) if arguments else \
+        os.path.abspath("processed/stemmed-with-stopwords.txt")
+    speech_number = int(arguments[1]) if len(arguments) > 1 else -1
+    bm25 = BM25(*[float(parameter) for parameter in arguments[2:]])
+    original_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            build_index_from_file(processed_speeches_file_name, InvertedIndex("index", replace=True),
+                                  speech_number=speech_number)
+            index = InvertedIndex("index")
+            compare(index, sample_queries(index), bm25)
+        finally:
+            os.chdir(original_directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Compares searching the first tier of the index against the exhaustive search. For a sample of queries, reports the
+recall of the top 10 results of the certified tiered search, which falls back to the full posting lists, and of the
+first tier alone, how many searches had to fall back, and how long each search takes.
+
+Run from the repository root, either on an existing index built with a tier or on an index built from the processed
+speeches:
+    python -m benchmarks.compare_tiers [processed speeches file] [number of speeches] [tier size]
+    python -m benchmarks.compare_tiers --index [index name]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from greparl.SearchEngine.backend.inverted.builder import build_index_from_file
+from greparl.SearchEngine.backend.inverted.inverted_index import InvertedIndex, search_exhaustive, \
+    search_first_tier, search_tiered
+
+# Number of results compared for every query
+TOP_RESULTS = 10
+# Number of sampled queries
+QUERY_COUNT = 200
+# Default number of postings of each term in the tier
+TIER_SIZE = 1000
+
+
+def sample_queries(index: InvertedIndex, query_count=QUERY_COUNT, seed=0) -> list[list[str]]:
+    """
+    Sample queries of one to three terms. Terms are sampled by their document frequency, like the terms of real
+    queries, which are mostly common ones.
+    """
+    terms = list(index.lexicon.terms())
+    document_frequencies = np.asarray(index.lexicon.document_frequencies, dtype=np.float64)
+    if not terms:
+        return []
+    rng = np.random.default_rng(seed)
+    probabilities = document_frequencies / document_frequencies.sum()
+    return [[terms[term_id] for term_id in rng.choice(len(terms), rng.integers(1, 4), p=probabilities).tolist()]
+            for _ in range(query_count)]
+
+
+def recall(results: list[int], expected: list[int]) -> float:
+    return len(set(results) & set(expected)) / len(expected) if expected else 1.0
+
+
+def compare(index: InvertedIndex, queries: list[list[str]]) -> None:
+    certified_recalls = []
+    first_tier_recalls = []
+    fallbacks = 0
+    times = {"exhaustive": 0.0, "tiered": 0.0, "first tier": 0.0}
+    for query in queries:
+        start = time.perf_counter()
+        expected = search_exhaustive(index, query, TOP_RESULTS)
+        times["exhaustive"] += time.perf_counter() - start
+        start = time.perf_counter()
+        certified_recalls.append(recall(search_tiered(index, query, TOP_RESULTS), expected))
+        times["tiered"] += time.perf_counter() - start
+        start = time.perf_counter()
+        first_tier_recalls.append(recall(search_first_tier(index, query, TOP_RESULTS, certify=False), expected))
+        times["first tier"] += time.perf_counter() - start
+        fallbacks += search_first_tier(index, query, TOP_RESULTS) is None
+    print("{} speeches, tier of {} postings for {} terms, {} queries".format(index.total_documents, index.tier_size,
+                                                                             len(index.tier), len(queries)))
+    print("Recall@{}: tiered {:.1%}, first tier only {:.1%}".format(TOP_RESULTS, np.mean(certified_recalls),
+                                                                   np.mean(first_tier_recalls)))
+    print("Searches falling back to the full posting lists: {:.1%}".format(fallbacks / len(queries)))
+    print("Average query time: " + ", ".join("{} {:.2f}ms".format(name, 1000 * total / len(queries))
+                                             for name, total in times.items()))
+
+
+def main():
+    arguments = sys.argv[1:]
+    if arguments[:1] == ["--index"]:
+        index = InvertedIndex(arguments[1])
+        if index.tier is None:
+            print("The index has no tier. Build it with a tier size to compare the tiered search.")
+            return
+        compare(index, sample_queries(index))
+        return
+    processed_speeches_file_name = os.path.abspath(arguments[0]) if arguments else \
+        os.path.abspath("processed/stemmed-with-stopwords.txt")
+    speech_number = int(arguments[1]) if len(arguments) > 1 else -1
+    tier_size = int(arguments[2]) if len(arguments) > 2 else TIER_SIZE
+    original_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            build_index_from_file(processed_speeches_file_name, InvertedIndex("index", replace=True,
+                                                                              tier_size=tier_size),
+                                  speech_number=speech_number)
+            index = InvertedIndex("index")
+            compare(index, sample_queries(index))
+        finally:
+            os.chdir(original_directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Compares the build time of InvertedIndex.populate_index against its original implementation, which fetched every
+column and row of the count matrix as a separate sparse matrix and wrote a text index.
+
+Run from the repository root:
+    python -m benchmarks.populate_index [processed speeches file] [number of speeches]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from numpy.linalg import norm
+from sklearn.feature_extraction.text import CountVectorizer
+
+from greparl.SearchEngine.backend.inverted.inverted_index import InvertedIndex
+
+
+def create_string_from_term_column(term, term_column) -> str:
+    """
+    Creates the line of a term in the original text index. Part of the original implementation, see
+    legacy_populate_index.
+    """
+    # Each line in the index is in the format: term,docid1,count1,docid2,count2,....,docidN,countN
+    str_array = [str(term)]
+    for document_id, term_frequency in zip(term_column.row, term_column.data):
+        str_array.extend([str(document_id), str(term_frequency)])
+    return ','.join(str_array)
+
+
+def legacy_populate_index(count_matrix, terms, index_file_name="index/legacy") -> None:
+    """
+    The original implementation of populate_index, from the first commit of the repository, before the binary posting
+    lists, the lexicon and the document statistics were added. It writes the text index, its catalog of term offsets
+    and the text lengths file.
+    """
+    with open(index_file_name, "w+", encoding='utf8') as index_contents_file, \
+            open("{}-catalog".format(index_file_name), "w+", encoding='utf8') as index_catalog_file, \
+            open("{}-lengths".format(index_file_name), "w+", encoding='utf8') as lengths_file:
+        term_offsets = dict()
+        lengths = dict()
+        conv_matrix = count_matrix.tocsc()
+        total_documents, total_terms = count_matrix.shape
+        for term_index in range(total_terms):
+            # Convert column to coo format, so we can quickly iterate over all non-zero elements
+            term_column = conv_matrix.getcol(term_index).tocoo()
+            term = terms[term_index]
+            # Write the offset in the index catalog
+            index_catalog_file.write(",".join([term, str(index_contents_file.tell())]))
+            index_catalog_file.write("\n")
+            # Write the offset in the index dict
+            term_offsets[term] = index_contents_file.tell()
+            # Write the contents in the current position in index_contents
+            index_contents_file.write(create_string_from_term_column(term, term_column))
+            index_contents_file.write("\n")
+        # Store document lengths. This could be done in parallel with the above for loop.
+        # Convert to csr for quick row fetching
+        conv_matrix = count_matrix.tocsr()
+        for document_index in range(total_documents):
+            document_row = conv_matrix.getrow(document_index).tocoo()
+            document_length = norm(document_row.data)
+            lengths_file.write(str(document_length))
+            lengths_file.write("\n")
+            lengths[document_index] = document_length
+
+
+def main():
+    processed_speeches_file_name = sys.argv[1] if len(sys.argv) > 1 else "processed/stemmed-with-stopwords.txt"
+    speech_number = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    with open(processed_speeches_file_name, "r", encoding="utf8") as processed_speeches:
+        # Ignore the first line
+        processed_speeches.readline()
+        lines = [line for _, line in zip(range(speech_number), processed_speeches)]
+    vectorizer = CountVectorizer(lowercase=False)
+    count_matrix = vectorizer.fit_transform(lines)
+    terms = vectorizer.get_feature_names_out()
+    print("{} speeches, {} terms, {} postings".format(count_matrix.shape[0], count_matrix.shape[1], count_matrix.nnz))
+    original_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            os.mkdir("index")
+            start = time.perf_counter()
+            legacy_populate_index(count_matrix, terms)
+            legacy_time = time.perf_counter() - start
+            start = time.perf_counter()
+            InvertedIndex("index", replace=True).populate_index(count_matrix, terms)
+            current_time = time.perf_counter() - start
+        finally:
+            os.chdir(original_directory)
+    print("Original implementation: {:.3f}s".format(legacy_time))
+    print("Current implementation:  {:.3f}s ({:.1f}x)".format(current_time, legacy_time / current_time))
+
+
+if __name__ == "__main__":
+    main()
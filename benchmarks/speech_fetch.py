@@ -0,0 +1,100 @@
+"""
+Measures the time to fetch speeches from the speeches file, with the memory-mapped SpeechFile and with seeking and
+reading a buffered file for every speech. Batches of random speeches, like the pages of search results, and ranges of
+consecutive speeches are fetched.
+
+Run from the repository root, either on the speeches file or on a generated file with the given number of speeches:
+    python -m benchmarks.speech_fetch [speeches file] [number of batches]
+    python -m benchmarks.speech_fetch --generate [number of speeches] [number of batches]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from greparl.SearchEngine.backend.speech_file import SpeechFile
+from greparl.SearchEngine.preprocessing.funcs import process_csv_line
+
+# Number of speeches of every batch, as many as a page of results
+RANDOM_BATCH_SIZE = 10
+# Number of speeches of every range of consecutive speeches
+RANGE_SIZE = 200
+# Number of fetched batches of every kind
+BATCH_COUNT = 1000
+# Number of speeches of a generated speeches file
+GENERATED_SPEECHES = 200000
+
+
+def generate_speeches(speeches_file_name: str, speech_count: int, seed=0) -> None:
+    rng = np.random.default_rng(seed)
+    words = ["λέξη{}".format(i) for i in range(5000)]
+    with open(speeches_file_name, "w", encoding="utf8") as speeches_file:
+        speeches_file.write("member_name,sitting_date,parliamentary_period,parliamentary_session,"
+                            "parliamentary_sitting,political_party,government,member_region,roles,member_gender,"
+                            "speech\n")
+        for speech_id in range(speech_count):
+            text = " ".join(words[i] for i in rng.integers(0, len(words), int(rng.integers(20, 800))))
+            speeches_file.write("μέλος {},01/01/2000,περιοδος 1,συνοδος 1,συνεδριαση 1,κόμμα,['κυβέρνηση'],"
+                                "περιφέρεια,\"['ρόλος']\",male,{}\n".format(speech_id % 300, text))
+
+
+def fetch_with_reads(speeches_file, speech_file: SpeechFile, speech_ids: list[int]) -> list:
+    """
+    Fetch speeches by seeking to each of them in a buffered file.
+    """
+    speeches = []
+    for speech_id in sorted(speech_ids):
+        start = int(speech_file.speeches_offset[speech_id])
+        speeches_file.seek(start)
+        line = speeches_file.read(int(speech_file.speeches_offset[speech_id + 1]) - start)
+        speeches.append(process_csv_line(line.decode("utf8").rstrip("\r\n")))
+    return speeches
+
+
+def measure(fetch, batches: list[list[int]]) -> float:
+    """
+    :return: average time to fetch a batch, in milliseconds
+    """
+    start = time.perf_counter()
+    for batch in batches:
+        fetch(batch)
+    return 1000 * (time.perf_counter() - start) / len(batches)
+
+
+def compare(speeches_file_name: str, batch_count: int) -> None:
+    start = time.perf_counter()
+    speech_file = SpeechFile(speeches_file_name)
+    print("{} speeches, opened in {:.3f}s".format(speech_file.total_speeches, time.perf_counter() - start))
+    rng = np.random.default_rng(0)
+    batches = {
+        "random": [rng.integers(0, speech_file.total_speeches, RANDOM_BATCH_SIZE).tolist()
+                   for _ in range(batch_count)],
+        "range": [list(range(first, min(first + RANGE_SIZE, speech_file.total_speeches)))
+                  for first in rng.integers(0, speech_file.total_speeches, batch_count).tolist()],
+    }
+    with open(speeches_file_name, "rb") as speeches_file:
+        for kind, kind_batches in batches.items():
+            print("{} {} speeches: mmap {:.3f}ms, seek and read {:.3f}ms".format(
+                kind.capitalize(), len(kind_batches[0]), measure(speech_file.get_speeches, kind_batches),
+                measure(lambda batch: fetch_with_reads(speeches_file, speech_file, batch), kind_batches)))
+
+
+def main():
+    arguments = sys.argv[1:]
+    if arguments[:1] == ["--generate"]:
+        speech_count = int(arguments[1]) if len(arguments) > 1 else GENERATED_SPEECHES
+        batch_count = int(arguments[2]) if len(arguments) > 2 else BATCH_COUNT
+        with tempfile.TemporaryDirectory() as directory:
+            speeches_file_name = os.path.join(directory, "speeches.csv")
+            generate_speeches(speeches_file_name, speech_count)
+            compare(speeches_file_name, batch_count)
+        return
+    speeches_file_name = arguments[0] if arguments else "speeches.csv"
+    batch_count = int(arguments[1]) if len(arguments) > 1 else BATCH_COUNT
+    compare(speeches_file_name, batch_count)
+
+
+if __name__ == "__main__":
+    main()
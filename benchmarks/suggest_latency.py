@@ -0,0 +1,59 @@
+"""
+Measures the latency of the search box completions. Prefixes of one to six characters are sampled from the completed
+words of the speeches and from the names of the members, and the median and 99th percentile of the time to complete
+each of them are reported.
+
+Run from the repository root, where the term completions and the groups have been created:
+    python -m benchmarks.suggest_latency [number of prefixes]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+from greparl.SearchEngine.backend.suggestions import CompletionIndex, TERM_COMPLETIONS_FILE, create_name_completions, \
+    normalize_prefix
+from greparl.SearchEngine.backend.top.group_manager import GroupManager
+
+# Number of sampled prefixes
+PREFIX_COUNT = 10000
+
+
+def measure(completions, prefixes: list[str]) -> tuple[float, float]:
+    """
+    Complete every prefix.
+    :return: tuple with the median and the 99th percentile of the time of each completion, in milliseconds
+    """
+    times = []
+    for prefix in prefixes:
+        start = time.perf_counter()
+        completions.complete(prefix)
+        times.append(time.perf_counter() - start)
+    return 1000 * float(np.median(times)), 1000 * float(np.percentile(times, 99))
+
+
+def sample_prefixes(keys: list[str], prefix_count: int, seed=0) -> list[str]:
+    rng = np.random.default_rng(seed)
+    keys = [keys[i] for i in rng.integers(0, len(keys), prefix_count)]
+    return [key[:length] for key, length in zip(keys, rng.integers(1, 7, prefix_count).tolist())]
+
+
+def main():
+    arguments = sys.argv[1:]
+    prefix_count = int(arguments[0]) if arguments else PREFIX_COUNT
+    start = time.perf_counter()
+    term_completions = CompletionIndex.read(TERM_COMPLETIONS_FILE)
+    print("{} words, completions read in {:.2f}s".format(len(term_completions), time.perf_counter() - start))
+    print("Terms: median {:.3f}ms, 99th percentile {:.3f}ms".format(
+        *measure(term_completions, sample_prefixes(term_completions.keys, prefix_count))))
+    if os.path.exists("groups"):
+        speeches_of_name = GroupManager().get_attribute("speaker_name")
+        name_completions = create_name_completions(speeches_of_name)
+        normalized_names = [normalize_prefix(name) for name in speeches_of_name if name.strip()]
+        print("Members: median {:.3f}ms, 99th percentile {:.3f}ms".format(
+            *measure(name_completions, sample_prefixes(normalized_names, prefix_count))))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
-from greparl.SearchEngine.preprocessing.group import *
+from greparl.SearchEngine.preprocessing.create import create_sitting_dates
+from greparl.SearchEngine.preprocessing.create_group import *
 from greparl.SearchEngine.backend.speech_file import SpeechFile
 
 speech_file = SpeechFile("speeches.csv")
-create_groups(speech_file, [speaker_name, party])
+create_groups(speech_file, [speaker_name, party, gender, member_region])
+# The search filters need the sitting dates along with the groups
+create_sitting_dates(speech_file)
 
 print("OK")
@@ -1,5 +1,6 @@
 from .backend import Speech
 from .backend import SpeechBackend as SearchEngine
 from .backend import SpeechFile
+from .backend import SpeechFilter
 
 from .preprocessing.create import create_inverted_index as index
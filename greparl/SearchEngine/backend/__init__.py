@@ -1,5 +1,9 @@
 from .backend import SpeechBackend
 
+from .filters import SpeechFilter
+
+from .pagination import SearchPage
+
 from .speech_file import SpeechFile
 
 from .speech import Speech
@@ -1,24 +1,71 @@
 import gzip
+import os
 import pickle
+import re
 import typing
+from typing import Optional
 
-from .inverted.inverted_index import InvertedIndex
+from .inverted.segments import SegmentedIndex
+from .inverted.shards import ShardedIndex
+from .cache import QueryCache, DEFAULT_CACHE_SIZE, DEFAULT_TIME_TO_LIVE
+from .facets import FacetManager
+from .filters import FilterManager, SpeechFilter
+from .inverted.batch import search_many
+from .inverted.bm25 import BM25
+from .inverted.lexicon import get_literal_prefix
+from .inverted.boolean import BooleanQuery, evaluate_query, expand_misspellings
+from .pagination import SearchPage, RANKING_DEPTH, MAX_OFFSET, MAX_PAGE_SIZE, encode_cursor, decode_cursor
+from .query import parse_query, process_query_text, suggest_query
 from .lsa.lsa_manager import LSAManager
 from .similarity.similarity_manager import SimilarityMember, SimilarityManager, SimilarityResult
 from .speech import Speech
+from .snippets import SnippetGenerator
 from .speech_file import SpeechFile
+from .suggestions import CompletionIndex, MAX_SUGGESTIONS, TERM_COMPLETIONS_FILE, create_name_completions, \
+    normalize_prefix
 from .top.keyword_manager import KeywordManager
 from ..preprocessing.funcs import process_raw_speech_text
 from .top.group_manager import GroupManager
 from datetime import date
 
+# Attributes left out of the highlights. Each of their values covers a large part of all the speeches, so extracting
+# the keywords of one of them means reading and vectorizing too many speeches.
+HIGHLIGHT_EXCLUDED_ATTRIBUTES = {"gender", "member_region"}
+
 
 class SpeechBackend:
 
-    def __init__(self, index_file="index", speeches_file="speeches.csv"):
+    def __init__(self, index_file="index", speeches_file="speeches.csv", cache_size=DEFAULT_CACHE_SIZE,
+                 cache_time_to_live=DEFAULT_TIME_TO_LIVE, cache_speeches=True, cursor_key: bytes = None,
+                 max_page_size=MAX_PAGE_SIZE):
+        """
+        If the index has been split into shards, searches are sent to the worker process of every shard. See
+        ShardedIndex.
+        :param cache_size: number of search results to cache. With 0 nothing is cached.
+        :param cache_time_to_live: seconds after which a cached result expires
+        :param cache_speeches: cache the speeches of the results too, instead of only their ids
+        :param cursor_key: secret key the cursors of the result pages are signed with, such as the secret key of the
+                           web application, so that only cursors created by search_page are accepted
+        :param max_page_size: largest number of results of a page, see search_page
+        """
         self.speeches_file = SpeechFile(speeches_file)
-        self.index = InvertedIndex(index_file)
+        self.index = ShardedIndex(index_file) if ShardedIndex.exists(index_file) else SegmentedIndex(index_file)
+        self.query_cache = QueryCache(cache_size, cache_time_to_live)
+        self.cache_speeches = cache_speeches
+        self.cursor_key = cursor_key
+        self.max_page_size = max_page_size
         self.group_manager = GroupManager()
+        self.filter_manager = FilterManager(self.group_manager)
+        self.facet_manager = FacetManager(self.group_manager, self.filter_manager.sitting_dates)
+        # Completions of the terms of the index and of the names of the members, see suggest
+        if not os.path.exists(TERM_COMPLETIONS_FILE):
+            raise RuntimeError("The term completions file {} does not exist. Create it with "
+                               "create_term_completions_file.".format(TERM_COMPLETIONS_FILE))
+        self.term_completions = None
+        # Modification time and size of the term completions file when it was read
+        self.term_completions_status = None
+        self.__read_term_completions()
+        self.name_completions = self._get_name_completions()
         self.keyword_manager = self._get_keyword_manager()
         self.similarity_manager = SimilarityManager()
         self.lsa_manager = LSAManager()
@@ -27,6 +74,25 @@ class SpeechBackend:
     def _get_model_file(self):
         return gzip.open("models/party", "rb")
 
+    def __read_term_completions(self) -> None:
+        """
+        Reads the term completions file, if it has changed since it was last read, such as after speeches were appended
+        to the index.
+        """
+        try:
+            status = os.stat(TERM_COMPLETIONS_FILE)
+        except OSError:
+            # Keep the completions already read
+            return
+        if (status.st_mtime_ns, status.st_size) != self.term_completions_status:
+            self.term_completions = CompletionIndex.read(TERM_COMPLETIONS_FILE)
+            self.term_completions_status = (status.st_mtime_ns, status.st_size)
+
+    def _get_name_completions(self) -> CompletionIndex:
+        if "speaker_name" not in self.group_manager.get_group_attributes():
+            return CompletionIndex([], [], [])
+        return create_name_completions(self.group_manager.get_attribute("speaker_name"))
+
     def _get_keyword_manager(self) -> KeywordManager:
         vectorizer = pickle.load(open("tfidf/vectorizer.pkl", "rb"))
         transformer = pickle.load(open("tfidf/transformer.pkl", "rb"))
@@ -35,14 +101,194 @@ class SpeechBackend:
     def _initialize_dates(self):
         self.start_date = self.speeches_file.total_speeches
 
-    def search(self, query: str, number_of_results=10) -> list[Speech]:
-        processed_query = process_raw_speech_text(query, perform_stemming=True, delete_stopwords=True)
-        # Check if query only has stopwords
-        if len(processed_query) == 0:
-            processed_query = process_raw_speech_text(query, perform_stemming=True, delete_stopwords=False)
-        document_ids = self.index.search(processed_query, number_of_results=number_of_results)
-        speeches = self.speeches_file.get_speeches(document_ids, preserve_order=True)
-        return speeches
+    def search(self, query: str, number_of_results=10, speech_filter: SpeechFilter = None, facets=None,
+               bm25: BM25 = None, offset=0) \
+            -> typing.Union[list[Speech], tuple[list[Speech], dict[str, dict[str, int]]]]:
+        """
+        Search the speeches with tf-idf or BM25 ranking.
+        :param query: query string. Words prefixed with + are required and words prefixed with - are excluded. Clauses
+                      can be combined with AND and OR and grouped with parentheses. Text in double quotes is a phrase
+                      that must appear in the speeches as is. A phrase followed by ~N, like "word1 word2"~3, matches
+                      speeches where its words appear in order with at most N other words between them. Phrases need
+                      an index created with positions, otherwise ValueError is raised. See QueryParser. Words that are
+                      not in the index are replaced with the closest ones that are.
+        :param number_of_results: number of results to fetch
+        :param speech_filter: only search the speeches of a date range and with the given party, member, gender or
+                              region. Speeches excluded by the filter are never scored. Raises ValueError if the
+                              speeches have not been grouped by one of the attributes of the filter.
+        :param facets: list of facets, such as "political_party", "year" and "member_name", to count all the matching
+                       speeches by. Raises ValueError if the speeches cannot be counted by one of them. See
+                       FacetManager.
+        :param bm25: rank with BM25 using the given k1 and b, such as BM25(k1=1.2, b=0.75), instead of tf-idf. BM25
+                     does not let very long speeches dominate the results.
+        :param offset: number of best results to skip
+        :return: the speeches best-to-worst. If facets are given, a tuple with the speeches and a dictionary with the
+                 counts of every facet.
+        """
+        boolean_query = self.__parse_query(query)
+        speeches, _ = self.__get_page(boolean_query, offset, number_of_results, speech_filter, bm25)
+        if facets is None:
+            return speeches
+        return speeches, self.__get_facet_counts(boolean_query, speech_filter, tuple(facets))
+
+    def search_page(self, query: str = None, offset=0, limit=10, speech_filter: SpeechFilter = None,
+                    bm25: BM25 = None, cursor: str = None) -> SearchPage:
+        """
+        Get a page of search results, along with cursors to the next and the previous pages. The ranked results of the
+        query are cached, so moving between pages usually only costs reading their speeches.
+        :param query: query string, see search
+        :param offset: number of best results to skip
+        :param limit: number of results in the page
+        :param speech_filter: only search the speeches passing the filter, see search
+        :param bm25: rank with BM25 using the given k1 and b instead of tf-idf
+        :param cursor: cursor of a page returned by an earlier call. The rest of the arguments are ignored.
+        :raises ValueError if the cursor is not valid, the page has more than max_page_size results or starts too deep,
+                the speeches cannot be filtered by an attribute of the filter, or the query has a phrase and the
+                index has been created without positions
+        """
+        if cursor is not None:
+            query, offset, limit, speech_filter, bm25 = decode_cursor(cursor, self.cursor_key, self.max_page_size)
+        elif not 0 <= offset <= MAX_OFFSET or not 0 < limit <= self.max_page_size:
+            raise ValueError("Pages have 1 to {} results and start at most {} results deep"
+                             .format(self.max_page_size, MAX_OFFSET))
+        boolean_query = self.__parse_query(query)
+        speeches, has_next = self.__get_page(boolean_query, offset, limit, speech_filter, bm25)
+        page = SearchPage(query, speeches, offset, limit, suggestion=self.did_you_mean(query),
+                          snippets=self.__get_snippets(boolean_query, speeches))
+        if has_next:
+            page.next_cursor = encode_cursor(query, offset + limit, limit, speech_filter, bm25, self.cursor_key)
+        if offset > 0:
+            page.previous_cursor = encode_cursor(query, max(0, offset - limit), limit, speech_filter, bm25,
+                                                 self.cursor_key)
+        if page.suggestion is not None:
+            page.suggestion_cursor = encode_cursor(page.suggestion, 0, limit, speech_filter, bm25, self.cursor_key)
+        return page
+
+    def get_snippets(self, query: str, speeches: list[Speech]) -> list[list[tuple[str, bool]]]:
+        """
+        Get the part of each speech where the words of a query are the densest, for showing along with the results.
+        :return: the snippet of every speech, as a list of tuples with its consecutive fragments and whether each of
+                 them matches the query and should be highlighted
+        """
+        return self.__get_snippets(self.__parse_query(query), speeches)
+
+    @staticmethod
+    def __get_snippets(boolean_query: BooleanQuery, speeches: list[Speech]) -> list[list[tuple[str, bool]]]:
+        snippet_generator = SnippetGenerator(boolean_query.get_scoring_terms(),
+                                             [get_literal_prefix(pattern)
+                                              for pattern in boolean_query.get_scoring_patterns()])
+        return [snippet_generator.get_snippet(speech.contents) for speech in speeches]
+
+    def did_you_mean(self, query: str) -> Optional[str]:
+        """
+        Suggest a correction of a query with misspelled words, replacing them with the most frequent words of the
+        speeches within a small edit distance.
+        :return: the corrected query, or None if all of its words appear in the speeches or cannot be corrected
+        """
+        return suggest_query(self.index, query)
+
+    def __parse_query(self, query: str) -> BooleanQuery:
+        """
+        Parse a query, replacing its misspelled terms with the closest terms of the index.
+        :raises ValueError if the query has a phrase and the index does not store the positions of the terms
+        """
+        boolean_query = parse_query(query)
+        if boolean_query.has_phrases() and not self.index.positional:
+            raise ValueError("Phrases cannot be searched, since the index has been created without positions.")
+        return expand_misspellings(self.index, boolean_query)
+
+    def __get_ranking(self, boolean_query, speech_filter: SpeechFilter, bm25: BM25, depth: int) -> list[int]:
+        """
+        Get the ids of at least the best depth results of a query, or all of them if there are fewer. Rankings are
+        cached, and they are deeper than requested so that the following pages are already part of them.
+        """
+        # The parsed query contains the processed terms, so queries that only differ in spelling share their results
+        key = ("ranking", repr(boolean_query), speech_filter, bm25)
+        self.query_cache.check_version(self.index.version)
+        cached = self.query_cache.get(key)
+        cached_depth = 0
+        if cached is not None:
+            document_ids, complete = cached
+            if complete or len(document_ids) >= depth:
+                return document_ids
+            cached_depth = len(document_ids)
+        depth = max(depth, RANKING_DEPTH, 2 * cached_depth)
+        documents = self.filter_manager.get_documents(speech_filter)
+        document_ids = self.index.search_boolean_query(boolean_query, number_of_results=depth, documents=documents,
+                                                       bm25=bm25)
+        # A ranking shorter than requested contains every matching speech
+        self.query_cache.put(key, (document_ids, len(document_ids) < depth))
+        return document_ids
+
+    def __get_page(self, boolean_query, offset: int, limit: int, speech_filter: SpeechFilter, bm25: BM25) \
+            -> tuple[list[Speech], bool]:
+        """
+        Get the speeches of a page of results.
+        :return: tuple with the speeches and whether there are more results after them
+        """
+        # One more result shows whether there is a next page
+        document_ids = self.__get_ranking(boolean_query, speech_filter, bm25, offset + limit + 1)
+        key = ("speeches", repr(boolean_query), speech_filter, bm25, offset, limit)
+        speeches = self.query_cache.get(key) if self.cache_speeches else None
+        if speeches is None:
+            speeches = self.speeches_file.get_speeches(document_ids[offset:offset + limit], preserve_order=True)
+            if self.cache_speeches:
+                self.query_cache.put(key, speeches)
+        # Callers get their own lists, so that the cached ones are never modified
+        return list(speeches), len(document_ids) > offset + limit
+
+    def __get_facet_counts(self, boolean_query, speech_filter: SpeechFilter, facets: tuple[str]) \
+            -> dict[str, dict[str, int]]:
+        """
+        Count all the speeches matching a query by the values of each facet.
+        """
+        key = ("facets", repr(boolean_query), speech_filter, facets)
+        self.query_cache.check_version(self.index.version)
+        facet_counts = self.query_cache.get(key)
+        if facet_counts is None:
+            matches = evaluate_query(self.index, boolean_query, self.filter_manager.get_documents(speech_filter))
+            facet_counts = self.facet_manager.get_facet_counts(matches, facets)
+            self.query_cache.put(key, facet_counts)
+        return {facet: dict(counts) for facet, counts in facet_counts.items()}
+
+    def search_many(self, queries: list[str], number_of_results=10, speech_filter: SpeechFilter = None,
+                    bm25: BM25 = None) -> list[list[Speech]]:
+        """
+        Search the speeches for many queries at once. Terms shared by the queries are only read from the index once,
+        and every speech in the results is read once, in a single pass over the speeches file.
+        :param queries: query strings, see search
+        :param number_of_results: number of results to fetch for each query
+        :param speech_filter: only search the speeches passing the filter, see search
+        :param bm25: rank with BM25 using the given k1 and b instead of tf-idf
+        :return: the speeches of each query, best-to-worst
+        """
+        documents = self.filter_manager.get_documents(speech_filter)
+        # Repeated queries are only parsed and evaluated once
+        distinct_queries = list(dict.fromkeys(queries))
+        rankings = search_many(self.index, [self.__parse_query(query) for query in distinct_queries],
+                               number_of_results=number_of_results, documents=documents, bm25=bm25)
+        document_ids_of_query = dict(zip(distinct_queries, rankings))
+        speech_ids = sorted({speech_id for ranking in rankings for speech_id in ranking})
+        speeches = {speech.id: speech for speech in self.speeches_file.get_speeches(speech_ids)}
+        return [[speeches[speech_id] for speech_id in document_ids_of_query[query]] for query in queries]
+
+    def suggest(self, prefix: str, k=MAX_SUGGESTIONS) -> dict[str, list[str]]:
+        """
+        Suggest completions of the text being typed in the search box, the most frequent first.
+        :param prefix: the text typed so far
+        :param k: maximum number of completions of each kind
+        :return: dictionary with the completions of the last word among the words of the speeches, under "terms", and
+                 the names of the members starting with the text, or with any of their words starting with it, under
+                 "members"
+        """
+        self.__read_term_completions()
+        normalized_prefix = normalize_prefix(prefix)
+        # Only a word still being typed is completed
+        last_word = re.search(r"\w*$", prefix).group(0)
+        return {
+            "terms": self.term_completions.complete(normalize_prefix(last_word), k) if last_word else [],
+            "members": self.name_completions.complete(" ".join(normalized_prefix.split()), k),
+        }
 
     def search_lsa(self, query: str, number_of_results=10) -> list[Speech]:
         """
@@ -51,13 +297,20 @@ class SpeechBackend:
         :param number_of_results: number of results to fetch
         :return: list of
         """
-        processed_query = process_raw_speech_text(query, perform_stemming=True, delete_stopwords=True)
-        # Check if query only has stopwords
-        if len(processed_query) == 0:
-            processed_query = process_raw_speech_text(query, perform_stemming=True, delete_stopwords=False)
-        document_ids = self.lsa_manager.search(processed_query, k=number_of_results)
-        speeches = self.speeches_file.get_speeches(document_ids, preserve_order=True)
-        return speeches
+        processed_query = process_query_text(query)
+        key = ("lsa", tuple(processed_query), number_of_results)
+        self.query_cache.check_version(self.index.version)
+        cached = self.query_cache.get(key)
+        if cached is not None:
+            document_ids, speeches = cached
+        else:
+            document_ids = self.lsa_manager.search(processed_query, k=number_of_results)
+            speeches = None
+        if speeches is None:
+            speeches = self.speeches_file.get_speeches(document_ids, preserve_order=True)
+        if cached is None:
+            self.query_cache.put(key, (document_ids, speeches if self.cache_speeches else None))
+        return list(speeches)
 
     def get_speech(self, speech_id: int) -> Speech:
         """
@@ -68,9 +321,9 @@ class SpeechBackend:
 
     def get_available_attributes(self) -> set[str]:
         """
-        Get all the attributes the speeches have been grouped by.
+        Get the attributes the speeches have been grouped by that keywords can be extracted for. See get_keywords.
         """
-        return self.group_manager.get_group_attributes()
+        return self.group_manager.get_group_attributes() - HIGHLIGHT_EXCLUDED_ATTRIBUTES
 
     def get_attribute_values(self, attribute: str) -> set[str]:
         """
@@ -150,5 +403,11 @@ class SpeechBackend:
         """
         return self.speeches_file.date_range
 
+    def get_cache_statistics(self) -> dict[str, int]:
+        """
+        Get the number of hits, misses, evictions, expirations and invalidations of the search results cache.
+        """
+        return self.query_cache.get_statistics()
+
     def get_total_speeches(self) -> int:
         return self.speeches_file.total_speeches
@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Default number of results kept in the cache
+DEFAULT_CACHE_SIZE = 1024
+# Default number of seconds a cached result stays valid
+DEFAULT_TIME_TO_LIVE = 300.0
+
+
+class QueryCache:
+    """
+    A bounded cache of search results. When full, the least recently used result is evicted. Results also expire a
+    fixed time after they are stored. Results belong to a version of the index, and they are all discarded when the
+    version changes.
+    """
+
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE, time_to_live=DEFAULT_TIME_TO_LIVE, clock=time.monotonic):
+        """
+        :param max_entries: maximum number of cached results. With 0 nothing is cached.
+        :param time_to_live: seconds after which a cached result expires
+        :param clock: function returning the current time in seconds
+        """
+        self.max_entries = max_entries
+        self.time_to_live = time_to_live
+        self.clock = clock
+        # Maps each key to the time it expires and its value, from the least to the most recently used
+        self.entries = OrderedDict()
+        # Version of the index the cached results belong to
+        self.version = None
+        # Searches may run in parallel threads of the web app
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Results removed to make room for new ones
+        self.evictions = 0
+        # Results found expired
+        self.expirations = 0
+        # Number of times the whole cache has been discarded because the index changed
+        self.invalidations = 0
+
+    def check_version(self, version) -> None:
+        """
+        Discard every cached result if the index is not at the same version as when they were stored.
+        """
+        with self.lock:
+            if version != self.version:
+                if self.entries:
+                    self.invalidations += 1
+                self.entries.clear()
+                self.version = version
+
+    def get(self, key):
+        """
+        Get the cached value of a key.
+        :return: the value, or None if it is not cached or has expired
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= self.clock():
+                del self.entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value) -> None:
+        with self.lock:
+            if self.max_entries <= 0:
+                return
+            self.entries[key] = (self.clock() + self.time_to_live, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def get_statistics(self) -> dict[str, int]:
+        """
+        Get the counters of the cache, along with the number of cached results.
+        """
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "expirations": self.expirations,
+                    "invalidations": self.invalidations}
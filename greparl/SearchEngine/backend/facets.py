@@ -0,0 +1,77 @@
+import numpy as np
+
+from .filters import ATTRIBUTE_GROUPS
+from .top.group_manager import GroupManager
+
+# Facets that search results can be counted by. Besides the grouped attributes, speeches can be counted by year.
+YEAR_FACET = "year"
+DEFAULT_FACETS = ("political_party", YEAR_FACET, "member_name")
+
+
+class FacetManager:
+    """
+    Counts how the speeches matching a search split by the values of an attribute, without reading the speeches file.
+    For every facet, the index of the value of each speech is precomputed from the group files, so counting the
+    matches is a single pass over their ids.
+    """
+
+    def __init__(self, group_manager: GroupManager, sitting_dates: np.ndarray):
+        """
+        :param sitting_dates: sitting date of every speech, see FilterManager
+        """
+        self.group_manager = group_manager
+        self.sitting_dates = sitting_dates
+        # The values of every facet that has been counted, along with the index of the value of each speech
+        self.facets = {}
+
+    def __get_facet(self, facet: str) -> tuple[list[str], np.ndarray]:
+        """
+        Get the values of a facet and the index of the value of each speech. Speeches without a value get the index
+        following the last value.
+        :raises ValueError if the facet is not "year" or an attribute the speeches have been grouped by
+        """
+        if facet in self.facets:
+            return self.facets[facet]
+        if facet != YEAR_FACET and (facet not in ATTRIBUTE_GROUPS or
+                                    ATTRIBUTE_GROUPS[facet] not in self.group_manager.get_group_attributes()):
+            raise ValueError("Speeches cannot be counted by {}, since they have not been grouped by it."
+                             .format(facet))
+        if facet == YEAR_FACET:
+            years = self.sitting_dates.astype("datetime64[Y]").astype(np.int64) + 1970
+            first_year = int(years.min()) if len(years) else 0
+            last_year = int(years.max()) if len(years) else -1
+            values = [str(year) for year in range(first_year, last_year + 1)]
+            value_of_document = years - first_year
+        else:
+            groups = self.group_manager.get_attribute(ATTRIBUTE_GROUPS[facet])
+            values = list(groups.keys())
+            total_documents = max([len(self.sitting_dates)] + [ids[-1] + 1 for ids in groups.values() if ids])
+            value_of_document = np.full(total_documents, len(values), dtype=np.int64)
+            for value_index, ids in enumerate(groups.values()):
+                value_of_document[ids] = value_index
+        self.facets[facet] = (values, value_of_document)
+        return self.facets[facet]
+
+    def count(self, facet: str, documents: np.ndarray) -> dict[str, int]:
+        """
+        Count the given speeches by the values of a facet.
+        :param facet: "year" or one of the attributes of ATTRIBUTE_GROUPS
+        :param documents: ids of the speeches
+        :return: dictionary with the number of speeches of every value having any, from the most to the least common
+        :raises ValueError if the speeches cannot be counted by the facet
+        """
+        values, value_of_document = self.__get_facet(facet)
+        documents = np.asarray(documents, dtype=np.int64)
+        # Speeches added to the index after the groups were created have no values
+        documents = documents[documents < len(value_of_document)]
+        counts = np.bincount(value_of_document[documents], minlength=len(values) + 1)[:len(values)]
+        order = np.argsort(-counts, kind="stable")
+        return {values[value_index]: int(counts[value_index]) for value_index in order.tolist()
+                if counts[value_index] > 0}
+
+    def get_facet_counts(self, documents: np.ndarray, facets=DEFAULT_FACETS) -> dict[str, dict[str, int]]:
+        """
+        Count the given speeches by the values of each facet. See count.
+        :raises ValueError if the speeches cannot be counted by any of the facets
+        """
+        return {facet: self.count(facet, documents) for facet in facets}
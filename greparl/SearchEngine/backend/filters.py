@@ -0,0 +1,115 @@
+import os
+from dataclasses import dataclass, fields
+from datetime import date
+from typing import Optional
+
+import numpy as np
+
+from .top.group_manager import GroupManager
+
+# File with the sitting date of every speech, created along with the group files. See create_sitting_dates.
+SITTING_DATES_FILE = "dates/sitting_dates.npy"
+
+# The group file holding the speeches of every value of each attribute that can be filtered on
+ATTRIBUTE_GROUPS = {
+    "political_party": "party",
+    "member_name": "speaker_name",
+    "gender": "gender",
+    "member_region": "member_region",
+}
+
+
+@dataclass(frozen=True)
+class SpeechFilter:
+    """
+    Restricts a search to the speeches given between start_date and end_date, both inclusive, that have all the given
+    attribute values. Attributes left to None are not filtered on.
+    """
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    political_party: Optional[str] = None
+    member_name: Optional[str] = None
+    gender: Optional[str] = None
+    member_region: Optional[str] = None
+
+    def is_empty(self) -> bool:
+        return all(getattr(self, speech_field.name) is None for speech_field in fields(self))
+
+
+class FilterManager:
+    """
+    Turns speech filters into the ids of the speeches passing them, without reading the speeches file. Speeches are
+    sorted by date, so a date range is a contiguous range of ids, found by binary search over the sitting date of every
+    speech. The speeches having each attribute value come from the group files.
+    """
+
+    def __init__(self, group_manager: GroupManager, dates_file_name=SITTING_DATES_FILE):
+        """
+        :raises RuntimeError if the dates file has not been created
+        """
+        self.group_manager = group_manager
+        if not os.path.exists(dates_file_name):
+            raise RuntimeError("The sitting dates file {} does not exist. Create it with create_sitting_dates."
+                               .format(dates_file_name))
+        # Sitting date of every speech, in ascending order
+        self.sitting_dates = np.load(dates_file_name, mmap_mode="r")
+        self.total_documents = len(self.sitting_dates)
+        # Sorted ids of the speeches of every attribute value that has been filtered on
+        self.attribute_documents = {}
+
+    def get_filterable_attributes(self) -> set[str]:
+        """
+        Get the attributes of SpeechFilter the speeches can be filtered on, the ones whose speeches have been grouped.
+        """
+        group_attributes = self.group_manager.get_group_attributes()
+        return {attribute for attribute, group in ATTRIBUTE_GROUPS.items() if group in group_attributes}
+
+    def get_date_range(self, start_date: Optional[date], end_date: Optional[date]) -> tuple[int, int]:
+        """
+        Get the range of ids of the speeches given between the two dates, both inclusive.
+        :return: tuple with the first id of the range and the id following its last one
+        """
+        start = 0
+        end = self.total_documents
+        if start_date is not None:
+            start = int(np.searchsorted(self.sitting_dates, np.datetime64(start_date, "D"), side="left"))
+        if end_date is not None:
+            end = int(np.searchsorted(self.sitting_dates, np.datetime64(end_date, "D"), side="right"))
+        return start, max(start, end)
+
+    def get_attribute_documents(self, attribute: str, value: str) -> np.ndarray:
+        """
+        Get the sorted ids of the speeches with the given attribute value.
+        :param attribute: one of the attributes of ATTRIBUTE_GROUPS
+        :raises ValueError if the speeches have not been grouped by the attribute
+        """
+        key = (attribute, value)
+        if key not in self.attribute_documents:
+            if attribute not in self.get_filterable_attributes():
+                raise ValueError("Speeches cannot be filtered by {}, since they have not been grouped by it."
+                                 .format(attribute))
+            groups = self.group_manager.get_attribute(ATTRIBUTE_GROUPS[attribute])
+            self.attribute_documents[key] = np.array(groups.get(value, []), dtype=np.int64)
+        return self.attribute_documents[key]
+
+    def get_documents(self, speech_filter: Optional[SpeechFilter]) -> Optional[np.ndarray]:
+        """
+        Get the sorted ids of the speeches passing the filter.
+        :return: array of speech ids, or None if the filter does not exclude any speech
+        :raises ValueError if the filter has an attribute the speeches cannot be filtered on
+        """
+        if speech_filter is None or speech_filter.is_empty():
+            return None
+        start, end = self.get_date_range(speech_filter.start_date, speech_filter.end_date)
+        # One bit for every speech of the date range, cleared for the speeches lacking any of the attribute values
+        passing = np.ones(end - start, dtype=bool)
+        for attribute in ATTRIBUTE_GROUPS:
+            value = getattr(speech_filter, attribute)
+            if value is None:
+                continue
+            documents = self.get_attribute_documents(attribute, value)
+            documents = documents[np.searchsorted(documents, start):np.searchsorted(documents, end)]
+            has_value = np.zeros(end - start, dtype=bool)
+            has_value[documents - start] = True
+            passing &= has_value
+        return np.flatnonzero(passing) + start
@@ -0,0 +1,93 @@
+import numpy as np
+
+from .bm25 import BM25
+from .boolean import BooleanQuery, expand_wildcards, search_boolean_query
+from .inverted_index import search_index
+from .lexicon import MAX_EXPANSIONS
+from .postings import get_block_table, select_blocks, select_postings
+
+
+class PostingCache:
+    """
+    Wraps an index so that the posting list of every term is read and decoded only once, for evaluating many queries
+    sharing the same terms. Provides the same methods as InvertedIndex, so it can be searched the same way. The lists
+    stay in memory as long as the cache exists.
+    """
+
+    def __init__(self, index):
+        """
+        :param index: InvertedIndex, SegmentedIndex or any object providing the same methods
+        """
+        self.index = index
+        self.total_documents = index.total_documents
+        self.lengths = index.lengths
+        self.documents = index.documents
+        self.average_document_length = index.average_document_length
+        self.positional = index.positional
+        # The full posting lists are cached, so the first tier is not used
+        self.tier_size = None
+        # The postings of every term read so far
+        self.postings = {}
+
+    def load(self, terms) -> None:
+        """
+        Reads the posting lists of the given terms. Each distinct term is read once, in sorted order, which is also the
+        order of the lists in the index file.
+        """
+        for term in sorted(set(terms) - self.postings.keys()):
+            self.postings[term] = self.index.get_postings(term)
+
+    def get_document_frequency(self, term: str) -> int:
+        return self.index.get_document_frequency(term)
+
+    def get_max_weight(self, term: str) -> float:
+        return self.index.get_max_weight(term)
+
+    def expand_pattern(self, pattern: str, max_terms=MAX_EXPANSIONS) -> list[str]:
+        return self.index.expand_pattern(pattern, max_terms)
+
+    def get_postings(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        if term not in self.postings:
+            self.postings[term] = self.index.get_postings(term)
+        return self.postings[term]
+
+    def get_blocks(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        return get_block_table(*self.get_postings(term))
+
+    def get_block_postings(self, term: str, blocks: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        return select_blocks(*self.get_postings(term), np.asarray(blocks, dtype=np.int64))
+
+    def intersect_postings(self, term: str, document_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Gets the postings of the term in the given documents only, from its cached posting list.
+        """
+        document_ids = np.asarray(document_ids, dtype=np.int64)
+        all_document_ids, term_frequencies = self.get_postings(term)
+        if len(document_ids) == 0 or len(all_document_ids) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return select_postings(all_document_ids, term_frequencies, document_ids)
+
+    def get_positions(self, term: str, document_ids=None) -> tuple[np.ndarray, np.ndarray]:
+        # Positions are only read for the few documents matching phrases, so they are not cached
+        return self.index.get_positions(term, document_ids)
+
+    def search(self, query_tokens, number_of_results=10, dynamic_pruning=False, phrases=None,
+               documents=None, bm25: BM25 = None) -> list[int]:
+        return search_index(self, query_tokens, number_of_results, dynamic_pruning, phrases, documents, bm25)
+
+
+def search_many(index, queries: list[BooleanQuery], number_of_results=10, documents=None, bm25: BM25 = None) \
+        -> list[list[int]]:
+    """
+    Ranks the documents matching each of many boolean queries. The distinct terms of all the queries are collected
+    first and the posting list of each one is read once for the whole batch. Rankings are the same as the ones of
+    search_boolean_query.
+    :param index: InvertedIndex, SegmentedIndex or any object providing the same methods
+    :param documents: sorted ids of the only documents that may match any of the queries
+    :param bm25: rank with BM25 using the given parameters instead of tf-idf
+    :return: list with the document ids of the matching documents of each query best-to-worst
+    """
+    cache = PostingCache(index)
+    queries = [expand_wildcards(cache, query) for query in queries]
+    cache.load(term for query in queries for term in query.get_terms())
+    return [search_boolean_query(cache, query, number_of_results, documents, bm25) for query in queries]
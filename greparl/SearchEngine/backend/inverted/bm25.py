@@ -0,0 +1,33 @@
+from dataclasses import dataclass
+from math import log
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class BM25:
+    """
+    Parameters of the Okapi BM25 ranking. k1 controls how quickly additional appearances of a term stop increasing the
+    score of a document, and b how strongly long documents are penalized, from 0 (not at all) to 1 (proportionally to
+    their length).
+    """
+    k1: float = 1.2
+    b: float = 0.75
+
+    @staticmethod
+    def calculate_idf(total_documents, documents_containing_term) -> float:
+        # Variant of the idf that is never negative, even for terms appearing in more than half the documents
+        return log(1 + (total_documents - documents_containing_term + 0.5) / (documents_containing_term + 0.5))
+
+    def calculate_weights(self, term_frequencies: np.ndarray, document_tokens: np.ndarray,
+                          average_document_length: float) -> np.ndarray:
+        """
+        Calculates the saturated term frequency of a term in some documents, to be multiplied by its idf.
+        :param term_frequencies: number of appearances of the term in each document
+        :param document_tokens: number of tokens of each document
+        :param average_document_length: average number of tokens of the documents of the index
+        """
+        term_frequencies = np.asarray(term_frequencies, dtype=np.float64)
+        relative_lengths = np.asarray(document_tokens, dtype=np.float64) / max(average_document_length, 1.0)
+        saturation = self.k1 * (1 - self.b + self.b * relative_lengths)
+        return term_frequencies * (self.k1 + 1) / (term_frequencies + saturation)
@@ -0,0 +1,257 @@
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Union
+
+import numpy as np
+
+from .bm25 import BM25
+from .fuzzy import MAX_CORRECTIONS
+from .lexicon import MAX_EXPANSIONS
+from .phrase import Phrase, match_phrase
+
+# Lists of documents are merged with a bitmap when their total length is at least the number of documents divided by
+# this ratio
+UNION_BITMAP_RATIO = 16
+
+
+class Occur(Enum):
+    """
+    How a clause of a boolean query affects the matching documents.
+    """
+    # The documents must match the clause
+    MUST = "+"
+    # If the query has no required clauses, the documents must match at least one of these
+    SHOULD = ""
+    # The documents must not match the clause
+    MUST_NOT = "-"
+
+
+@dataclass
+class Wildcard:
+    """
+    A pattern matching the terms of the index, where * stands for any number of characters and ? for a single one.
+    Matches the documents containing any of the terms it expands to.
+    """
+    pattern: str
+
+
+@dataclass
+class BooleanClause:
+    occur: Occur
+    # A processed term, a phrase, a term pattern or a nested query
+    query: Union[str, Phrase, Wildcard, "BooleanQuery"]
+
+
+@dataclass
+class BooleanQuery:
+    """
+    A query made of clauses. Documents match if they match every MUST clause, none of the MUST_NOT clauses and, when
+    there are no MUST clauses, at least one SHOULD clause. A query without MUST or SHOULD clauses matches nothing.
+    """
+    clauses: list[BooleanClause] = field(default_factory=list)
+
+    def is_disjunction(self) -> bool:
+        """
+        Check whether the query is a plain list of optional terms, which matches every document containing any of them.
+        """
+        return all(clause.occur == Occur.SHOULD and isinstance(clause.query, str) for clause in self.clauses)
+
+    def get_scoring_terms(self) -> list[str]:
+        """
+        Get the terms used to rank the matching documents, which are all the terms not inside a MUST_NOT clause, in
+        query order. Term patterns are not included, unless they are expanded first. See expand_wildcards.
+        """
+        terms = []
+        for clause in self.clauses:
+            if clause.occur == Occur.MUST_NOT:
+                continue
+            if isinstance(clause.query, str):
+                terms.append(clause.query)
+            elif isinstance(clause.query, Phrase):
+                terms.extend(clause.query.terms)
+            elif isinstance(clause.query, BooleanQuery):
+                terms.extend(clause.query.get_scoring_terms())
+        return terms
+
+    def get_scoring_patterns(self) -> list[str]:
+        """
+        Get the term patterns not inside a MUST_NOT clause, in query order.
+        """
+        patterns = []
+        for clause in self.clauses:
+            if clause.occur == Occur.MUST_NOT:
+                continue
+            if isinstance(clause.query, Wildcard):
+                patterns.append(clause.query.pattern)
+            elif isinstance(clause.query, BooleanQuery):
+                patterns.extend(clause.query.get_scoring_patterns())
+        return patterns
+
+    def get_terms(self) -> list[str]:
+        """
+        Get every term of the query, including the excluded ones, in query order. Term patterns are not included.
+        """
+        terms = []
+        for clause in self.clauses:
+            if isinstance(clause.query, str):
+                terms.append(clause.query)
+            elif isinstance(clause.query, Phrase):
+                terms.extend(clause.query.terms)
+            elif isinstance(clause.query, BooleanQuery):
+                terms.extend(clause.query.get_terms())
+        return terms
+
+    def has_phrases(self) -> bool:
+        """
+        Check whether the query has a phrase of more than one term, which needs the positions of the terms to match.
+        """
+        for clause in self.clauses:
+            if isinstance(clause.query, Phrase) and len(clause.query.terms) > 1:
+                return True
+            if isinstance(clause.query, BooleanQuery) and clause.query.has_phrases():
+                return True
+        return False
+
+
+def expand_wildcards(index, query: BooleanQuery, max_terms=MAX_EXPANSIONS) -> BooleanQuery:
+    """
+    Replaces the term patterns of a query with the terms of the index they expand to, so that every expanded term is
+    also scored. An optional pattern becomes optional terms of its query, while a required or excluded one becomes a
+    group of optional terms.
+    :param max_terms: maximum number of terms each pattern is expanded to
+    """
+    clauses = []
+    for clause in query.clauses:
+        if isinstance(clause.query, Wildcard):
+            terms = index.expand_pattern(clause.query.pattern, max_terms)
+            if clause.occur == Occur.SHOULD:
+                clauses.extend(BooleanClause(Occur.SHOULD, term) for term in terms)
+            elif terms or clause.occur == Occur.MUST:
+                # A required pattern without any terms is an empty group, which matches nothing
+                clauses.append(BooleanClause(clause.occur, BooleanQuery([BooleanClause(Occur.SHOULD, term)
+                                                                         for term in terms])))
+        elif isinstance(clause.query, BooleanQuery):
+            clauses.append(BooleanClause(clause.occur, expand_wildcards(index, clause.query, max_terms)))
+        else:
+            clauses.append(clause)
+    return BooleanQuery(clauses)
+
+
+def expand_misspellings(index, query: BooleanQuery, max_terms=MAX_CORRECTIONS) -> BooleanQuery:
+    """
+    Replaces the terms of a query that are not in the index with the closest terms that are, most frequent first, like
+    the patterns of expand_wildcards. Excluded terms and the terms of phrases are kept as they are.
+    :param max_terms: maximum number of terms each misspelled term is replaced with
+    """
+    clauses = []
+    for clause in query.clauses:
+        if isinstance(clause.query, str) and clause.occur != Occur.MUST_NOT and \
+                index.get_document_frequency(clause.query) == 0:
+            similar_terms = index.get_similar_terms(clause.query)
+            # Only the closest terms are kept, since one edit less is usually the intended term
+            terms = [term for term, distance in similar_terms if distance == similar_terms[0][1]][:max_terms]
+            if not terms:
+                clauses.append(clause)
+            elif clause.occur == Occur.SHOULD:
+                clauses.extend(BooleanClause(Occur.SHOULD, term) for term in terms)
+            else:
+                clauses.append(BooleanClause(clause.occur, BooleanQuery([BooleanClause(Occur.SHOULD, term)
+                                                                         for term in terms])))
+        elif isinstance(clause.query, BooleanQuery):
+            clauses.append(BooleanClause(clause.occur, expand_misspellings(index, clause.query, max_terms)))
+        else:
+            clauses.append(clause)
+    return BooleanQuery(clauses)
+
+
+def _estimate_cost(index, query) -> int:
+    """
+    Estimate the number of documents matching a clause, so that the clauses narrowing the candidates the most are
+    evaluated first.
+    """
+    if isinstance(query, str):
+        return index.get_document_frequency(query)
+    if isinstance(query, Phrase):
+        return min((index.get_document_frequency(term) for term in query.terms), default=0)
+    # Nested queries and patterns are evaluated last
+    return index.total_documents
+
+
+def _evaluate_clause(index, query, candidates=None) -> np.ndarray:
+    """
+    Find the documents matching a clause.
+    :param candidates: sorted ids of the only documents to consider, if given
+    """
+    if isinstance(query, str):
+        if candidates is None:
+            return index.get_postings(query)[0]
+        return index.intersect_postings(query, candidates)[0]
+    if isinstance(query, Phrase):
+        return match_phrase(index, query, candidates)
+    if isinstance(query, Wildcard):
+        terms = index.expand_pattern(query.pattern)
+        return union_documents([_evaluate_clause(index, term, candidates) for term in terms], index.total_documents)
+    return evaluate_query(index, query, candidates)
+
+
+def union_documents(document_lists: list[np.ndarray], total_documents: int) -> np.ndarray:
+    """
+    Merges sorted lists of document ids. When the lists are long compared to the number of documents, the documents
+    are marked in a bitmap instead of sorting all of them.
+    :return: the sorted ids of the documents in any of the lists
+    """
+    total_length = sum(len(documents) for documents in document_lists)
+    if len(document_lists) > 1 and total_length * UNION_BITMAP_RATIO >= total_documents:
+        bitmap = np.zeros(total_documents, dtype=bool)
+        for documents in document_lists:
+            bitmap[documents] = True
+        return np.flatnonzero(bitmap)
+    return np.unique(np.concatenate([np.zeros(0, dtype=np.int64)] + document_lists))
+
+
+def evaluate_query(index, query: BooleanQuery, candidates=None) -> np.ndarray:
+    """
+    Find the documents matching a boolean query. Required clauses are evaluated from the rarest to the most common,
+    and every following clause is only checked against the documents matching the previous ones, skipping the blocks
+    of the posting lists that cannot contain any of them. Excluded clauses are also only checked against the
+    remaining documents.
+    :param index: InvertedIndex or any object providing the same methods
+    :param candidates: sorted ids of the only documents to consider, if given
+    :return: sorted ids of the matching documents
+    """
+    required = [clause.query for clause in query.clauses if clause.occur == Occur.MUST]
+    optional = [clause.query for clause in query.clauses if clause.occur == Occur.SHOULD]
+    excluded = [clause.query for clause in query.clauses if clause.occur == Occur.MUST_NOT]
+    documents = candidates
+    if required:
+        for clause in sorted(required, key=lambda required_query: _estimate_cost(index, required_query)):
+            documents = _evaluate_clause(index, clause, documents)
+            if len(documents) == 0:
+                return documents
+    elif optional:
+        matches = [_evaluate_clause(index, clause, candidates) for clause in optional]
+        documents = union_documents(matches, index.total_documents)
+    else:
+        return np.zeros(0, dtype=np.int64)
+    for clause in excluded:
+        if len(documents) == 0:
+            break
+        documents = np.setdiff1d(documents, _evaluate_clause(index, clause, documents), assume_unique=True)
+    return documents
+
+
+def search_boolean_query(index, query: BooleanQuery, number_of_results=10, documents=None, bm25: BM25 = None) \
+        -> list[int]:
+    """
+    Ranks the documents matching a boolean query with the tf-idf scoring of the index, or with BM25.
+    :param documents: sorted ids of the only documents that may match, such as the documents passing some filters.
+                      The rest are never scored.
+    :param bm25: rank with BM25 using the given parameters instead of tf-idf
+    :return: List with the document ids of the matching documents best-to-worst.
+    """
+    query = expand_wildcards(index, query)
+    terms = query.get_scoring_terms()
+    # Every document containing one of the terms matches, so there is nothing to filter
+    if documents is None and query.is_disjunction():
+        return index.search(terms, number_of_results, bm25=bm25)
+    return index.search(terms, number_of_results, documents=evaluate_query(index, query, documents), bm25=bm25)
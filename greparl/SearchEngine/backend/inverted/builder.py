@@ -0,0 +1,335 @@
+import heapq
+import os
+import re
+import struct
+import tempfile
+from array import array
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+from math import sqrt
+
+import numpy as np
+
+from .inverted_index import InvertedIndex, DOCUMENT_DTYPE, POSTINGS_PER_CHUNK
+from .positions import POSITIONS_HEADER, BLOCK_OFFSET_DTYPE, encode_position_list, decode_position_list
+from .postings import ENTRY_HEADER, encode_posting_list, decode_posting_list, entry_length
+
+# Same tokens as the ones extracted by a CountVectorizer with the default settings
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+# Default amount of memory the in-memory postings may use before they are flushed to a run
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+# Rough memory cost of a posting and of a new term in the in-memory dictionary, used to track the memory budget
+BYTES_PER_POSTING = 8
+BYTES_PER_TERM = 250
+BYTES_PER_POSITION = 4
+# Length of the term preceding each posting list in a run file
+RUN_TERM_LENGTH = struct.Struct("<H")
+
+
+def tokenize(processed_speech: str) -> list[str]:
+    """
+    Split a line of the processed speeches file into the tokens that are inserted into the index.
+    """
+    return TOKEN_PATTERN.findall(processed_speech)
+
+
+def _read_run(run_file_name: str, document_offset=0, positions=False):
+    """
+    Generator iterating over the posting lists of a run file, in the order they were written.
+    :param document_offset: Number added to every document id of the run
+    :param positions: Whether the run contains the positions of the postings, after each posting list
+    :return: tuples of (encoded term, document ids, term frequencies), followed by the positions if the run has them
+    """
+    with open(run_file_name, "rb") as run_file:
+        while term_length_bytes := run_file.read(RUN_TERM_LENGTH.size):
+            term = run_file.read(RUN_TERM_LENGTH.unpack(term_length_bytes)[0])
+            header = run_file.read(ENTRY_HEADER.size)
+            entry = header + run_file.read(entry_length(header) - ENTRY_HEADER.size)
+            document_ids, term_frequencies = decode_posting_list(entry)
+            if not positions:
+                yield term, document_ids + document_offset, term_frequencies
+                continue
+            header = run_file.read(POSITIONS_HEADER.size)
+            _, block_count = POSITIONS_HEADER.unpack(header)
+            table = run_file.read((block_count + 1) * BLOCK_OFFSET_DTYPE.itemsize)
+            # The last entry of the block table is the length of the positions stream
+            stream = run_file.read(int(np.frombuffer(table, dtype=BLOCK_OFFSET_DTYPE)[-1]))
+            yield term, document_ids + document_offset, term_frequencies, \
+                decode_position_list(header + table + stream, term_frequencies)
+
+
+def _create_chunk(terms, ends, columns):
+    """
+    Create a chunk from the concatenated postings of the given terms.
+    :param ends: Number of postings in the chunk after each term
+    :param columns: lists with the arrays of document ids, term frequencies and, optionally, positions of each term
+    """
+    indptr = np.array([0] + ends, dtype=np.int64)
+    return (terms, indptr, *[np.concatenate(column).astype(np.int64) for column in columns])
+
+
+def merge_posting_chunks(runs: list):
+    """
+    Generator merging runs with a k-way merge. The runs must contain consecutive ranges of documents and be given in
+    document order, so the postings of a term are the concatenation of its postings in each run, in run order. Yields
+    chunks of roughly POSTINGS_PER_CHUNK postings, as expected by InvertedIndex.populate_from_postings.
+    :param runs: iterables over (encoded term, document ids, term frequencies), sorted by term. Positions may follow
+                 the term frequencies, and are then concatenated the same way.
+    """
+    # heapq.merge is stable, so equal terms are produced in run order
+    merged = heapq.merge(*runs, key=lambda posting_list: posting_list[0])
+    terms = []
+    # Number of postings in the chunk after each term
+    ends = []
+    total_postings = 0
+    # Arrays of the document ids, the term frequencies and the positions, if any, of the chunk
+    columns = None
+    for encoded_term, posting_lists in groupby(merged, key=lambda posting_list: posting_list[0]):
+        for _, *run_columns in posting_lists:
+            if columns is None:
+                columns = [[] for _ in run_columns]
+            for column, run_column in zip(columns, run_columns):
+                column.append(run_column)
+            total_postings += len(run_columns[0])
+        terms.append(encoded_term.decode("utf8"))
+        ends.append(total_postings)
+        if total_postings >= POSTINGS_PER_CHUNK:
+            yield _create_chunk(terms, ends, columns)
+            terms, ends, total_postings, columns = [], [], 0, None
+    if terms:
+        yield _create_chunk(terms, ends, columns)
+
+
+class SpimiIndexBuilder:
+    """
+    Builds an inverted index with single-pass in-memory indexing (SPIMI). Documents are added one at a time and their
+    postings are gathered in memory. Every time the postings exceed the memory budget, they are sorted by term and
+    written to a temporary run file. When all documents have been added, the runs are merged into the final index.
+    Only the per-document statistics grow with the corpus, so peak memory stays roughly flat.
+    """
+
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET, temporary_directory=None, run_directory=None,
+                 run_prefix="run", positions=False):
+        """
+        :param memory_budget: Approximate number of bytes the in-memory postings may use
+        :param temporary_directory: Directory in which the temporary directory of the runs is created. By default, the
+                                    system temporary directory.
+        :param run_directory: Existing directory in which the runs are stored instead. The runs are then not deleted,
+                              which lets another process merge them.
+        :param run_prefix: Prefix of the names of the run files
+        :param positions: Keep the positions of the terms in each document, for indexes storing positions
+        """
+        self.memory_budget = memory_budget
+        self.positions = positions
+        if run_directory is None:
+            self.temporary_directory = tempfile.TemporaryDirectory(dir=temporary_directory)
+            self.run_directory = self.temporary_directory.name
+        else:
+            self.temporary_directory = None
+            self.run_directory = run_directory
+        self.run_prefix = run_prefix
+        self.run_file_names = []
+        # Map each term to two arrays with the document ids and the term frequencies of its postings, and a third one
+        # with the positions of the term in each document if positions are kept
+        self.postings = dict()
+        self.used_memory = 0
+        # Statistics of every document added so far
+        self.lengths = array("d")
+        self.tokens = array("I")
+        self.unique_terms = array("I")
+        self.total_documents = 0
+
+    def add_document(self, tokens: list[str]) -> int:
+        """
+        Adds a document to the index. Documents get consecutive ids, starting at 0.
+        :param tokens: The tokens of the document
+        :return: The id of the document
+        """
+        document_id = self.total_documents
+        if self.positions:
+            term_positions = defaultdict(list)
+            for position, token in enumerate(tokens):
+                term_positions[token].append(position)
+            counts = {term: len(positions) for term, positions in term_positions.items()}
+            self.used_memory += len(tokens) * BYTES_PER_POSITION
+        else:
+            counts = Counter(tokens)
+        for term, term_frequency in counts.items():
+            if term not in self.postings:
+                self.postings[term] = (array("I"), array("I"), array("I")) if self.positions else \
+                    (array("I"), array("I"))
+                self.used_memory += BYTES_PER_TERM
+            document_ids, term_frequencies, *positions = self.postings[term]
+            document_ids.append(document_id)
+            term_frequencies.append(term_frequency)
+            if positions:
+                positions[0].extend(term_positions[term])
+        self.used_memory += len(counts) * BYTES_PER_POSTING
+        self.lengths.append(sqrt(sum(count * count for count in counts.values())))
+        self.tokens.append(len(tokens))
+        self.unique_terms.append(len(counts))
+        self.total_documents += 1
+        if self.used_memory >= self.memory_budget:
+            self.__flush_run()
+        return document_id
+
+    def __flush_run(self) -> None:
+        """
+        Writes the in-memory postings, sorted by term, to a new run file and empties them.
+        """
+        run_file_name = os.path.join(self.run_directory, "{}-{}".format(self.run_prefix, len(self.run_file_names)))
+        with open(run_file_name, "wb") as run_file:
+            for encoded_term, document_ids, term_frequencies, *positions in self.__memory_run():
+                run_file.write(RUN_TERM_LENGTH.pack(len(encoded_term)))
+                run_file.write(encoded_term)
+                run_file.write(encode_posting_list(document_ids, term_frequencies))
+                if positions:
+                    run_file.write(encode_position_list(term_frequencies, positions[0]))
+        self.run_file_names.append(run_file_name)
+        self.postings = dict()
+        self.used_memory = 0
+
+    def __sorted_postings(self):
+        """
+        Generator iterating over the in-memory postings, sorted by the UTF-8 encoding of their terms.
+        """
+        encoded_terms = sorted((term.encode("utf8"), term) for term in self.postings)
+        for encoded_term, term in encoded_terms:
+            yield term, encoded_term, self.postings[term]
+
+    def __memory_run(self):
+        """
+        Generator iterating over the in-memory postings in the same format as _read_run.
+        """
+        for _, encoded_term, columns in self.__sorted_postings():
+            yield (encoded_term, *[np.frombuffer(column, dtype=np.uint32) for column in columns])
+
+    def get_documents(self) -> np.ndarray:
+        """
+        Get the statistics of every document added so far, in the format stored by InvertedIndex.
+        """
+        documents = np.zeros(self.total_documents, dtype=DOCUMENT_DTYPE)
+        documents["length"] = np.frombuffer(self.lengths, dtype=np.float64)
+        documents["tokens"] = np.frombuffer(self.tokens, dtype=np.uint32)
+        documents["unique_terms"] = np.frombuffer(self.unique_terms, dtype=np.uint32)
+        return documents
+
+    def write_runs(self) -> list[str]:
+        """
+        Writes the postings still in memory to a run, so that every posting added so far is stored in a run file.
+        :return: the names of all the run files, in document order
+        """
+        if self.postings:
+            self.__flush_run()
+        return self.run_file_names
+
+    def build(self, index: InvertedIndex) -> None:
+        """
+        Merges everything added so far into the given index, replacing its contents, and deletes the runs.
+        :param index: A new index
+        """
+        runs = [_read_run(run_file_name, positions=self.positions) for run_file_name in self.run_file_names] + \
+            [self.__memory_run()]
+        index.populate_from_postings(self.get_documents(), merge_posting_chunks(runs))
+        if self.temporary_directory is not None:
+            self.temporary_directory.cleanup()
+
+
+def build_index_from_file(processed_speeches_file_name: str, index: InvertedIndex, speech_number=-1,
+                          memory_budget=DEFAULT_MEMORY_BUDGET) -> None:
+    """
+    Streams the processed speeches file into a SpimiIndexBuilder and builds the given index. Line i+1 of the file
+    becomes the document with id i.
+    :param processed_speeches_file_name: File containing the speeches' contents with any preprocessing applied
+    :param index: A new index
+    :param speech_number: Number of speeches to include in the index, if -1 include all speeches
+    :param memory_budget: Approximate number of bytes the in-memory postings may use
+    """
+    builder = SpimiIndexBuilder(memory_budget=memory_budget, temporary_directory=os.path.dirname(
+        index.lexicon_file_name), positions=index.positional)
+    with open(processed_speeches_file_name, "r", encoding="utf8") as processed_speeches:
+        # Ignore the first line
+        processed_speeches.readline()
+        while (speech_number == -1 or builder.total_documents < speech_number) and \
+                (line := processed_speeches.readline()):
+            builder.add_document(tokenize(line))
+    builder.build(index)
+
+
+def _find_shard_boundaries(processed_speeches_file_name: str, shards: int, speech_number=-1) -> list[int]:
+    """
+    Split the speeches of the processed speeches file into shards of roughly equal size in bytes. Boundaries are always
+    placed at the start of a line.
+    :param shards: Maximum number of shards
+    :param speech_number: Number of speeches to include, if -1 include all speeches
+    :return: the byte offsets in the file where the shards start, followed by the offset where the last one ends
+    """
+    with open(processed_speeches_file_name, "rb") as processed_speeches:
+        # Ignore the first line
+        processed_speeches.readline()
+        start = processed_speeches.tell()
+        if speech_number == -1:
+            end = os.fstat(processed_speeches.fileno()).st_size
+        else:
+            for _ in range(speech_number):
+                if not processed_speeches.readline():
+                    break
+            end = processed_speeches.tell()
+        boundaries = [start]
+        for shard in range(1, shards):
+            # Move to the start of the first line after the approximate boundary
+            processed_speeches.seek(start + (end - start) * shard // shards - 1)
+            processed_speeches.readline()
+            boundary = processed_speeches.tell()
+            if boundaries[-1] < boundary < end:
+                boundaries.append(boundary)
+    boundaries.append(end)
+    return boundaries
+
+
+def _build_shard(processed_speeches_file_name: str, start: int, end: int, memory_budget: int, run_directory: str,
+                 run_prefix: str, positions: bool) -> tuple[list[str], np.ndarray]:
+    """
+    Index the speeches found between two byte offsets of the processed speeches file into run files. Runs in a worker
+    process. Document ids start at 0 in every shard.
+    :return: the names of the run files and the statistics of the shard's documents
+    """
+    builder = SpimiIndexBuilder(memory_budget=memory_budget, run_directory=run_directory, run_prefix=run_prefix,
+                                positions=positions)
+    with open(processed_speeches_file_name, "rb") as processed_speeches:
+        processed_speeches.seek(start)
+        while processed_speeches.tell() < end and (line := processed_speeches.readline()):
+            builder.add_document(tokenize(line.decode("utf8")))
+    return builder.write_runs(), builder.get_documents()
+
+
+def build_index_in_parallel(processed_speeches_file_name: str, index: InvertedIndex, speech_number=-1,
+                            memory_budget=DEFAULT_MEMORY_BUDGET, workers=4) -> None:
+    """
+    Builds the given index from the processed speeches file using several processes. The file is split into shards of
+    consecutive speeches, each worker indexes one shard into its own runs, and the runs are then merged, with the
+    document ids of each shard offset by the number of documents before it. The result is identical to the one of
+    build_index_from_file.
+    :param processed_speeches_file_name: File containing the speeches' contents with any preprocessing applied
+    :param index: A new index
+    :param speech_number: Number of speeches to include in the index, if -1 include all speeches
+    :param memory_budget: Approximate number of bytes the in-memory postings of all workers may use
+    :param workers: Number of worker processes
+    """
+    boundaries = _find_shard_boundaries(processed_speeches_file_name, workers, speech_number)
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(index.lexicon_file_name)) as run_directory:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_build_shard, processed_speeches_file_name, start, end,
+                                       memory_budget // workers, run_directory, "shard-{}".format(shard),
+                                       index.positional)
+                       for shard, (start, end) in enumerate(zip(boundaries, boundaries[1:]))]
+            shards = [future.result() for future in futures]
+        runs = []
+        document_offset = 0
+        for run_file_names, documents in shards:
+            runs.extend(_read_run(run_file_name, document_offset, index.positional) for run_file_name in run_file_names)
+            document_offset += len(documents)
+        documents = np.concatenate([documents for _, documents in shards]) if shards else \
+            np.zeros(0, dtype=DOCUMENT_DTYPE)
+        index.populate_from_postings(documents, merge_posting_chunks(runs))
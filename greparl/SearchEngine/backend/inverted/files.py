@@ -0,0 +1,22 @@
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(file_name: str, mode="wb", encoding=None):
+    """
+    Context manager opening a file for writing, which replaces the file with the given name only once it is written
+    completely. The data is written into a new file that then replaces the old one, since the old one could still be
+    open or memory-mapped by this or another process, and readers must never see a partially written file. If writing
+    fails, the old file is left untouched.
+    :param mode: "wb" for binary files or "w" for text files
+    """
+    new_file_name = "{}.new".format(file_name)
+    try:
+        with open(new_file_name, mode, encoding=encoding) as file:
+            yield file
+    except BaseException:
+        if os.path.exists(new_file_name):
+            os.remove(new_file_name)
+        raise
+    os.replace(new_file_name, file_name)
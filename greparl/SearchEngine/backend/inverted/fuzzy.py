@@ -0,0 +1,242 @@
+import mmap
+import struct
+from typing import Iterable, Sequence
+
+import numpy as np
+
+from .files import atomic_write
+
+# Length of the character n-grams terms are indexed by. Bigrams keep enough n-grams in common between short terms and
+# their misspellings to filter the candidates.
+NGRAM_LENGTH = 2
+# Characters marking the start and the end of a term, so that its first and last characters form n-grams of their own
+TERM_START = "^"
+TERM_END = "$"
+# Default maximum number of terms a misspelled term is replaced with
+MAX_CORRECTIONS = 5
+# Number of bits of a Unicode code point, and of the length of a term and the position of an n-gram in it. The postings
+# of the n-gram index are sorted by their n-gram, the length of their term and their position in it, packed into an
+# integer, see get_posting_keys.
+CODE_POINT_BITS = 21
+POSITION_BITS = (64 - NGRAM_LENGTH * CODE_POINT_BITS) // 2
+# Longer terms are indexed as if they had this length, and are only found by comparing them with every term
+MAX_TERM_LENGTH = (1 << POSITION_BITS) - 1
+NGRAM_MAGIC = b"GPNG\x01\x00\x00\x00"
+# Magic, number of terms, number of postings
+NGRAM_HEADER = struct.Struct("<8sQQ")
+
+
+def get_max_distance(term: str) -> int:
+    """
+    Get the number of edits a term may be misspelled by. Short terms are only corrected by one edit, since most other
+    short terms are within two edits of them.
+    """
+    if len(term) <= 2:
+        return 0
+    if len(term) <= 5:
+        return 1
+    return 2
+
+
+def get_ngram_count(term_length):
+    """
+    Get the number of character n-grams of a term of the given length, including the ones with its start and end.
+    """
+    return term_length + len(TERM_START) + len(TERM_END) - NGRAM_LENGTH + 1
+
+
+def get_ngrams(terms: list[str]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Get every character n-gram of the terms, including the ones with their start and end. Each n-gram is represented by
+    a key, its code points packed into an integer.
+    :return: tuple with the keys of the n-grams, the id of the term of each of them and its position in the term
+    """
+    padded_terms = [TERM_START + term + TERM_END for term in terms]
+    padded_lengths = np.array([len(term) for term in padded_terms], dtype=np.int64)
+    code_points = np.frombuffer("".join(padded_terms).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    ngram_counts = np.maximum(padded_lengths - NGRAM_LENGTH + 1, 0)
+    term_ids = np.repeat(np.arange(len(terms), dtype=np.uint32), ngram_counts)
+    # The position of every n-gram in its term, and its start in the code points of all the terms
+    positions = np.arange(len(term_ids), dtype=np.int64) - np.repeat(np.cumsum(ngram_counts) - ngram_counts,
+                                                                     ngram_counts)
+    starts = np.repeat(np.cumsum(padded_lengths) - padded_lengths, ngram_counts) + positions
+    keys = np.zeros(len(term_ids), dtype=np.uint64)
+    for i in range(NGRAM_LENGTH):
+        keys = keys << np.uint64(CODE_POINT_BITS) | code_points[starts + i]
+    return keys, term_ids, positions
+
+
+def get_posting_keys(ngram_keys: np.ndarray, term_lengths: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """
+    Pack n-gram keys, term lengths and positions into the integers the postings of the n-gram index are sorted by.
+    """
+    term_lengths = np.minimum(term_lengths, MAX_TERM_LENGTH).astype(np.uint64)
+    positions = np.minimum(positions, MAX_TERM_LENGTH).astype(np.uint64)
+    return ngram_keys << np.uint64(2 * POSITION_BITS) | term_lengths << np.uint64(POSITION_BITS) | positions
+
+
+def get_character_masks(term: str) -> dict[str, int]:
+    """
+    Get the positions of each character in a term, as the bits of an integer. See edit_distance.
+    """
+    character_masks = {}
+    for position, character in enumerate(term):
+        character_masks[character] = character_masks.get(character, 0) | 1 << position
+    return character_masks
+
+
+def edit_distance(first: str, second: str, max_distance: int, character_masks: dict[str, int] = None) -> int:
+    """
+    Get the Levenshtein distance between two strings, the number of characters that have to be inserted, deleted or
+    replaced to turn one into the other. Uses the bit-parallel algorithm of Myers, where each column of the dynamic
+    programming table is held in the bits of two integers, as the differences between its consecutive cells.
+    :param character_masks: get_character_masks of the first string, when comparing it with many strings
+    :return: the distance, or max_distance + 1 if it is greater than max_distance
+    """
+    if abs(len(first) - len(second)) > max_distance:
+        return max_distance + 1
+    if not first:
+        return len(second)
+    if character_masks is None:
+        character_masks = get_character_masks(first)
+    all_cells = (1 << len(first)) - 1
+    last_cell = 1 << (len(first) - 1)
+    # The cells of the column that are one more and one less than the cell above them
+    vertical_increases = all_cells
+    vertical_decreases = 0
+    distance = len(first)
+    for remaining, character in zip(range(len(second) - 1, -1, -1), second):
+        matches = character_masks.get(character, 0)
+        x_vertical = matches | vertical_decreases
+        x_horizontal = (((matches & vertical_increases) + vertical_increases) ^ vertical_increases) | matches
+        horizontal_increases = vertical_decreases | ~(x_horizontal | vertical_increases)
+        horizontal_decreases = vertical_increases & x_horizontal
+        # The last cell of the column is the distance of the first string from the prefix of the second one
+        if horizontal_increases & last_cell:
+            distance += 1
+        elif horizontal_decreases & last_cell:
+            distance -= 1
+        # Every remaining character lowers the distance by at most one
+        if distance - remaining > max_distance:
+            return max_distance + 1
+        horizontal_increases = (horizontal_increases << 1) | 1
+        horizontal_decreases = horizontal_decreases << 1
+        vertical_increases = (horizontal_decreases | ~(x_vertical | horizontal_increases)) & all_cells
+        vertical_decreases = horizontal_increases & x_vertical & all_cells
+    return min(distance, max_distance + 1)
+
+
+class TermNGramIndex:
+    """
+    Finds the terms of a vocabulary within a small edit distance of a term. Every n-gram of every term is a posting of
+    the index, and the postings are sorted by n-gram, length of their term and position in it. Each edit changes at
+    most NGRAM_LENGTH n-grams of a term and shifts the rest by at most one position, so two terms within distance d
+    differ in length by at most d, and share at least max_ngram_count - d * NGRAM_LENGTH n-grams at positions at most d
+    apart, where max_ngram_count is the number of n-grams of the longer one. Only the postings of terms of similar
+    length at nearby positions are read, and only the few terms sharing enough of them are compared with the term.
+
+    The index is built along with the lexicon and stored in a binary file, which is memory-mapped when opened. The
+    file contains the sorted keys of the postings, see get_posting_keys, and the term id of every posting, followed by
+    the length of every term.
+    """
+
+    def __init__(self, get_term, posting_keys: np.ndarray, term_ids: np.ndarray, term_lengths: np.ndarray):
+        """
+        Use from_terms or open instead.
+        :param get_term: function returning the term with the given id
+        """
+        self.get_term = get_term
+        self.posting_keys = posting_keys
+        self.term_ids = term_ids
+        self.term_lengths = term_lengths
+
+    @classmethod
+    def from_terms(cls, terms: Sequence[str]) -> "TermNGramIndex":
+        """
+        Builds the index of a vocabulary in memory.
+        :param terms: the terms of the vocabulary, in the order of their ids
+        """
+        terms = list(terms)
+        return cls(terms.__getitem__, *cls.__get_postings(terms))
+
+    @classmethod
+    def open(cls, ngram_file_name: str, get_term) -> "TermNGramIndex":
+        """
+        Memory-maps an index created by write.
+        :param get_term: function returning the term with the given id, such as Lexicon.get_term
+        """
+        with open(ngram_file_name, "rb") as ngram_file:
+            ngram_map = mmap.mmap(ngram_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, total_terms, total_postings = NGRAM_HEADER.unpack_from(ngram_map)
+        if magic != NGRAM_MAGIC:
+            raise RuntimeError("{} is not an n-gram file.".format(ngram_file_name))
+        posting_keys = np.frombuffer(ngram_map, dtype=np.uint64, count=total_postings, offset=NGRAM_HEADER.size)
+        position = NGRAM_HEADER.size + posting_keys.nbytes
+        term_ids = np.frombuffer(ngram_map, dtype=np.uint32, count=total_postings, offset=position)
+        term_lengths = np.frombuffer(ngram_map, dtype=np.uint32, count=total_terms, offset=position + term_ids.nbytes)
+        return cls(get_term, posting_keys, term_ids, term_lengths)
+
+    @staticmethod
+    def write(ngram_file_name: str, terms: Iterable[str]) -> None:
+        """
+        Builds the index of a vocabulary and stores it in a file.
+        :param terms: the terms of the vocabulary, in the order of their ids
+        """
+        posting_keys, term_ids, term_lengths = TermNGramIndex.__get_postings(list(terms))
+        with atomic_write(ngram_file_name) as ngram_file:
+            ngram_file.write(NGRAM_HEADER.pack(NGRAM_MAGIC, len(term_lengths), len(posting_keys)))
+            # The arrays are laid out widest type first, so that each of them is properly aligned
+            for array in (posting_keys, term_ids, term_lengths):
+                ngram_file.write(array.tobytes())
+
+    @staticmethod
+    def __get_postings(terms: list[str]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        :return: tuple with the sorted keys of the postings, the term id of every posting and the length of every term
+        """
+        ngram_keys, term_ids, positions = get_ngrams(terms)
+        term_lengths = np.array([len(term) for term in terms], dtype=np.uint32)
+        posting_keys = get_posting_keys(ngram_keys, term_lengths[term_ids], positions)
+        order = np.lexsort((term_ids, posting_keys))
+        return posting_keys[order], term_ids[order], term_lengths
+
+    def __len__(self):
+        return len(self.term_lengths)
+
+    def find(self, term: str, max_distance: int) -> list[tuple[int, int]]:
+        """
+        Find the terms within max_distance edits of the given term.
+        :return: list of tuples with the id of every similar term and its distance from the term, closest first
+        """
+        if get_ngram_count(len(term)) - max_distance * NGRAM_LENGTH > 0 and \
+                len(term) + max_distance < MAX_TERM_LENGTH:
+            # The postings of every n-gram of the term, in terms of similar length and at nearby positions
+            ngram_keys, _, positions = get_ngrams([term])
+            term_lengths = np.arange(max(len(term) - max_distance, 0), len(term) + max_distance + 1)
+            ngram_keys = np.repeat(ngram_keys, len(term_lengths))
+            positions = np.repeat(positions, len(term_lengths))
+            term_lengths = np.tile(term_lengths, len(positions) // len(term_lengths))
+            starts = np.searchsorted(self.posting_keys, get_posting_keys(
+                ngram_keys, term_lengths, np.maximum(positions - max_distance, 0)), side="left").astype(np.int64)
+            ends = np.searchsorted(self.posting_keys, get_posting_keys(
+                ngram_keys, term_lengths, positions + max_distance), side="right").astype(np.int64)
+            posting_counts = ends - starts
+            first_postings = np.cumsum(posting_counts) - posting_counts
+            postings = np.arange(posting_counts.sum()) + np.repeat(starts - first_postings, posting_counts)
+            # Repeated n-grams may be counted more than once, which only lets more candidates through
+            shared_ngrams = np.bincount(self.term_ids[postings], minlength=1)
+            candidates = np.flatnonzero(shared_ngrams >= get_ngram_count(len(term)) - max_distance * NGRAM_LENGTH)
+            longer_lengths = np.maximum(self.term_lengths[candidates].astype(np.int64), len(term))
+            min_shared_ngrams = get_ngram_count(longer_lengths) - max_distance * NGRAM_LENGTH
+            candidates = candidates[shared_ngrams[candidates] >= min_shared_ngrams]
+        else:
+            # The term is too short for the n-grams to rule out any term, or too long to be indexed
+            candidates = np.flatnonzero(np.abs(self.term_lengths.astype(np.int64) - len(term)) <= max_distance)
+        similar_terms = []
+        character_masks = get_character_masks(term)
+        for term_id in candidates.tolist():
+            distance = edit_distance(term, self.get_term(term_id), max_distance, character_masks)
+            if distance <= max_distance:
+                similar_terms.append((term_id, distance))
+        similar_terms.sort(key=lambda similar_term: similar_term[1])
+        return similar_terms
@@ -1,8 +1,23 @@
+import mmap
 import os
+import struct
+from collections import Counter
+from contextlib import ExitStack
 from numpy import sum
-from numpy.linalg import norm
-import heapq
+import numpy as np
 from math import log, e
+from typing import Optional
+
+from .bm25 import BM25
+from .files import atomic_write
+from .fuzzy import TermNGramIndex, get_max_distance
+from .lexicon import Lexicon, MAX_EXPANSIONS
+from .max_score import BlockCursor, max_score_top_k
+from .phrase import Phrase, match_phrase
+from .positions import POSITIONS_MAGIC, PositionsFile, encode_position_lists
+from .postings import MAGIC, encode_posting_list, encode_posting_lists, decode_posting_list, read_block_table, \
+    decode_block, decode_blocks, get_block_table, select_blocks, select_postings
+from .tiers import TierFile
 
 
 class DocEntry:
@@ -22,41 +37,417 @@ class DocEntry:
 
 
 def calculate_tf(word_count):
-    return 1 + log(word_count)
+    # Works both on single counts and on arrays of counts
+    return 1 + np.log(word_count)
 
 
 def calculate_idf(total_documents, documents_containing_term):
     return log(1 + total_documents / documents_containing_term)
 
 
+# Number of postings encoded and written at once while populating the index
+POSTINGS_PER_CHUNK = 1 << 22
+# When intersecting a posting list with some documents, the whole list is decoded if at least this fraction of its
+# blocks would have to be decoded anyway
+FULL_DECODE_FRACTION = 0.5
+# A search answered from the first tier scores exactly at most this many documents per requested result. If more
+# documents could still be among the results, the full posting lists are searched instead.
+TIER_CANDIDATES_PER_RESULT = 10
+# Relative margin between the scores of the results found in the first tier and the bounds of the rest of the
+# documents, so that rounding errors of the scores cannot change the results
+TIER_SCORE_MARGIN = 1e-5
+
+METADATA_MAGIC = b"GPMD\x01\x00\x00\x00"
+# Magic, number of documents, total number of tokens of the documents
+METADATA_HEADER = struct.Struct("<8sQQ")
+
+# Statistics stored for every document of the index
+DOCUMENT_DTYPE = np.dtype([
+    # Euclidean norm of the term counts of the document
+    ("length", "<f8"),
+    # Total number of tokens in the document
+    ("tokens", "<u4"),
+    # Number of distinct terms in the document
+    ("unique_terms", "<u4")
+])
+
+
+def is_binary_index(index_file_name: str) -> bool:
+    """
+    Check whether the given index file uses the binary posting list format.
+    """
+    with open(index_file_name, "rb") as index_file:
+        return index_file.read(len(MAGIC)) == MAGIC
+
+
+def get_best_scores(document_ids: np.ndarray, scores: np.ndarray, number_of_results: int) -> list[int]:
+    """
+    Get the ids of the documents with the highest scores, best-to-worst. Documents with equal scores are ordered by
+    descending document id.
+    :param document_ids: array with the ids of the scored documents
+    :param scores: array with the score of each document in document_ids
+    :param number_of_results: number of document ids to return
+    """
+    if number_of_results <= 0 or len(document_ids) == 0:
+        return []
+    if len(document_ids) > number_of_results:
+        # Keep only the documents scoring at least as much as the k-th best one. Documents tied with it are kept too,
+        # so that ties are resolved the same way regardless of the partitioning.
+        kth_score = np.partition(scores, len(scores) - number_of_results)[len(scores) - number_of_results]
+        candidates = np.flatnonzero(scores >= kth_score)
+        document_ids = document_ids[candidates]
+        scores = scores[candidates]
+    order = np.lexsort((-document_ids, -scores))[:number_of_results]
+    return document_ids[order].tolist()
+
+
+def get_average_document_length(total_tokens: int, total_documents: int) -> float:
+    """
+    Get the average number of tokens of the documents of an index.
+    """
+    if total_documents == 0:
+        return 0.0
+    return float(total_tokens) / total_documents
+
+
+def search_index(index, query_tokens, number_of_results=10, dynamic_pruning=False, phrases=None,
+                 documents=None, bm25: BM25 = None) -> list[int]:
+    """
+    Ranks the documents of an index for the query with tf-idf or BM25. Works with any object providing get_postings,
+    intersect_postings, get_blocks, get_block_postings, get_tier_postings, get_document_frequency, get_max_weight,
+    total_documents, lengths, documents, average_document_length and tier_size like InvertedIndex does. If the index
+    has a first tier, tf-idf searches of the whole index are answered from it whenever its results are certain to be
+    exact. See search_tiered.
+    :param dynamic_pruning Use MaxScore evaluation over the blocks of the posting lists instead of scoring every
+                           matching document
+    :param phrases List of Phrase objects. Only documents containing all of them are returned. Their terms are not
+                   scored unless they are also part of query_tokens.
+    :param documents Sorted ids of the documents to rank, such as the matches of a boolean query. They are returned
+                     even if they do not contain any of the query tokens. If not given, every document containing at
+                     least one of the query tokens is ranked.
+    :param bm25 Rank with BM25 using the given parameters, instead of tf-idf divided by the Euclidean norm of the
+                document
+    :return List with the document ids of the matching documents best-to-worst.
+    """
+    for phrase in phrases or []:
+        documents = match_phrase(index, phrase, documents)
+    if documents is not None:
+        return _search_documents(index, query_tokens, np.asarray(documents, dtype=np.int64), number_of_results, bm25)
+    if dynamic_pruning:
+        return _search_max_score(index, query_tokens, number_of_results, bm25)
+    if index.tier_size and bm25 is None:
+        return search_tiered(index, query_tokens, number_of_results)
+    return search_exhaustive(index, query_tokens, number_of_results, bm25)
+
+
+def search_exhaustive(index, query_tokens, number_of_results=10, bm25: BM25 = None) -> list[int]:
+    """
+    Ranks the documents of an index by scoring every document containing at least one of the query tokens, reading
+    their full posting lists. See search_index.
+    """
+    # Dense score buffer with one slot for every document. Each posting list contains every document at most once,
+    # so a plain scatter-add is enough to accumulate the scores of a term.
+    scores = np.zeros(len(index.lengths), dtype=np.float32)
+    for token in query_tokens:
+        document_ids, term_frequencies = index.get_postings(token)
+        # Terms that are not in the index do not affect the scores
+        if len(document_ids) == 0:
+            continue
+        scores[document_ids] += _get_weights(index, token, document_ids, term_frequencies, bm25)
+    # Every matching document has a positive score, since each term appearance adds a positive weight
+    matching_documents = np.flatnonzero(scores)
+    matching_scores = scores[matching_documents] / _get_normalization(index, matching_documents, bm25)
+    return get_best_scores(matching_documents, matching_scores, number_of_results)
+
+
+def search_tiered(index, query_tokens, number_of_results=10) -> list[int]:
+    """
+    Ranks the documents of an index with tf-idf, from the first tiers of the query terms if their results are certain
+    to be exact, and otherwise from the full posting lists. Returns the same results as search_exhaustive. See
+    search_first_tier.
+    """
+    results = search_first_tier(index, query_tokens, number_of_results)
+    return results if results is not None else search_exhaustive(index, query_tokens, number_of_results)
+
+
+def search_first_tier(index, query_tokens, number_of_results=10, certify=True) -> Optional[list[int]]:
+    """
+    Ranks the documents of an index with tf-idf, using the first tier of each term, the postings with the highest
+    impact. Each term contributes to a document it was read for its exact weight, and to any other document at most
+    its idf times the impact of the last posting of its tier. So the tiers give a lower and an upper bound of the score
+    of every document they contain, and an upper bound of the score of every other document. The documents that may be
+    among the best ones are scored exactly, skipping to them in the full posting lists. If the best of them are certain
+    to score more than any other document, they are the results of the exhaustive search, in the same order.
+    :param certify: Return the best documents by their lower bounds, without checking them, if False. Faster, but the
+                    results may differ from the ones of the exhaustive search.
+    :return: List with the document ids of the matching documents best-to-worst, or None if the tiers are not enough
+             to find them.
+    """
+    if number_of_results <= 0:
+        return []
+    # Repeated tokens are scored once per appearance
+    token_counts = Counter(query_tokens)
+    tier_document_ids = [np.zeros(0, dtype=np.int64)]
+    tier_weights = [np.zeros(0)]
+    tier_bounds = [np.zeros(0)]
+    # Upper bound of the score of a document outside every tier
+    unseen_bound = 0.0
+    for token, count in token_counts.items():
+        document_frequency = index.get_document_frequency(token)
+        if document_frequency == 0:
+            continue
+        document_ids, term_frequencies, impact_bound = index.get_tier_postings(token)
+        idf = count * calculate_idf(index.total_documents, document_frequency)
+        tier_document_ids.append(document_ids)
+        tier_weights.append(idf * calculate_tf(term_frequencies) / index.lengths[document_ids])
+        tier_bounds.append(np.full(len(document_ids), idf * impact_bound))
+        unseen_bound += idf * impact_bound
+    seen_documents, posting_document = np.unique(np.concatenate(tier_document_ids), return_inverse=True)
+    if len(seen_documents) == 0:
+        return []
+    lower_bounds = np.bincount(posting_document, weights=np.concatenate(tier_weights))
+    if not certify:
+        return get_best_scores(seen_documents, lower_bounds, number_of_results)
+    # The bound of every term whose tier does not contain the document is added to its known weights. The bounds of
+    # the terms whose tiers do contain it are subtracted from their total, which must not round below zero.
+    missing_bounds = unseen_bound - np.bincount(posting_document, weights=np.concatenate(tier_bounds))
+    upper_bounds = lower_bounds + np.maximum(missing_bounds, 0.0)
+    # Documents whose upper bound is below the k-th best lower bound cannot be among the results
+    if len(seen_documents) >= number_of_results:
+        threshold = np.partition(lower_bounds, len(lower_bounds) - number_of_results)[
+            len(lower_bounds) - number_of_results]
+    else:
+        threshold = 0.0
+    is_candidate = upper_bounds >= threshold
+    candidates = seen_documents[is_candidate]
+    if len(candidates) <= TIER_CANDIDATES_PER_RESULT * number_of_results:
+        scores = score_documents(index, query_tokens, candidates)
+        other_bound = max(float(upper_bounds[~is_candidate].max(initial=0.0)), unseen_bound)
+        if len(candidates) >= number_of_results:
+            kth_score = np.partition(scores, len(scores) - number_of_results)[len(scores) - number_of_results]
+            certified = kth_score > other_bound * (1 + TIER_SCORE_MARGIN)
+        else:
+            # Every matching document has been scored, if the tiers contain the full posting lists of all terms
+            certified = other_bound == 0.0
+        if certified:
+            return get_best_scores(candidates, scores, number_of_results)
+    return None
+
+
+def _get_weights(index, token: str, document_ids: np.ndarray, term_frequencies: np.ndarray, bm25: BM25 = None) \
+        -> np.ndarray:
+    """
+    Get the weight of a term in each of the given documents containing it: tf*idf, or the BM25 weight if bm25 is given.
+    """
+    document_frequency = index.get_document_frequency(token)
+    if bm25 is None:
+        return calculate_tf(term_frequencies) * calculate_idf(index.total_documents, document_frequency)
+    # All numbers of tokens are known, so the weights of the whole list are calculated at once
+    return bm25.calculate_idf(index.total_documents, document_frequency) * \
+        bm25.calculate_weights(term_frequencies, index.documents["tokens"][document_ids], index.average_document_length)
+
+
+def _get_normalization(index, document_ids: np.ndarray, bm25: BM25 = None):
+    """
+    Get the number the score of each document is divided by. BM25 weights already account for the document length.
+    """
+    if bm25 is None:
+        return index.lengths[document_ids]
+    return np.ones(len(document_ids))
+
+
+def _search_documents(index, query_tokens, documents: np.ndarray, number_of_results: int, bm25: BM25 = None) \
+        -> list[int]:
+    """
+    Ranks only the given documents. See score_documents.
+    """
+    return get_best_scores(documents, score_documents(index, query_tokens, documents, bm25), number_of_results)
+
+
+def score_documents(index, query_tokens, documents: np.ndarray, bm25: BM25 = None, intersect_postings=None) \
+        -> np.ndarray:
+    """
+    Scores only the given documents. Posting lists are intersected with them, so the blocks of the lists that do not
+    contain any of them are skipped. Scores are accumulated in the same order as in search_exhaustive, so they are
+    identical.
+    :param documents: sorted document ids
+    :param intersect_postings: function returning the postings of a term in some documents, index.intersect_postings
+                               by default
+    :return: array with the score of each document
+    """
+    if intersect_postings is None:
+        intersect_postings = index.intersect_postings
+    scores = np.zeros(len(documents), dtype=np.float32)
+    for token in query_tokens:
+        document_ids, term_frequencies = intersect_postings(token, documents)
+        if len(document_ids) == 0:
+            continue
+        scores[np.searchsorted(documents, document_ids)] += _get_weights(index, token, document_ids, term_frequencies,
+                                                                         bm25)
+    return scores / _get_normalization(index, documents, bm25)
+
+
+def _get_block_bounds(index, token: str, last_document_ids: np.ndarray, max_term_frequencies: np.ndarray,
+                      bm25: BM25 = None) -> np.ndarray:
+    """
+    Get the maximum score a term contributes to any document of each block of its posting list, from the maximum term
+    frequency of the block and the shortest document in the range of ids it covers.
+    """
+    document_frequency = index.get_document_frequency(token)
+    # Each block covers the documents after the last one of the previous block
+    starts = np.concatenate([[0], last_document_ids[:-1] + 1])
+    if bm25 is None:
+        shortest = np.minimum.reduceat(np.asarray(index.lengths[:last_document_ids[-1] + 1]), starts)
+        # Documents without any terms have a length of 0 but no postings either, so the bound of a block covering one
+        # is the bound of the whole list
+        with np.errstate(divide="ignore"):
+            impacts = np.minimum(calculate_tf(max_term_frequencies) / shortest, index.get_max_weight(token))
+        return calculate_idf(index.total_documents, document_frequency) * impacts
+    fewest_tokens = np.minimum.reduceat(np.asarray(index.documents["tokens"][:last_document_ids[-1] + 1]), starts)
+    return bm25.calculate_idf(index.total_documents, document_frequency) * \
+        bm25.calculate_weights(max_term_frequencies, fewest_tokens, index.average_document_length)
+
+
+def _search_max_score(index, query_tokens, number_of_results, bm25: BM25 = None) -> list[int]:
+    """
+    Ranks the documents of an index using MaxScore dynamic pruning over the blocks of the posting lists. Only the block
+    tables are read up front, and only the blocks that may contain one of the best documents are decoded. See
+    max_score_top_k.
+    """
+    cursors = {}
+    # Repeated tokens are scored once per appearance
+    for token, count in Counter(query_tokens).items():
+        last_document_ids, max_term_frequencies = index.get_blocks(token)
+        if len(last_document_ids) == 0:
+            continue
+        cursors[token] = BlockCursor(index, token, last_document_ids,
+                                     count * _get_block_bounds(index, token, last_document_ids, max_term_frequencies,
+                                                               bm25))
+
+    def intersect_postings(token: str, documents: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        if token not in cursors:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return cursors[token].intersect_postings(documents)
+
+    def score(documents: np.ndarray, terms=None) -> np.ndarray:
+        # Tokens are scored in query order, so that the scores are the same as the exhaustive ones
+        tokens = query_tokens if terms is None else [token for token in query_tokens if token in terms]
+        return score_documents(index, tokens, documents, bm25, intersect_postings)
+
+    results = max_score_top_k(list(cursors.values()), score, number_of_results)
+    # Without enough pruning, scoring every matching document at once is faster and gives the same results
+    return results if results is not None else search_exhaustive(index, query_tokens, number_of_results, bm25)
+
+
+def _get_matrix_posting_chunks(count_matrix, terms):
+    """
+    Generator splitting the columns of a count matrix into chunks of roughly POSTINGS_PER_CHUNK postings, in the format
+    expected by InvertedIndex.populate_from_postings. The arrays of the CSC matrix are used directly, without creating
+    a sparse matrix for every term.
+    """
+    total_terms = count_matrix.shape[1]
+    columns_matrix = count_matrix.tocsc()
+    columns_matrix.sort_indices()
+    # The postings of term j are at indptr[j]:indptr[j+1]
+    indptr = columns_matrix.indptr.astype(np.int64)
+    first_term = 0
+    while first_term < total_terms:
+        last_term = np.searchsorted(indptr, indptr[first_term] + POSTINGS_PER_CHUNK, side="right") - 1
+        last_term = min(max(last_term, first_term + 1), total_terms)
+        yield list(terms[first_term:last_term]), indptr[first_term:last_term + 1], columns_matrix.indices, \
+            columns_matrix.data
+        first_term = last_term
+
+
 class InvertedIndex:
-    def __init__(self, index_file_name="index", replace=False):
+    def __init__(self, index_file_name="index", replace=False, binary=True, positions=False, tier_size=None):
         """
         Creates a new empty inverted index, or opens an existing one.
         :param index_file_name: The file name of the new index
         :param replace: Delete the contents of an existing index, if it exists.
+        :param binary: Store the posting lists of a new index in the compressed binary format instead of text. When
+                       opening an existing index, the format is detected from the file.
+        :param positions: Also store the positions of the terms in each document of a new index, in a separate file.
+                          They are needed for phrase and proximity queries. When opening an existing index, positions
+                          are available if the positions file exists.
+        :param tier_size: Also store the first tier of a new index, with this many postings of each term, in a separate
+                          file. See TierFile. When opening an existing index, the tier is used if the tier file exists.
         """
         if not os.path.exists("index") or not os.path.isdir("index"):
             os.mkdir("index")
         index_file_name = "index/{}".format(index_file_name)
-        # Term offsets are inserted while creating the new index, or when opening an existing index
-        self.term_offsets = dict()
-        self.lengths = dict()
-        # Initialized either in populate_index or in __read_lengths depending on whether the index is new or already
-        # exists
+        self.lexicon_file_name = "{}-lexicon".format(index_file_name)
+        # Sorted vocabulary with the offset and statistics of every term. Opened after the index is populated, or when
+        # opening an existing index.
+        self.lexicon = None
+        self.ngrams_file_name = "{}-ngrams".format(index_file_name)
+        # N-gram index of the lexicon used to correct misspelled terms, created along with the lexicon
+        self.term_ngrams = None
+        self.documents_file_name = "{}-documents.npy".format(index_file_name)
+        # Statistics of the whole index, written along with the documents file. See METADATA_HEADER.
+        self.metadata_file_name = "{}-metadata".format(index_file_name)
+        # Memory-mapped array with the statistics of each document, indexed by document id. See DOCUMENT_DTYPE.
+        self.documents = np.zeros(0, dtype=DOCUMENT_DTYPE)
+        # Euclidean norm of the term counts of each document, indexed by document id
+        self.lengths = self.documents["length"]
+        # Memory map of a binary index file, created when the first posting list is read
+        self.index_map = None
+        self.positions_file_name = "{}-positions".format(index_file_name)
+        # The positions of the terms, opened after the index is populated, or when opening an existing index
+        self.positions = None
+        self.tier_file_name = "{}-tier".format(index_file_name)
+        # The first tier, created after the index is populated, or opened along with an existing index
+        self.tier = None
+        # Number of postings of each term in the first tier, or None if the index has no tier
+        self.tier_size = None
+        # Initialized either in populate_index or when opening the documents file, depending on whether the index is
+        # new or already exists
         self.total_documents = 0
+        # Total and average number of tokens of the documents, used by BM25
+        self.total_tokens = 0
+        self.average_document_length = 0.0
         if os.path.exists(index_file_name) and not replace:
             # Open existing index
-            self.index_contents_file = open(index_file_name, "r", encoding='utf8')
-            self.index_catalog_file = open("{}-catalog".format(index_file_name), "r", encoding='utf8')
-            self.lengths_file = open("{}-lengths".format(index_file_name), "r", encoding='utf8')
-            self.__read_term_offsets()
-            self.__read_lengths()
+            self.binary = is_binary_index(index_file_name)
+            if self.binary:
+                self.index_contents_file = open(index_file_name, "rb")
+            else:
+                self.index_contents_file = open(index_file_name, "r", encoding='utf8')
+            # Older indexes store only the length of each document, in a text file
+            if os.path.exists(self.documents_file_name):
+                self.__open_documents()
+            else:
+                self.lengths = self.__read_lengths("{}-lengths".format(index_file_name))
+            # Indexes created before the lexicon was introduced only have a text catalog
+            if not os.path.exists(self.lexicon_file_name):
+                self.__create_lexicon_from_catalog("{}-catalog".format(index_file_name))
+            self.lexicon = Lexicon(self.lexicon_file_name)
+            self.term_ngrams = self.__open_term_ngrams()
+            if not os.path.exists(self.documents_file_name):
+                self.__create_documents_from_lengths()
+                self.__open_documents()
+            self.positional = os.path.exists(self.positions_file_name)
+            if self.positional:
+                self.positions = PositionsFile(self.positions_file_name)
+            if os.path.exists(self.tier_file_name):
+                self.tier = TierFile(self.tier_file_name)
+                self.tier_size = self.tier.tier_size
         else:
             # Create a new index
-            self.index_contents_file = open(index_file_name, "w+", encoding='utf8')
-            self.index_catalog_file = open("{}-catalog".format(index_file_name), "w+", encoding='utf8')
-            self.lengths_file = open("{}-lengths".format(index_file_name), "w+", encoding='utf8')
+            self.binary = binary
+            self.positional = positions
+            # Do not keep the positions of a replaced index
+            if not self.positional and os.path.exists(self.positions_file_name):
+                os.remove(self.positions_file_name)
+            # The tier is created along with the rest of the index
+            self.tier_size = tier_size
+            if os.path.exists(self.tier_file_name):
+                os.remove(self.tier_file_name)
+            if self.binary:
+                self.index_contents_file = open(index_file_name, "wb+")
+                self.index_contents_file.write(MAGIC)
+            else:
+                self.index_contents_file = open(index_file_name, "w+", encoding='utf8')
 
     def populate_index(self, count_matrix, terms) -> None:
         """
@@ -66,105 +457,472 @@ class InvertedIndex:
         :param terms: Array with N elements. Element at position j contains the term name for term at column j
         of the count_matrix
         """
-        conv_matrix = count_matrix.tocsc()
+        if self.positional:
+            raise ValueError("A count matrix does not contain the positions of the terms.")
         total_documents, total_terms = count_matrix.shape
-        self.total_documents = total_documents
-        for term_index in range(total_terms):
-            # Convert column to coo format, so we can quickly iterate over all non-zero elements
-            term_column = conv_matrix.getcol(term_index).tocoo()
-            term = terms[term_index]
-            # Write the offset in the index catalog
-            self.index_catalog_file.write(",".join([term, str(self.index_contents_file.tell())]))
-            self.index_catalog_file.write("\n")
-            # Write the offset in the index dict
-            self.term_offsets[term] = self.index_contents_file.tell()
-            # Write the contents in the current position in index_contents
-            self.index_contents_file.write(self.__create_string_from_term_column(term, term_column))
-            self.index_contents_file.write("\n")
-        # Store document lengths. This could be done in parallel with the above for loop.
-        # Convert to csr for quick row fetching
-        conv_matrix = count_matrix.tocsr()
-        for document_index in range(total_documents):
-            document_row = conv_matrix.getrow(document_index).tocoo()
-            document_length = norm(document_row.data)
-            self.lengths_file.write(str(document_length))
-            self.lengths_file.write("\n")
-            self.lengths[document_index] = document_length
-
-    def __create_string_from_term_column(self, term, term_column) -> str:
-        """
-        Given a term column in COO format, creates a string representation of its contents
-        :param term_column: Term column in COO format
+        # All rows are processed at once, using the document of every non-zero element of the CSR matrix.
+        rows_matrix = count_matrix.tocsr()
+        counts_per_row = np.diff(rows_matrix.indptr)
+        row_of_element = np.repeat(np.arange(total_documents), counts_per_row)
+        counts = rows_matrix.data.astype(np.float64)
+        documents = np.zeros(total_documents, dtype=DOCUMENT_DTYPE)
+        documents["length"] = np.sqrt(np.bincount(row_of_element, weights=counts ** 2, minlength=total_documents))
+        documents["tokens"] = np.bincount(row_of_element, weights=counts, minlength=total_documents)
+        documents["unique_terms"] = counts_per_row
+        del rows_matrix, row_of_element, counts
+        self.populate_from_postings(documents, _get_matrix_posting_chunks(count_matrix, terms))
+
+    def populate_from_postings(self, documents: np.ndarray, posting_chunks) -> None:
+        """
+        Replace everything in the index using the given document statistics and posting lists.
+        :param documents: Array with the statistics of every document. See DOCUMENT_DTYPE.
+        :param posting_chunks: Iterable of tuples (terms, indptr, document_ids, term_frequencies), each one containing
+        the posting lists of some terms, in the same layout as the columns of a CSC matrix: the postings of terms[j] are
+        at positions indptr[j]:indptr[j+1] of document_ids and term_frequencies. Each chunk is written at once. If the
+        index stores positions, each tuple has a fifth element with the positions of the postings from indptr[0] to
+        indptr[-1], one after the other.
+        """
+        # Store document statistics first, since the lengths are needed for the score bounds of the terms.
+        self.__write_documents(documents)
+        self.__open_documents()
+        # Statistics of every term, stored in the lexicon
+        terms = []
+        offsets = []
+        document_frequencies = []
+        max_term_frequencies = []
+        max_weights = []
+        positions_offsets = []
+        with ExitStack() as stack:
+            if self.positional:
+                positions_file = stack.enter_context(atomic_write(self.positions_file_name))
+                positions_file.write(POSITIONS_MAGIC)
+            for chunk_terms, indptr, document_ids, term_frequencies, *chunk_positions in posting_chunks:
+                indptr = np.asarray(indptr, dtype=np.int64)
+                chunk_document_frequencies = np.diff(indptr)
+                # Per term maximums over the postings of the chunk. Empty terms keep their zeros.
+                non_empty = np.flatnonzero(chunk_document_frequencies > 0)
+                chunk_max_term_frequencies = np.zeros(len(chunk_terms), dtype=np.uint32)
+                chunk_max_weights = np.zeros(len(chunk_terms))
+                if len(non_empty):
+                    starts = indptr[non_empty] - indptr[0]
+                    chunk_frequencies = term_frequencies[indptr[0]:indptr[-1]]
+                    chunk_weights = calculate_tf(chunk_frequencies) / self.lengths[document_ids[indptr[0]:indptr[-1]]]
+                    chunk_max_term_frequencies[non_empty] = np.maximum.reduceat(chunk_frequencies, starts)
+                    chunk_max_weights[non_empty] = np.maximum.reduceat(chunk_weights, starts)
+                if self.binary:
+                    encoded, chunk_offsets = encode_posting_lists(indptr, document_ids, term_frequencies)
+                    offsets.append(self.index_contents_file.tell() + chunk_offsets)
+                    self.index_contents_file.write(encoded.tobytes())
+                else:
+                    chunk_offsets = np.zeros(len(chunk_terms), dtype=np.int64)
+                    for term_index, term in enumerate(chunk_terms):
+                        term_slice = slice(indptr[term_index], indptr[term_index + 1])
+                        chunk_offsets[term_index] = self.index_contents_file.tell()
+                        self.index_contents_file.write(self.__create_string_from_postings(
+                            term, document_ids[term_slice], term_frequencies[term_slice]))
+                        self.index_contents_file.write("\n")
+                    offsets.append(chunk_offsets)
+                if self.positional:
+                    if not chunk_positions:
+                        raise ValueError("The positions of the postings are missing.")
+                    encoded, chunk_offsets = encode_position_lists(indptr, term_frequencies, chunk_positions[0])
+                    positions_offsets.append(positions_file.tell() + chunk_offsets)
+                    positions_file.write(encoded.tobytes())
+                terms.extend(chunk_terms)
+                document_frequencies.append(chunk_document_frequencies)
+                max_term_frequencies.append(chunk_max_term_frequencies)
+                max_weights.append(chunk_max_weights)
+            # Make sure the index can be opened right away
+            self.index_contents_file.flush()
+            order = Lexicon.write(self.lexicon_file_name, terms,
+                                  np.concatenate([np.zeros(0, dtype=np.int64)] + offsets),
+                                  np.concatenate([np.zeros(0, dtype=np.int64)] + document_frequencies),
+                                  np.concatenate([np.zeros(0, dtype=np.uint32)] + max_term_frequencies),
+                                  np.concatenate([np.zeros(0)] + max_weights))
+            if self.positional:
+                positions_offsets = np.concatenate([np.zeros(0, dtype=np.int64)] + positions_offsets)
+                PositionsFile.write_table(positions_file, positions_offsets[np.array(order, dtype=np.int64)])
+        self.lexicon = Lexicon(self.lexicon_file_name)
+        TermNGramIndex.write(self.ngrams_file_name, self.lexicon.terms())
+        self.term_ngrams = TermNGramIndex.open(self.ngrams_file_name, self.lexicon.get_term)
+        if self.positional:
+            self.positions = PositionsFile(self.positions_file_name)
+        if self.tier_size:
+            self.create_tier(self.tier_size)
+
+    def create_tier(self, tier_size: int) -> None:
+        """
+        Creates the first tier of the index, with the tier_size postings of every term that have the highest impact,
+        tf / document length. Terms with at most tier_size postings are left out, since their full posting lists are
+        just as short. Can also add a tier to an existing index. See search_tiered.
+        :param tier_size: Number of postings of each term in the tier
+        """
+        term_ids = np.flatnonzero(np.asarray(self.lexicon.document_frequencies) > tier_size)
+        document_ids = np.zeros((len(term_ids), tier_size), dtype=np.uint32)
+        term_frequencies = np.zeros((len(term_ids), tier_size), dtype=np.uint32)
+        for row, term_id in enumerate(term_ids.tolist()):
+            all_document_ids, all_term_frequencies = self.__read_postings(int(self.lexicon.offsets[term_id]))
+            impacts = calculate_tf(all_term_frequencies) / self.lengths[all_document_ids]
+            # Postings with equal impacts keep the order of their documents
+            order = np.argsort(-impacts, kind="stable")[:tier_size]
+            document_ids[row] = all_document_ids[order]
+            term_frequencies[row] = all_term_frequencies[order]
+        TierFile.write(self.tier_file_name, tier_size, term_ids, document_ids, term_frequencies)
+        self.tier = TierFile(self.tier_file_name)
+        self.tier_size = tier_size
+
+    def __create_string_from_postings(self, term, document_ids, term_frequencies) -> str:
+        """
+        Given the postings of a term, creates a string representation of its contents
+        :param document_ids: Ids of the documents containing the term
+        :param term_frequencies: Appearances of the term in each document
         :return: A string corresponding to the index file entry
         """
         # Each line in the index is in the format: term,docid1,count1,docid2,count2,....,docidN,countN
         str_array = [str(term)]
-        for document_id, term_frequency in zip(term_column.row, term_column.data):
+        for document_id, term_frequency in zip(document_ids.tolist(), term_frequencies.tolist()):
             str_array.extend([str(document_id), str(term_frequency)])
         return ','.join(str_array)
 
-    def __read_term_offsets(self):
+    def __create_lexicon_from_catalog(self, catalog_file_name: str) -> None:
+        """
+        Creates the lexicon of an index that only has a text catalog. Every posting list is read once to calculate the
+        statistics of its term.
+        """
+        terms = []
+        offsets = []
+        with open(catalog_file_name, "r", encoding="utf8") as catalog_file:
+            while line := catalog_file.readline():
+                # Some catalogs have additional columns after the offset
+                term, offset, *_ = line.removesuffix("\n").split(",")
+                terms.append(term)
+                offsets.append(int(offset))
+        document_frequencies = np.zeros(len(terms), dtype=np.uint32)
+        max_term_frequencies = np.zeros(len(terms), dtype=np.uint32)
+        max_weights = np.zeros(len(terms))
+        for term_index, offset in enumerate(offsets):
+            document_ids, term_frequencies = self.__read_postings(offset)
+            document_frequencies[term_index] = len(document_ids)
+            max_term_frequencies[term_index] = np.max(term_frequencies)
+            max_weights[term_index] = np.max(calculate_tf(term_frequencies) / self.lengths[document_ids])
+        Lexicon.write(self.lexicon_file_name, terms, offsets, document_frequencies, max_term_frequencies, max_weights)
+
+    def get_document_frequency(self, term: str) -> int:
+        """
+        Get the number of documents containing the term, without reading its posting list.
+        """
+        term_id = self.lexicon.find(term)
+        return int(self.lexicon.document_frequencies[term_id]) if term_id != -1 else 0
+
+    def get_max_weight(self, term: str) -> float:
+        """
+        Get the maximum value of tf / document length over all documents containing the term. Multiplied by the idf
+        of the term, it bounds the score the term can contribute to any document.
+        """
+        term_id = self.lexicon.find(term)
+        return float(self.lexicon.max_weights[term_id]) if term_id != -1 else 0.0
+
+    def expand_pattern(self, pattern: str, max_terms=MAX_EXPANSIONS) -> list[str]:
+        """
+        Find the terms of the index matching a pattern, where * stands for any number of characters and ? for a single
+        one. See Lexicon.expand.
+        :param max_terms: maximum number of terms. If more terms match, the most frequent ones are kept.
+        :return: the matching terms in sorted order
+        """
+        return [self.lexicon.get_term(term_id) for term_id in self.lexicon.expand(pattern, max_terms).tolist()]
+
+    def get_vocabulary(self) -> tuple[list[str], np.ndarray]:
+        """
+        Get every term of the index along with its document frequency.
+        :return: tuple with the terms in sorted order and an array with the number of documents containing each of them
+        """
+        return list(self.lexicon.terms()), np.asarray(self.lexicon.document_frequencies, dtype=np.int64)
+
+    def get_similar_terms(self, term: str, max_distance=None) -> list[tuple[str, int]]:
+        """
+        Find the terms of the index within a small edit distance of a term, such as the intended term of a misspelled
+        one. See TermNGramIndex.
+        :param max_distance: maximum number of edits. By default it depends on the length of the term, see
+                             get_max_distance.
+        :return: list of tuples with every similar term and its distance, closest and then most frequent first
+        """
+        if max_distance is None:
+            max_distance = get_max_distance(term)
+        if max_distance <= 0:
+            return []
+        similar_terms = self.term_ngrams.find(term, max_distance)
+        similar_terms.sort(key=lambda similar_term: (similar_term[1],
+                                                     -int(self.lexicon.document_frequencies[similar_term[0]])))
+        return [(self.lexicon.get_term(term_id), distance) for term_id, distance in similar_terms]
+
+    def get_postings(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Gets the posting list of the given term.
+        :return: tuple with an array of the ids of the documents the term appears in, sorted in ascending order, and an
+                 array with the number of appearances of the term in each of them. Both are empty if the term is not
+                 in the index.
+        """
+        term_id = self.lexicon.find(term)
+        if term_id == -1:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return self.__read_postings(int(self.lexicon.offsets[term_id]))
+
+    def get_blocks(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Gets the block table of the posting list of the term, without decoding any of its postings. Posting lists are
+        split into blocks of BLOCK_SIZE postings. See get_block_postings.
+        :return: tuple with the last document id of every block and the maximum term frequency in every block. Both are
+                 empty if the term is not in the index.
+        """
+        term_id = self.lexicon.find(term)
+        if term_id == -1:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        offset = int(self.lexicon.offsets[term_id])
+        if self.binary:
+            blocks = read_block_table(self.__get_index_map(), offset)
+            return blocks["last_document_id"].astype(np.int64), blocks["max_term_frequency"].astype(np.int64)
+        return get_block_table(*self.__read_postings(offset))
+
+    def get_block_postings(self, term: str, blocks: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Decodes some blocks of the posting list of the term. Consecutive blocks are decoded at once.
+        :param blocks: sorted numbers of blocks of the table returned by get_blocks
+        :return: tuple with the ids of the documents of the blocks and the number of appearances of the term in each
+                 of them
+        """
+        blocks = np.asarray(blocks, dtype=np.int64)
+        term_id = self.lexicon.find(term)
+        if term_id == -1 or len(blocks) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        offset = int(self.lexicon.offsets[term_id])
+        if not self.binary:
+            return select_blocks(*self.__read_postings(offset), blocks)
+        index_map = self.__get_index_map()
+        # Split the blocks into runs of consecutive ones
+        run_starts = np.flatnonzero(np.diff(blocks, prepend=-2) != 1)
+        run_ends = np.append(run_starts[1:], len(blocks))
+        decoded = [decode_blocks(index_map, first_block, last_block + 1, offset)
+                   for first_block, last_block in zip(blocks[run_starts].tolist(), blocks[run_ends - 1].tolist())]
+        return np.concatenate([document_ids for document_ids, _ in decoded]), \
+            np.concatenate([term_frequencies for _, term_frequencies in decoded])
+
+    def get_tier_postings(self, term: str) -> tuple[np.ndarray, np.ndarray, float]:
+        """
+        Gets the postings of the term in the first tier, or its full posting list if the term has no tier.
+        :return: tuple with an array of the ids of the documents, by descending impact if they are a tier, an array with
+                 the number of appearances of the term in each of them, and the maximum impact, tf / document length,
+                 of the term in any other document. The impact is 0 if the postings are the full posting list.
+        """
+        term_id = self.lexicon.find(term)
+        row = self.tier.find(term_id) if self.tier is not None and term_id != -1 else -1
+        if row == -1:
+            return (*self.get_postings(term), 0.0)
+        document_ids, term_frequencies = self.tier.get_postings(row)
+        # Every posting left out of the tier has at most the impact of the last one in it
+        return document_ids, term_frequencies, float(calculate_tf(term_frequencies[-1]) /
+                                                     self.lengths[document_ids[-1]])
+
+    def intersect_postings(self, term: str, document_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Gets the postings of the term in the given documents only. The last document id of every block of the posting
+        list serves as a skip pointer: only the blocks that may contain one of the documents are decoded, so
+        intersecting a long list with a few documents skips most of its postings.
+        :param document_ids: sorted document ids
+        :return: tuple with the ids of the given documents that contain the term and the number of appearances of the
+                 term in each of them
+        """
+        document_ids = np.asarray(document_ids, dtype=np.int64)
+        term_id = self.lexicon.find(term)
+        if term_id == -1 or len(document_ids) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        offset = int(self.lexicon.offsets[term_id])
+        if self.binary:
+            index_map = self.__get_index_map()
+            blocks = read_block_table(index_map, offset)
+            # The first block whose last document is not smaller than each of the documents
+            block_of_document = np.searchsorted(blocks["last_document_id"], document_ids)
+            needed_blocks = np.unique(block_of_document[block_of_document < len(blocks)])
+            if len(needed_blocks) < FULL_DECODE_FRACTION * len(blocks):
+                decoded = [decode_block(index_map, block, offset) for block in needed_blocks.tolist()]
+                all_document_ids = np.concatenate([np.zeros(0, dtype=np.int64)] + [ids for ids, _ in decoded])
+                term_frequencies = np.concatenate([np.zeros(0, dtype=np.int64)] + [tfs for _, tfs in decoded])
+            else:
+                all_document_ids, term_frequencies = self.__read_postings(offset)
+        else:
+            all_document_ids, term_frequencies = self.__read_postings(offset)
+        return select_postings(all_document_ids, term_frequencies, document_ids)
+
+    def get_positions(self, term: str, document_ids=None) -> tuple[np.ndarray, np.ndarray]:
         """
-        Reads the term offsets from index_catalog_file into the term_offsets dict.
+        Gets the positions of the term in some of the documents containing it. Only the positions of the requested
+        documents are decoded. The index must store positions.
+        :param document_ids: sorted ids of documents containing the term. If None, all the documents containing it.
+        :return: tuple with an array with the number of appearances of the term in each document and an array with the
+                 positions of the term in all of them, one document after the other
         """
-        self.index_catalog_file.seek(0)
-        while line := self.index_catalog_file.readline():
-            term, offset = line.removesuffix("\n").split(",")
-            self.term_offsets[term] = int(offset)
+        if not self.positional:
+            raise RuntimeError("The index does not store the positions of the terms.")
+        term_id = self.lexicon.find(term)
+        if term_id == -1:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        all_document_ids, term_frequencies = self.__read_postings(int(self.lexicon.offsets[term_id]))
+        if document_ids is None:
+            return term_frequencies, self.positions.get_all_positions(term_id, term_frequencies)
+        posting_indexes = np.searchsorted(all_document_ids, document_ids)
+        return term_frequencies[posting_indexes], \
+            self.positions.get_positions(term_id, term_frequencies, posting_indexes)
+
+    def __read_postings(self, offset: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Reads the posting list at the given offset of the index file.
+        """
+        if self.binary:
+            # Decode straight from the mapped file, without copying the list into a separate buffer
+            return decode_posting_list(self.__get_index_map(), offset)
+        self.index_contents_file.seek(offset)
+        # The first element of each line is the term. The rest are pairs of doc_id, term_freq
+        line_contents = self.index_contents_file.readline().removesuffix("\n").split(",")
+        pairs = np.array(line_contents[1:], dtype=np.int64).reshape(-1, 2)
+        return pairs[:, 0], pairs[:, 1]
+
+    def __get_index_map(self) -> mmap.mmap:
+        """
+        Get a read-only memory map of the binary index file. The map is created on first use, so that a newly populated
+        index is mapped only after all of its contents have been written.
+        """
+        if self.index_map is None:
+            self.index_map = mmap.mmap(self.index_contents_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.index_map
 
     def get_term_appearances(self, term: str) -> set[DocEntry]:
         """
         Gets the document and appearance count for each document the term appears in.
         :return: set of DocEntry objects
         """
-        if term not in self.term_offsets.keys():
-            return set()
-        list_contents = set()
-        offset = self.term_offsets[term]
-        self.index_contents_file.seek(offset)
-        line_contents = self.index_contents_file.readline().removesuffix("\n").split(",")
-        # The first element of each line is the term. The rest are pairs of doc_id, term_freq
-        for i in range(1, len(line_contents), 2):
-            document_id = int(line_contents[i])
-            term_frequency = int(line_contents[i + 1])
-            list_contents.add(DocEntry(document_id, term_frequency))
-        return list_contents
+        document_ids, term_frequencies = self.get_postings(term)
+        return {DocEntry(document_id, term_frequency)
+                for document_id, term_frequency in zip(document_ids.tolist(), term_frequencies.tolist())}
 
-    def search(self, query_tokens, number_of_results=10) -> list[int]:
+    def search(self, query_tokens, number_of_results=10, dynamic_pruning=False, phrases=None,
+               documents=None, bm25: BM25 = None) -> list[int]:
         """
         Searches the catalog for documents matching the query.
         :param query_tokens Query tokenized and processed the same way as the terms in the inverted index.
         :param number_of_results Return the k-top results
+        :param dynamic_pruning Use MaxScore evaluation over the blocks of the posting lists, skipping the blocks that
+                               cannot contain any of the top-k, instead of scoring every matching document. Both return
+                               the same ranking.
+        :param phrases List of Phrase objects the documents must contain. See search_index.
+        :param documents Sorted ids of the only documents to rank. See search_index.
+        :param bm25 Rank with BM25 using the given parameters instead of tf-idf. See search_index.
         :return List with the document ids of the matching documents best-to-worst.
         """
-        document_rankings = {}
-        for token in query_tokens:
-            document_list = self.get_term_appearances(token)
-            idf = calculate_idf(self.total_documents, len(document_list))
-            for entry in document_list:
-                if entry.get_document_id() not in document_rankings.keys():
-                    document_rankings[entry.get_document_id()] = 0
-                document_rankings[entry.get_document_id()] += calculate_tf(entry.get_term_frequency())*idf
-        for document_id, score in document_rankings.items():
-            document_rankings[document_id] = score / self.lengths[document_id]
-        return self.__get_best_scores(document_rankings, number_of_results)
-
-    def __get_best_scores(self, scores: dict, number_of_results) -> list[int]:
-        score_maxheap = [(score, document_id) for document_id, score in scores.items()]
-        heapq.heapify(score_maxheap)
-        return [docid for score, docid in heapq.nlargest(number_of_results, score_maxheap)]
-
-
-    def __read_lengths(self):
-        """
-        Reads the lengths of each document from the lengths file
-        """
-        self.lengths = dict()
-        self.lengths_file.seek(0)
-        document_id = 0
-        while line := self.lengths_file.readline():
-            length = float(line.removesuffix("\n"))
-            self.lengths[document_id] = length
-            document_id += 1
-        # Store the total document number
-        self.total_documents = document_id + 1
+        return search_index(self, query_tokens, number_of_results, dynamic_pruning, phrases, documents, bm25)
+
+    def __open_term_ngrams(self) -> TermNGramIndex:
+        """
+        Memory-maps the n-gram index of the lexicon. Older indexes have no n-gram file, so it is built once when the
+        index is opened and the n-gram file is created.
+        """
+        if os.path.exists(self.ngrams_file_name):
+            term_ngrams = TermNGramIndex.open(self.ngrams_file_name, self.lexicon.get_term)
+            if len(term_ngrams) == len(self.lexicon):
+                return term_ngrams
+        try:
+            TermNGramIndex.write(self.ngrams_file_name, self.lexicon.terms())
+        except OSError:
+            # The index may be read-only, in which case the n-gram index is built every time it is opened
+            return TermNGramIndex.from_terms(list(self.lexicon.terms()))
+        return TermNGramIndex.open(self.ngrams_file_name, self.lexicon.get_term)
+
+    def __open_documents(self) -> None:
+        """
+        Memory-maps the documents file.
+        """
+        self.documents = np.load(self.documents_file_name, mmap_mode="r")
+        self.lengths = self.documents["length"]
+        self.total_documents = len(self.documents)
+        self.total_tokens = self.__read_total_tokens()
+        self.average_document_length = get_average_document_length(self.total_tokens, self.total_documents)
+
+    def __read_total_tokens(self) -> int:
+        """
+        Reads the total number of tokens of the documents from the metadata file. Older indexes have no metadata file,
+        so the tokens of every document are summed once and the metadata file is created.
+        """
+        if os.path.exists(self.metadata_file_name):
+            with open(self.metadata_file_name, "rb") as metadata_file:
+                header = metadata_file.read(METADATA_HEADER.size)
+            if len(header) == METADATA_HEADER.size:
+                magic, total_documents, total_tokens = METADATA_HEADER.unpack(header)
+                if magic == METADATA_MAGIC and total_documents == self.total_documents:
+                    return total_tokens
+        total_tokens = int(self.documents["tokens"].sum(dtype=np.int64))
+        try:
+            self.__write_metadata(self.total_documents, total_tokens)
+        except OSError:
+            # The index may be read-only, in which case the tokens are summed every time it is opened
+            pass
+        return total_tokens
+
+    def __write_metadata(self, total_documents: int, total_tokens: int) -> None:
+        with atomic_write(self.metadata_file_name) as metadata_file:
+            metadata_file.write(METADATA_HEADER.pack(METADATA_MAGIC, total_documents, total_tokens))
+
+    def __write_documents(self, documents: np.ndarray) -> None:
+        """
+        Stores the statistics of every document in the documents file, and the ones of the whole index in the metadata
+        file.
+        """
+        with atomic_write(self.documents_file_name) as documents_file:
+            np.save(documents_file, documents)
+        self.__write_metadata(len(documents), int(documents["tokens"].sum(dtype=np.int64)))
+
+    @staticmethod
+    def __read_lengths(lengths_file_name: str) -> np.ndarray:
+        """
+        Reads the lengths of each document from the text lengths file of older indexes.
+        """
+        with open(lengths_file_name, "r", encoding="utf8") as lengths_file:
+            return np.array([float(line) for line in lengths_file.read().split()])
+
+    def __create_documents_from_lengths(self) -> None:
+        """
+        Creates the documents file of an index that only stores the document lengths. The rest of the statistics are
+        gathered by reading every posting list once.
+        """
+        documents = np.zeros(len(self.lengths), dtype=DOCUMENT_DTYPE)
+        documents["length"] = self.lengths
+        for term in self.lexicon.terms():
+            document_ids, term_frequencies = self.get_postings(term)
+            documents["tokens"][document_ids] += term_frequencies.astype(np.uint32)
+            documents["unique_terms"][document_ids] += 1
+        self.__write_documents(documents)
+
+
+def convert_to_binary(index_file_name="index") -> None:
+    """
+    Rewrites an existing text index into the binary posting list format. The lexicon is rewritten to point to the new
+    offsets, while the documents file is left untouched.
+    :param index_file_name: The file name of the index inside the index folder
+    """
+    # Opening the index creates the lexicon of older indexes
+    text_index = InvertedIndex(index_file_name)
+    if text_index.binary:
+        return
+    lexicon = text_index.lexicon
+    index_path = "index/{}".format(index_file_name)
+    new_index_path = "{}.converting".format(index_path)
+    new_lexicon_path = "{}.converting".format(text_index.lexicon_file_name)
+    terms = list(lexicon.terms())
+    offsets = np.zeros(len(terms), dtype=np.uint64)
+    with open(new_index_path, "wb") as binary_index:
+        binary_index.write(MAGIC)
+        for term_id, term in enumerate(terms):
+            offsets[term_id] = binary_index.tell()
+            binary_index.write(encode_posting_list(*text_index.get_postings(term)))
+    Lexicon.write(new_lexicon_path, terms, offsets, lexicon.document_frequencies, lexicon.max_term_frequencies,
+                  lexicon.max_weights)
+    # Only replace the old files once the new ones have been written completely
+    os.replace(new_index_path, index_path)
+    os.replace(new_lexicon_path, text_index.lexicon_file_name)
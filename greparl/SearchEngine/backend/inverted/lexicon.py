@@ -0,0 +1,161 @@
+import mmap
+import re
+import struct
+from bisect import bisect_left
+
+import numpy as np
+
+from .files import atomic_write
+
+LEXICON_MAGIC = b"GPLX\x01\x00\x00\x00"
+# Magic, number of terms, length of the term blob in bytes
+LEXICON_HEADER = struct.Struct("<8sQQ")
+# Characters of term patterns: * stands for any number of characters and ? for a single one
+WILDCARDS = "*?"
+# Default maximum number of terms a pattern is expanded to
+MAX_EXPANSIONS = 50
+
+
+def get_literal_prefix(pattern: str) -> str:
+    """
+    Get the part of a term pattern before its first wildcard.
+    """
+    return re.split(r"[*?]", pattern, maxsplit=1)[0]
+
+
+def compile_pattern(pattern: str) -> re.Pattern:
+    """
+    Compile a term pattern into a regular expression matching whole terms.
+    """
+    return re.compile("".join(".*" if character == "*" else "." if character == "?" else re.escape(character)
+                              for character in pattern), re.DOTALL)
+
+
+class Lexicon:
+    """
+    The sorted vocabulary of an inverted index, stored in a binary file and memory-mapped when opened. The file
+    contains a blob with all the terms encoded in UTF-8 and sorted, and parallel arrays with, for every term, its start
+    in the blob, the offset of its posting list, its document frequency, its maximum term frequency and the maximum
+    value of tf / document length, which bounds its score. Terms are looked up with binary search, so the vocabulary is
+    never loaded into Python objects.
+    """
+
+    def __init__(self, lexicon_file_name: str):
+        self.lexicon_file = open(lexicon_file_name, "rb")
+        self.lexicon_map = mmap.mmap(self.lexicon_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.total_terms, blob_length = LEXICON_HEADER.unpack_from(self.lexicon_map)
+        if magic != LEXICON_MAGIC:
+            raise RuntimeError("{} is not a lexicon file.".format(lexicon_file_name))
+        position = LEXICON_HEADER.size
+        # The arrays are laid out widest type first, so that each of them is properly aligned
+        self.term_starts, position = self.__map_array(np.uint64, self.total_terms + 1, position)
+        self.offsets, position = self.__map_array(np.uint64, self.total_terms, position)
+        self.max_weights, position = self.__map_array(np.float64, self.total_terms, position)
+        self.document_frequencies, position = self.__map_array(np.uint32, self.total_terms, position)
+        self.max_term_frequencies, position = self.__map_array(np.uint32, self.total_terms, position)
+        self.blob_start = position
+
+    def __map_array(self, dtype, count: int, position: int) -> tuple[np.ndarray, int]:
+        array = np.frombuffer(self.lexicon_map, dtype=dtype, count=count, offset=position)
+        return array, position + array.nbytes
+
+    @staticmethod
+    def write(lexicon_file_name: str, terms: list[str], offsets, document_frequencies, max_term_frequencies,
+              max_weights) -> list[int]:
+        """
+        Creates a lexicon file. The terms do not need to be sorted.
+        :param terms: list with every term of the index
+        :param offsets: offset of the posting list of each term in the index file
+        :param document_frequencies: number of documents containing each term
+        :param max_term_frequencies: maximum number of appearances of each term in a single document
+        :param max_weights: maximum value of tf / document length of each term
+        :return: the position in terms of every term of the lexicon, in lexicon order
+        """
+        encoded_terms = [term.encode("utf8") for term in terms]
+        # Byte order of UTF-8 strings is the same as the order of their code points
+        order = sorted(range(len(encoded_terms)), key=encoded_terms.__getitem__)
+        encoded_terms = [encoded_terms[i] for i in order]
+        term_starts = np.zeros(len(encoded_terms) + 1, dtype=np.uint64)
+        term_starts[1:] = np.cumsum([len(term) for term in encoded_terms])
+        with atomic_write(lexicon_file_name) as lexicon_file:
+            lexicon_file.write(LEXICON_HEADER.pack(LEXICON_MAGIC, len(encoded_terms), int(term_starts[-1])))
+            lexicon_file.write(term_starts.tobytes())
+            lexicon_file.write(np.asarray(offsets, dtype=np.uint64)[order].tobytes())
+            lexicon_file.write(np.asarray(max_weights, dtype=np.float64)[order].tobytes())
+            lexicon_file.write(np.asarray(document_frequencies, dtype=np.uint32)[order].tobytes())
+            lexicon_file.write(np.asarray(max_term_frequencies, dtype=np.uint32)[order].tobytes())
+            lexicon_file.write(b"".join(encoded_terms))
+        return order
+
+    def __len__(self):
+        return self.total_terms
+
+    def __getitem__(self, term_id: int) -> bytes:
+        """
+        Get the UTF-8 encoded term with the given position in the lexicon. Allows using bisect on the lexicon itself.
+        """
+        start = self.blob_start + int(self.term_starts[term_id])
+        end = self.blob_start + int(self.term_starts[term_id + 1])
+        return self.lexicon_map[start:end]
+
+    def get_term(self, term_id: int) -> str:
+        return self[term_id].decode("utf8")
+
+    def find(self, term: str) -> int:
+        """
+        Get the position of the term in the lexicon.
+        :return: the id of the term, or -1 if the term is not in the lexicon
+        """
+        encoded_term = term.encode("utf8")
+        term_id = bisect_left(self, encoded_term)
+        if term_id < self.total_terms and self[term_id] == encoded_term:
+            return term_id
+        return -1
+
+    def find_prefix(self, prefix: str) -> tuple[int, int]:
+        """
+        Get the range of the terms starting with the prefix. The terms are consecutive in the lexicon, so the range is
+        found with two binary searches.
+        :return: tuple with the id of the first term of the range and the id following its last one
+        """
+        encoded_prefix = prefix.encode("utf8")
+        start = bisect_left(self, encoded_prefix)
+        # The smallest string greater than every string starting with the prefix
+        successor = encoded_prefix.rstrip(b"\xff")
+        if not successor:
+            return start, self.total_terms
+        successor = successor[:-1] + bytes([successor[-1] + 1])
+        return start, bisect_left(self, successor, start)
+
+    def expand(self, pattern: str, max_terms: int) -> np.ndarray:
+        """
+        Find the terms matching a pattern, where * stands for any number of characters and ? for a single one. Only the
+        range of the terms starting with the part of the pattern before its first wildcard is scanned, and patterns
+        ending in their only * are the whole range.
+        :param max_terms: maximum number of terms. If more terms match, the ones with the highest document frequency
+                          are kept.
+        :return: sorted ids of the matching terms
+        """
+        prefix = get_literal_prefix(pattern)
+        if prefix == pattern:
+            term_id = self.find(pattern)
+            return np.array([term_id] if term_id != -1 else [], dtype=np.int64)
+        start, end = self.find_prefix(prefix)
+        term_ids = np.arange(start, end, dtype=np.int64)
+        if pattern != prefix + "*":
+            regex = compile_pattern(pattern)
+            term_ids = term_ids[[regex.fullmatch(self.get_term(term_id)) is not None for term_id in term_ids.tolist()]]
+        if len(term_ids) > max_terms:
+            most_frequent = np.argsort(-self.document_frequencies[term_ids].astype(np.int64), kind="stable")
+            term_ids = np.sort(term_ids[most_frequent[:max_terms]])
+        return term_ids
+
+    def __contains__(self, term: str) -> bool:
+        return self.find(term) != -1
+
+    def terms(self):
+        """
+        Generator iterating over all the terms of the lexicon in sorted order.
+        """
+        for term_id in range(self.total_terms):
+            yield self.get_term(term_id)
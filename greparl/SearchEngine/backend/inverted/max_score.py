@@ -0,0 +1,192 @@
+from typing import Optional
+
+import numpy as np
+
+from .postings import select_postings
+
+# Relative slack applied to score bounds. Scores are accumulated in single precision, so a bound computed in double
+# precision could otherwise end up marginally lower than the score it is supposed to bound.
+BOUND_SLACK = 1e-5
+# Once at least this fraction of the blocks of a posting list has to be decoded, the rest of the list is decoded too,
+# since decoding the whole list at once is faster than decoding its blocks one run at a time
+FULL_DECODE_FRACTION = 0.5
+# Pruning is given up if the essential terms still have more than this fraction of the blocks of all terms, while more
+# than this fraction of the intervals of documents may still contain results, since scoring them in rounds is slower
+# than scoring every matching document at once
+MAX_PRUNED_FRACTION = 0.5
+# Number of intervals of documents scored in the first round of max_score_top_k. Every following round scores twice
+# as many, so that queries with few good documents stop early and the rest do not take too many rounds.
+FIRST_ROUND_INTERVALS = 8
+
+
+class BlockCursor:
+    """
+    The posting list of one query term, read block by block. Only the block table is read up front. Blocks are decoded
+    the first time any of their documents is needed and kept for the rest of the query, so every block is decoded at
+    most once.
+    """
+
+    def __init__(self, index, term: str, last_document_ids: np.ndarray, block_bounds: np.ndarray):
+        """
+        :param index: InvertedIndex, SegmentedIndex or any object providing get_postings and get_block_postings
+        :param last_document_ids: the last document id of every block of the posting list, as returned by get_blocks
+        :param block_bounds: maximum score the term contributes to any document of each block
+        """
+        self.index = index
+        self.term = term
+        self.last_document_ids = np.asarray(last_document_ids, dtype=np.int64)
+        self.block_bounds = block_bounds
+        self.upper_bound = float(block_bounds.max(initial=0.0))
+        # The postings of every decoded block, until the whole list is decoded
+        self.decoded_blocks = {}
+        # The whole posting list and the block of each of its postings, once it is decoded
+        self.document_ids = None
+        self.term_frequencies = None
+        self.posting_blocks = None
+
+    def find_blocks(self, document_ids: np.ndarray) -> np.ndarray:
+        """
+        Get the blocks that may contain any of the documents, using the last document of every block as a skip pointer.
+        :param document_ids: sorted document ids
+        :return: the sorted numbers of the blocks
+        """
+        blocks = np.searchsorted(self.last_document_ids, document_ids)
+        return np.unique(blocks[blocks < len(self.last_document_ids)])
+
+    def get_postings(self, blocks: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get the postings of some blocks, decoding the ones that have not been decoded yet.
+        :param blocks: sorted block numbers
+        """
+        if len(blocks) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        if self.document_ids is None:
+            missing_blocks = [block for block in blocks.tolist() if block not in self.decoded_blocks]
+            if len(self.decoded_blocks) + len(missing_blocks) >= FULL_DECODE_FRACTION * len(self.last_document_ids):
+                self.document_ids, self.term_frequencies = self.index.get_postings(self.term)
+                self.posting_blocks = np.searchsorted(self.last_document_ids, self.document_ids)
+                self.decoded_blocks = {}
+            else:
+                self.__decode_blocks(missing_blocks)
+                return np.concatenate([self.decoded_blocks[block][0] for block in blocks.tolist()]), \
+                    np.concatenate([self.decoded_blocks[block][1] for block in blocks.tolist()])
+        is_selected = np.zeros(len(self.last_document_ids), dtype=bool)
+        is_selected[blocks] = True
+        selected = is_selected[self.posting_blocks]
+        return self.document_ids[selected], self.term_frequencies[selected]
+
+    def __decode_blocks(self, blocks: list[int]) -> None:
+        if not blocks:
+            return
+        document_ids, term_frequencies = self.index.get_block_postings(self.term, np.array(blocks))
+        # Split the postings back into their blocks
+        ends = np.searchsorted(document_ids, self.last_document_ids[blocks], side="right").tolist()
+        for block, start, end in zip(blocks, [0] + ends[:-1], ends):
+            self.decoded_blocks[block] = (document_ids[start:end], term_frequencies[start:end])
+
+    def intersect_postings(self, document_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get the postings of the term in the given documents only, decoding only the blocks that may contain them.
+        :param document_ids: sorted document ids
+        """
+        all_document_ids, term_frequencies = self.get_postings(self.find_blocks(document_ids))
+        if len(all_document_ids) == 0 or len(document_ids) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return select_postings(all_document_ids, term_frequencies, document_ids)
+
+
+def max_score_top_k(cursors: list[BlockCursor], score_documents, number_of_results: int) -> Optional[list[int]]:
+    """
+    Top-k evaluation using the MaxScore algorithm over the blocks of the posting lists. The document ids are split into
+    intervals at the end of every block of every term, so that each term has a single block, with a single bound, over
+    each interval. The intervals are scored in rounds, by descending sum of the bounds of their blocks, until the best
+    remaining bound cannot reach the k-th best score. Terms are also split into essential and non-essential ones: once
+    the k-th best score exceeds the sum of the bounds of the non-essential terms, only documents containing at least
+    one essential term are scored. The essential terms are scored first, and a candidate is only looked up in the
+    non-essential terms if it can still make it into the top-k with the bounds of the blocks of the non-essential terms
+    it falls in, so those terms only have the blocks of the remaining candidates decoded. Returns exactly the same
+    ranking as scoring every matching document.
+    :param cursors: one cursor for every distinct query term found in the index
+    :param score_documents: function taking sorted document ids and a set of terms, and returning the exact scores of
+                            the documents for those terms only, or for the whole query if the set is None. The scores
+                            of the whole query must be the same as the ones of the exhaustive scorer.
+    :param number_of_results: number of documents to return
+    :return: ids of the best documents, best-to-worst, or None if the bounds do not allow pruning enough documents to
+             make up for scoring them in rounds. Documents with equal scores are ordered by descending id.
+    """
+    if number_of_results <= 0 or not cursors:
+        return []
+    # Sort the terms by their bound, so that the non-essential terms are always a prefix of the list
+    cursors = sorted(cursors, key=lambda cursor: cursor.upper_bound)
+    # cumulative_bounds[i] is the maximum score a document can get from the terms in cursors[0..i]
+    cumulative_bounds = np.cumsum([cursor.upper_bound for cursor in cursors]).tolist()
+    # essential_blocks[i] is the number of blocks of the terms in cursors[i..]
+    essential_blocks = np.cumsum([len(cursor.last_document_ids) for cursor in reversed(cursors)])[::-1].tolist()
+    interval_ends = np.unique(np.concatenate([cursor.last_document_ids for cursor in cursors]))
+    interval_starts = np.concatenate([[0], interval_ends[:-1] + 1])
+    interval_bounds = np.zeros(len(interval_ends))
+    for cursor in cursors:
+        # The block containing the end of an interval contains the whole interval
+        blocks = np.searchsorted(cursor.last_document_ids, interval_ends)
+        in_list = blocks < len(cursor.last_document_ids)
+        interval_bounds[in_list] += cursor.block_bounds[blocks[in_list]]
+    order = np.argsort(-interval_bounds, kind="stable")
+    interval_starts = interval_starts[order]
+    interval_ends = interval_ends[order]
+    interval_bounds = interval_bounds[order]
+    best_documents = np.zeros(0, dtype=np.int64)
+    best_scores = np.zeros(0)
+    threshold = 0.0
+    first_essential = 0
+    position = 0
+    round_intervals = FIRST_ROUND_INTERVALS
+    while position < len(interval_bounds) and first_essential < len(cursors):
+        is_full = len(best_documents) == number_of_results
+        if is_full and interval_bounds[position] * (1 + BOUND_SLACK) < threshold:
+            # No document of the remaining intervals can make it into the top-k
+            break
+        if is_full and essential_blocks[first_essential] > MAX_PRUNED_FRACTION * essential_blocks[0] and \
+                np.count_nonzero(interval_bounds[position:] * (1 + BOUND_SLACK) >= threshold) > \
+                MAX_PRUNED_FRACTION * len(interval_bounds):
+            return None
+        selected = slice(position, position + round_intervals)
+        position += round_intervals
+        round_intervals *= 2
+        may_contain_results = interval_bounds[selected] * (1 + BOUND_SLACK) >= threshold if is_full else \
+            np.ones(len(interval_bounds[selected]), dtype=bool)
+        starts = interval_starts[selected][may_contain_results]
+        ends = interval_ends[selected][may_contain_results]
+        interval_order = np.argsort(starts)
+        starts = starts[interval_order]
+        ends = ends[interval_order]
+        # The candidates are the documents of the intervals containing any essential term
+        candidates = [np.zeros(0, dtype=np.int64)]
+        for cursor in cursors[first_essential:]:
+            document_ids, _ = cursor.get_postings(cursor.find_blocks(ends))
+            interval = np.minimum(np.searchsorted(ends, document_ids), len(ends) - 1)
+            candidates.append(document_ids[(document_ids >= starts[interval]) & (document_ids <= ends[interval])])
+        candidates = np.unique(np.concatenate(candidates))
+        if is_full and first_essential > 0 and len(candidates):
+            # Skip the candidates that cannot make it into the top-k even if the non-essential terms have the highest
+            # weight of their blocks in them, without decoding any block of the non-essential terms
+            bounds = score_documents(candidates, {cursor.term for cursor in cursors[first_essential:]})
+            for cursor in cursors[:first_essential]:
+                blocks = np.searchsorted(cursor.last_document_ids, candidates)
+                in_list = blocks < len(cursor.last_document_ids)
+                bounds[in_list] += cursor.block_bounds[blocks[in_list]]
+            candidates = candidates[bounds * (1 + BOUND_SLACK) >= threshold]
+        if len(candidates) == 0:
+            continue
+        # The intervals do not overlap, so no document is scored twice
+        best_documents = np.concatenate([best_documents, candidates])
+        best_scores = np.concatenate([best_scores, score_documents(candidates, None)])
+        best = np.lexsort((-best_documents, -best_scores))[:number_of_results]
+        best_documents = best_documents[best]
+        best_scores = best_scores[best]
+        if len(best_documents) == number_of_results:
+            threshold = float(best_scores[-1])
+            # Terms whose combined bounds cannot reach the threshold no longer produce candidates on their own
+            while first_essential < len(cursors) and \
+                    cumulative_bounds[first_essential] * (1 + BOUND_SLACK) < threshold:
+                first_essential += 1
+    return best_documents.tolist()
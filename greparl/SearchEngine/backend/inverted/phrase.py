@@ -0,0 +1,56 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+
+# Multiplier of the document index in the keys combining a document and a position. Larger than any position.
+DOCUMENT_STRIDE = 1 << 32
+
+
+@dataclass
+class Phrase:
+    """
+    A sequence of terms that must appear in a document in the given order. With a max_gap of 0 the terms must be
+    adjacent. Otherwise, up to max_gap other words may appear between each term and the next one.
+    """
+    terms: list[str] = field(default_factory=list)
+    max_gap: int = 0
+
+
+def match_phrase(index, phrase: Phrase, candidates=None) -> np.ndarray:
+    """
+    Finds the documents containing the phrase. The posting lists of the terms are intersected first, and positions are
+    only read for the documents containing all of them. Indexes without positions only check that every term appears
+    in the document.
+    :param index: InvertedIndex or any object providing get_postings, intersect_postings, get_document_frequency,
+                  get_positions and positional
+    :param candidates: sorted ids of the only documents to consider, if given
+    :return: sorted ids of the matching documents
+    """
+    if not phrase.terms:
+        return np.zeros(0, dtype=np.int64) if candidates is None else candidates
+    # Start from the rarest term, and skip through the lists of the rest
+    terms = sorted(dict.fromkeys(phrase.terms), key=index.get_document_frequency)
+    if candidates is None:
+        documents, _ = index.get_postings(terms[0])
+    else:
+        documents, _ = index.intersect_postings(terms[0], candidates)
+    for term in terms[1:]:
+        documents, _ = index.intersect_postings(term, documents)
+    if len(phrase.terms) < 2 or len(documents) == 0 or not index.positional:
+        return documents
+    # Every appearance of a term is represented by the key document index * DOCUMENT_STRIDE + position, so that keys
+    # of different documents never come close to each other. The reachable keys are the appearances of the current term
+    # that complete the phrase up to it.
+    reachable = None
+    for term in phrase.terms:
+        term_frequencies, positions = index.get_positions(term, documents)
+        keys = np.repeat(np.arange(len(documents), dtype=np.int64) * DOCUMENT_STRIDE, term_frequencies) + positions
+        if reachable is not None:
+            # The closest preceding appearance of the previous term decides whether the gap is small enough
+            previous = np.searchsorted(reachable, keys) - 1
+            distances = keys - reachable[np.maximum(previous, 0)]
+            keys = keys[(previous >= 0) & (distances >= 1) & (distances <= phrase.max_gap + 1)]
+        reachable = keys
+        if len(reachable) == 0:
+            break
+    return documents[np.unique(reachable // DOCUMENT_STRIDE)]
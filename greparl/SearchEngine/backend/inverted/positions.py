@@ -0,0 +1,189 @@
+import mmap
+import struct
+
+import numpy as np
+
+from .postings import BLOCK_SIZE, varint_lengths, write_varints, decode_varints, _scatter_records
+
+# Every positions file starts with this header
+POSITIONS_MAGIC = b"GPPS\x01"
+# Header of the positions of each term: number of postings, number of blocks
+POSITIONS_HEADER = struct.Struct("<II")
+POSITIONS_HEADER_DTYPE = np.dtype([("posting_count", "<u4"), ("block_count", "<u4")])
+# Placed at the end of a positions file: offset of the table with the offset of each term, number of terms
+POSITIONS_TRAILER = struct.Struct("<QQ")
+# Each block of postings has an entry in the block table with the offset of its positions in the positions stream
+BLOCK_OFFSET_DTYPE = np.dtype("<u4")
+
+
+def encode_position_lists(indptr: np.ndarray, term_frequencies: np.ndarray, positions: np.ndarray) \
+        -> tuple[np.ndarray, np.ndarray]:
+    """
+    Encodes the positions of many consecutive posting lists at once. The positions of every document are
+    delta-encoded, starting from the first one, and stored as varints. The postings are grouped in the same blocks of
+    BLOCK_SIZE postings as the posting lists, and a table with the offset of each block allows decoding the positions
+    of a single block.
+    :param indptr: The postings of list i are at positions indptr[i]:indptr[i+1] of term_frequencies, as in the columns
+                   of a CSC matrix
+    :param term_frequencies: term frequency of each posting, which is also the number of its positions
+    :param positions: sorted positions of every posting from indptr[0] to indptr[-1], one after the other
+    :return: tuple with a uint8 array containing the positions of all lists and an array with the offset of each list
+             in it
+    """
+    indptr = np.asarray(indptr, dtype=np.int64)
+    term_frequencies = np.asarray(term_frequencies[indptr[0]:indptr[-1]], dtype=np.int64)
+    positions = np.asarray(positions, dtype=np.int64)
+    indptr = indptr - indptr[0]
+    list_count = len(indptr) - 1
+    document_frequencies = np.diff(indptr)
+    list_of_posting = np.repeat(np.arange(list_count), document_frequencies)
+    # Index of the first position of each posting, followed by the total number of positions
+    posting_bounds = np.concatenate([[0], np.cumsum(term_frequencies)])
+    gaps = np.diff(positions, prepend=0)
+    non_empty = term_frequencies > 0
+    gaps[posting_bounds[:-1][non_empty]] = positions[posting_bounds[:-1][non_empty]]
+    gap_bytes = varint_lengths(gaps)
+    byte_ends = np.concatenate([[0], np.cumsum(gap_bytes)])
+    # Offset of the positions of each posting in the concatenated streams, followed by their total length
+    posting_byte_bounds = byte_ends[posting_bounds]
+    streams_starts = posting_byte_bounds[indptr[:-1]]
+    streams_lengths = posting_byte_bounds[indptr[1:]] - streams_starts
+    block_counts = (document_frequencies + BLOCK_SIZE - 1) // BLOCK_SIZE
+    # The block table has an extra entry with the end of the stream
+    table_lengths = block_counts + 1
+    entry_sizes = POSITIONS_HEADER.size + table_lengths * BLOCK_OFFSET_DTYPE.itemsize + streams_lengths
+    entry_offsets = np.cumsum(entry_sizes) - entry_sizes
+    encoded = np.zeros(int(entry_sizes.sum()), dtype=np.uint8)
+    headers = np.zeros(list_count, dtype=POSITIONS_HEADER_DTYPE)
+    headers["posting_count"] = document_frequencies
+    headers["block_count"] = block_counts
+    _scatter_records(encoded, entry_offsets, headers)
+    # Block tables
+    list_of_table_entry = np.repeat(np.arange(list_count), table_lengths)
+    block_of_table_entry = np.arange(int(table_lengths.sum())) - np.repeat(np.cumsum(table_lengths) - table_lengths,
+                                                                           table_lengths)
+    first_postings = indptr[:-1][list_of_table_entry] + np.minimum(block_of_table_entry * BLOCK_SIZE,
+                                                                   document_frequencies[list_of_table_entry])
+    table = (posting_byte_bounds[first_postings] - streams_starts[list_of_table_entry]).astype(BLOCK_OFFSET_DTYPE)
+    _scatter_records(encoded, entry_offsets[list_of_table_entry] + POSITIONS_HEADER.size +
+                     block_of_table_entry * BLOCK_OFFSET_DTYPE.itemsize, table)
+    # Position streams
+    streams_positions = entry_offsets + POSITIONS_HEADER.size + table_lengths * BLOCK_OFFSET_DTYPE.itemsize
+    list_of_position = np.repeat(list_of_posting, term_frequencies)
+    write_varints(encoded, streams_positions[list_of_position] + byte_ends[:-1] - streams_starts[list_of_position],
+                  gaps, gap_bytes)
+    return encoded, entry_offsets
+
+
+def encode_position_list(term_frequencies: np.ndarray, positions: np.ndarray) -> bytes:
+    """
+    Encodes the positions of a single posting list. See encode_position_lists.
+    """
+    term_frequencies = np.asarray(term_frequencies, dtype=np.int64)
+    encoded, _ = encode_position_lists(np.array([0, len(term_frequencies)]), term_frequencies, positions)
+    return encoded.tobytes()
+
+
+def position_entry_length(buffer, offset=0) -> int:
+    """
+    Get the total length in bytes of the encoded positions of a posting list starting at offset.
+    """
+    _, block_count = POSITIONS_HEADER.unpack_from(buffer, offset)
+    table = _read_block_offsets(buffer, offset, block_count)
+    return POSITIONS_HEADER.size + table.nbytes + int(table[-1])
+
+
+def _read_block_offsets(buffer, offset: int, block_count: int) -> np.ndarray:
+    return np.frombuffer(buffer, dtype=BLOCK_OFFSET_DTYPE, count=block_count + 1, offset=offset + POSITIONS_HEADER.size)
+
+
+def _restore_positions(gaps: np.ndarray, term_frequencies: np.ndarray) -> np.ndarray:
+    """
+    Turn the position gaps of consecutive postings back into positions. Gaps restart at the first position of every
+    posting.
+    """
+    totals = np.cumsum(gaps)
+    posting_starts = np.cumsum(term_frequencies) - term_frequencies
+    return totals - np.repeat(totals[posting_starts] - gaps[posting_starts], term_frequencies)
+
+
+def decode_position_list(buffer, term_frequencies: np.ndarray, offset=0) -> np.ndarray:
+    """
+    Decodes the positions of every posting of a list.
+    :param term_frequencies: term frequency of every posting of the list
+    :return: the positions of all postings, one after the other
+    """
+    _, block_count = POSITIONS_HEADER.unpack_from(buffer, offset)
+    table = _read_block_offsets(buffer, offset, block_count)
+    stream_start = offset + POSITIONS_HEADER.size + table.nbytes
+    gaps = decode_varints(memoryview(buffer)[stream_start:stream_start + int(table[-1])])
+    return _restore_positions(gaps, np.asarray(term_frequencies, dtype=np.int64))
+
+
+def decode_positions(buffer, term_frequencies: np.ndarray, posting_indexes: np.ndarray, offset=0) -> np.ndarray:
+    """
+    Decodes the positions of some postings of a list. Only the blocks containing them are decoded.
+    :param term_frequencies: term frequency of every posting of the list
+    :param posting_indexes: sorted indexes of the postings in the list
+    :return: the positions of the given postings, one after the other
+    """
+    _, block_count = POSITIONS_HEADER.unpack_from(buffer, offset)
+    table = _read_block_offsets(buffer, offset, block_count)
+    stream_start = offset + POSITIONS_HEADER.size + table.nbytes
+    term_frequencies = np.asarray(term_frequencies, dtype=np.int64)
+    posting_indexes = np.asarray(posting_indexes, dtype=np.int64)
+    buffer = memoryview(buffer)
+    positions = [np.zeros(0, dtype=np.int64)]
+    blocks = posting_indexes // BLOCK_SIZE
+    for block in np.unique(blocks).tolist():
+        block_frequencies = term_frequencies[block * BLOCK_SIZE:(block + 1) * BLOCK_SIZE]
+        gaps = decode_varints(buffer[stream_start + int(table[block]):stream_start + int(table[block + 1])])
+        block_positions = _restore_positions(gaps, block_frequencies)
+        # Select the positions of the requested postings of the block
+        posting_bounds = np.concatenate([[0], np.cumsum(block_frequencies)])
+        selected = posting_indexes[blocks == block] - block * BLOCK_SIZE
+        starts = posting_bounds[selected]
+        counts = block_frequencies[selected]
+        positions.append(block_positions[np.repeat(starts - np.cumsum(counts) + counts, counts) +
+                                         np.arange(int(counts.sum()))])
+    return np.concatenate(positions)
+
+
+class PositionsFile:
+    """
+    The positions of every term of an index, stored in a separate file so that they are only read for phrase and
+    proximity queries. The positions of each term are followed, at the end of the file, by a table with the offset of
+    the positions of every term of the lexicon.
+    """
+
+    def __init__(self, positions_file_name: str):
+        self.positions_file = open(positions_file_name, "rb")
+        self.positions_map = mmap.mmap(self.positions_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.positions_map[:len(POSITIONS_MAGIC)] != POSITIONS_MAGIC:
+            raise RuntimeError("{} is not a positions file.".format(positions_file_name))
+        table_offset, total_terms = POSITIONS_TRAILER.unpack_from(self.positions_map,
+                                                                  len(self.positions_map) - POSITIONS_TRAILER.size)
+        # Offset of the positions of each term, in lexicon order
+        self.offsets = np.frombuffer(self.positions_map, dtype=np.uint64, count=total_terms, offset=table_offset)
+
+    @staticmethod
+    def write_table(positions_file, offsets: np.ndarray) -> None:
+        """
+        Completes a positions file, after the positions of every term have been written.
+        :param offsets: offset of the positions of each term in lexicon order
+        """
+        table_offset = positions_file.tell()
+        positions_file.write(np.asarray(offsets, dtype=np.uint64).tobytes())
+        positions_file.write(POSITIONS_TRAILER.pack(table_offset, len(offsets)))
+
+    def get_positions(self, term_id: int, term_frequencies: np.ndarray, posting_indexes: np.ndarray) -> np.ndarray:
+        """
+        Get the positions of some postings of a term. See decode_positions.
+        """
+        return decode_positions(self.positions_map, term_frequencies, posting_indexes, int(self.offsets[term_id]))
+
+    def get_all_positions(self, term_id: int, term_frequencies: np.ndarray) -> np.ndarray:
+        """
+        Get the positions of every posting of a term. See decode_position_list.
+        """
+        return decode_position_list(self.positions_map, term_frequencies, int(self.offsets[term_id]))
@@ -0,0 +1,295 @@
+import struct
+
+import numpy as np
+
+# Every binary index file starts with this header, so that it can be told apart from the older text indexes.
+MAGIC = b"GPIX\x01"
+# Number of postings stored in each block of a posting list
+BLOCK_SIZE = 128
+# Header of each posting list: document frequency, number of blocks, length of the gaps stream, length of the term
+# frequencies stream
+ENTRY_HEADER = struct.Struct("<IIII")
+ENTRY_HEADER_DTYPE = np.dtype([("document_frequency", "<u4"), ("block_count", "<u4"), ("gaps_length", "<u4"),
+                               ("tfs_length", "<u4")])
+# One record for each block of a posting list. The offsets are relative to the start of the respective stream.
+BLOCK_DTYPE = np.dtype([("last_document_id", "<u4"), ("gaps_offset", "<u4"), ("tfs_offset", "<u4"),
+                        ("max_term_frequency", "<u4")])
+
+
+def varint_lengths(values: np.ndarray) -> np.ndarray:
+    """
+    Get the number of bytes each value needs when encoded as a varint. Zero still needs one byte.
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    byte_counts = np.ones(len(values), dtype=np.int64)
+    remaining = values >> np.uint64(7)
+    while remaining.any():
+        byte_counts += remaining > 0
+        remaining >>= np.uint64(7)
+    return byte_counts
+
+
+def write_varints(encoded: np.ndarray, positions: np.ndarray, values: np.ndarray, byte_counts: np.ndarray) -> None:
+    """
+    Writes each value as a varint into the encoded buffer, starting at the respective position.
+    :param encoded: uint8 array to write into
+    :param positions: position of the first byte of each value in encoded
+    :param values: array of non-negative integers
+    :param byte_counts: number of bytes of each value, as returned by varint_lengths
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    if len(values) == 0:
+        return
+    # Write the k-th byte of every value that is at least k+1 bytes long
+    for k in range(int(byte_counts.max())):
+        mask = byte_counts > k
+        chunk = (values[mask] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        # Set the continuation bit if there are more bytes for this value
+        chunk |= np.where(byte_counts[mask] > k + 1, np.uint64(0x80), np.uint64(0))
+        encoded[positions[mask] + k] = chunk
+
+
+def encode_varints(values: np.ndarray) -> bytes:
+    """
+    Encodes non-negative integers using variable byte encoding. Each byte holds 7 bits of the value, least significant
+    first, and the high bit is set on every byte except the last one of each value.
+    :param values: array of non-negative integers
+    :return: the encoded bytes
+    """
+    byte_counts = varint_lengths(values)
+    ends = np.cumsum(byte_counts)
+    encoded = np.empty(ends[-1] if len(ends) else 0, dtype=np.uint8)
+    write_varints(encoded, ends - byte_counts, values, byte_counts)
+    return encoded.tobytes()
+
+
+def decode_varints(buffer) -> np.ndarray:
+    """
+    Decodes a buffer created by encode_varints.
+    :param buffer: bytes-like object containing only whole encoded values
+    :return: int64 array with the decoded values
+    """
+    encoded = np.frombuffer(buffer, dtype=np.uint8)
+    if len(encoded) == 0:
+        return np.zeros(0, dtype=np.int64)
+    # The last byte of every value does not have the continuation bit set
+    ends = np.flatnonzero(encoded < 0x80)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    # Position of each byte inside its value
+    positions = np.arange(len(encoded)) - np.repeat(starts, ends - starts + 1)
+    payload = (encoded & 0x7F).astype(np.uint64) << (np.uint64(7) * positions.astype(np.uint64))
+    return np.add.reduceat(payload, starts).astype(np.int64)
+
+
+def encode_posting_list(document_ids: np.ndarray, term_frequencies: np.ndarray) -> bytes:
+    """
+    Creates the binary representation of a posting list. Document ids are delta-encoded and both gaps and term
+    frequencies are stored as varints, in blocks of BLOCK_SIZE postings. A block table, placed before the postings,
+    allows decoding a single block without touching the rest of the list.
+    :param document_ids: sorted document ids of the documents containing the term
+    :param term_frequencies: number of appearances of the term in each document
+    :return: the encoded posting list
+    """
+    document_ids = np.asarray(document_ids, dtype=np.int64)
+    term_frequencies = np.asarray(term_frequencies, dtype=np.int64)
+    gaps = np.diff(document_ids, prepend=0)
+    block_count = (len(document_ids) + BLOCK_SIZE - 1) // BLOCK_SIZE
+    blocks = np.zeros(block_count, dtype=BLOCK_DTYPE)
+    gaps_stream = []
+    tfs_stream = []
+    gaps_length = 0
+    tfs_length = 0
+    for block in range(block_count):
+        block_slice = slice(block * BLOCK_SIZE, (block + 1) * BLOCK_SIZE)
+        encoded_gaps = encode_varints(gaps[block_slice])
+        encoded_tfs = encode_varints(term_frequencies[block_slice])
+        blocks[block] = (document_ids[block_slice][-1], gaps_length, tfs_length, term_frequencies[block_slice].max())
+        gaps_stream.append(encoded_gaps)
+        tfs_stream.append(encoded_tfs)
+        gaps_length += len(encoded_gaps)
+        tfs_length += len(encoded_tfs)
+    header = ENTRY_HEADER.pack(len(document_ids), block_count, gaps_length, tfs_length)
+    return b"".join([header, blocks.tobytes()] + gaps_stream + tfs_stream)
+
+
+def encode_posting_lists(indptr: np.ndarray, document_ids: np.ndarray, term_frequencies: np.ndarray) \
+        -> tuple[np.ndarray, np.ndarray]:
+    """
+    Encodes many consecutive posting lists at once, with vectorized operations over all of their postings. The result
+    is identical to concatenating the output of encode_posting_list for each list.
+    :param indptr: array with one more element than the number of lists. The postings of list i are at positions
+                   indptr[i]:indptr[i+1] of document_ids and term_frequencies, as in the columns of a CSC matrix.
+    :param document_ids: document ids of all lists, sorted within each list
+    :param term_frequencies: term frequency of each posting
+    :return: tuple with a uint8 array containing all encoded lists and an array with the offset of each list in it
+    """
+    indptr = np.asarray(indptr, dtype=np.int64)
+    document_ids = np.asarray(document_ids[indptr[0]:indptr[-1]], dtype=np.int64)
+    term_frequencies = np.asarray(term_frequencies[indptr[0]:indptr[-1]], dtype=np.int64)
+    indptr = indptr - indptr[0]
+    list_count = len(indptr) - 1
+    document_frequencies = np.diff(indptr)
+    list_of_posting = np.repeat(np.arange(list_count), document_frequencies)
+    position_in_list = np.arange(indptr[-1]) - indptr[:-1][list_of_posting]
+    # The first document of each list is stored as is, the rest as the difference from the previous one
+    gaps = np.diff(document_ids, prepend=0)
+    list_starts = indptr[:-1][document_frequencies > 0]
+    gaps[list_starts] = document_ids[list_starts]
+    gap_bytes = varint_lengths(gaps)
+    tf_bytes = varint_lengths(term_frequencies)
+    # Position of each value inside the gaps and term frequencies streams of its list
+    gap_ends = np.concatenate([[0], np.cumsum(gap_bytes)])
+    tf_ends = np.concatenate([[0], np.cumsum(tf_bytes)])
+    gap_offsets = gap_ends[:-1] - gap_ends[indptr[:-1]][list_of_posting]
+    tf_offsets = tf_ends[:-1] - tf_ends[indptr[:-1]][list_of_posting]
+    gaps_lengths = gap_ends[indptr[1:]] - gap_ends[indptr[:-1]]
+    tfs_lengths = tf_ends[indptr[1:]] - tf_ends[indptr[:-1]]
+    block_counts = (document_frequencies + BLOCK_SIZE - 1) // BLOCK_SIZE
+    # Lay out the lists one after the other
+    entry_sizes = ENTRY_HEADER.size + block_counts * BLOCK_DTYPE.itemsize + gaps_lengths + tfs_lengths
+    entry_offsets = np.cumsum(entry_sizes) - entry_sizes
+    encoded = np.zeros(int(entry_sizes.sum()), dtype=np.uint8)
+    # Headers
+    headers = np.zeros(list_count, dtype=ENTRY_HEADER_DTYPE)
+    headers["document_frequency"] = document_frequencies
+    headers["block_count"] = block_counts
+    headers["gaps_length"] = gaps_lengths
+    headers["tfs_length"] = tfs_lengths
+    _scatter_records(encoded, entry_offsets, headers)
+    # Block tables
+    block_starts = np.flatnonzero(position_in_list % BLOCK_SIZE == 0)
+    list_of_block = list_of_posting[block_starts]
+    block_lasts = np.minimum(block_starts + BLOCK_SIZE, indptr[1:][list_of_block]) - 1
+    blocks = np.zeros(len(block_starts), dtype=BLOCK_DTYPE)
+    blocks["last_document_id"] = document_ids[block_lasts]
+    blocks["gaps_offset"] = gap_offsets[block_starts]
+    blocks["tfs_offset"] = tf_offsets[block_starts]
+    if len(block_starts):
+        blocks["max_term_frequency"] = np.maximum.reduceat(term_frequencies, block_starts)
+    block_positions = entry_offsets[list_of_block] + ENTRY_HEADER.size + \
+        position_in_list[block_starts] // BLOCK_SIZE * BLOCK_DTYPE.itemsize
+    _scatter_records(encoded, block_positions, blocks)
+    # Gaps and term frequencies streams
+    streams_start = entry_offsets + ENTRY_HEADER.size + block_counts * BLOCK_DTYPE.itemsize
+    write_varints(encoded, streams_start[list_of_posting] + gap_offsets, gaps, gap_bytes)
+    write_varints(encoded, (streams_start + gaps_lengths)[list_of_posting] + tf_offsets, term_frequencies, tf_bytes)
+    return encoded, entry_offsets
+
+
+def _scatter_records(encoded: np.ndarray, positions: np.ndarray, records: np.ndarray) -> None:
+    """
+    Copies the bytes of each record of a structured array into encoded, starting at the respective position.
+    """
+    record_bytes = records.view(np.uint8).reshape(len(records), records.dtype.itemsize)
+    encoded[positions[:, np.newaxis] + np.arange(records.dtype.itemsize)] = record_bytes
+
+
+def entry_length(buffer, offset=0) -> int:
+    """
+    Get the total length in bytes of the encoded posting list starting at offset.
+    """
+    _, block_count, gaps_length, tfs_length = ENTRY_HEADER.unpack_from(buffer, offset)
+    return ENTRY_HEADER.size + block_count * BLOCK_DTYPE.itemsize + gaps_length + tfs_length
+
+
+def decode_posting_list(buffer, offset=0) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Decodes the whole posting list starting at offset.
+    :param buffer: bytes-like object containing the encoded list
+    :param offset: position of the list in the buffer
+    :return: tuple with an array of document ids and an array of the corresponding term frequencies
+    """
+    document_frequency, block_count, gaps_length, tfs_length = ENTRY_HEADER.unpack_from(buffer, offset)
+    gaps_start = offset + ENTRY_HEADER.size + block_count * BLOCK_DTYPE.itemsize
+    tfs_start = gaps_start + gaps_length
+    buffer = memoryview(buffer)
+    document_ids = np.cumsum(decode_varints(buffer[gaps_start:tfs_start]))
+    term_frequencies = decode_varints(buffer[tfs_start:tfs_start + tfs_length])
+    return document_ids, term_frequencies
+
+
+def read_block_table(buffer, offset=0) -> np.ndarray:
+    """
+    Get the block table of the posting list starting at offset. Each record contains the last document id of the
+    block, the offsets of the block in the gaps and frequencies streams and the maximum term frequency of the block.
+    """
+    _, block_count, _, _ = ENTRY_HEADER.unpack_from(buffer, offset)
+    return np.frombuffer(buffer, dtype=BLOCK_DTYPE, count=block_count, offset=offset + ENTRY_HEADER.size)
+
+
+def decode_block(buffer, block: int, offset=0) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Decodes a single block of the posting list starting at offset.
+    :return: tuple with an array of document ids and an array of the corresponding term frequencies
+    """
+    return decode_blocks(buffer, block, block + 1, offset)
+
+
+def decode_blocks(buffer, first_block: int, end_block: int, offset=0) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Decodes consecutive blocks of the posting list starting at offset, from first_block up to but not including
+    end_block.
+    :return: tuple with an array of document ids and an array of the corresponding term frequencies
+    """
+    _, block_count, gaps_length, tfs_length = ENTRY_HEADER.unpack_from(buffer, offset)
+    blocks = read_block_table(buffer, offset)
+    gaps_start = offset + ENTRY_HEADER.size + block_count * BLOCK_DTYPE.itemsize
+    tfs_start = gaps_start + gaps_length
+    if end_block < block_count:
+        gaps_end = gaps_start + int(blocks[end_block]["gaps_offset"])
+        tfs_end = tfs_start + int(blocks[end_block]["tfs_offset"])
+    else:
+        gaps_end = tfs_start
+        tfs_end = tfs_start + tfs_length
+    buffer = memoryview(buffer)
+    gaps = decode_varints(buffer[gaps_start + int(blocks[first_block]["gaps_offset"]):gaps_end])
+    # The first gap of every block is relative to the last document of the previous one, so the gaps of consecutive
+    # blocks add up like the ones of a single block
+    base = int(blocks[first_block - 1]["last_document_id"]) if first_block > 0 else 0
+    document_ids = base + np.cumsum(gaps)
+    term_frequencies = decode_varints(buffer[tfs_start + int(blocks[first_block]["tfs_offset"]):tfs_end])
+    return document_ids, term_frequencies
+
+
+def get_block_table(document_ids: np.ndarray, term_frequencies: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Get the last document id and the maximum term frequency of every block of a decoded posting list, the same ones
+    encode_posting_list stores in its block table.
+    """
+    starts = np.arange(0, len(document_ids), BLOCK_SIZE)
+    if len(starts) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    lasts = np.minimum(starts + BLOCK_SIZE, len(document_ids)) - 1
+    return np.asarray(document_ids, dtype=np.int64)[lasts], \
+        np.maximum.reduceat(np.asarray(term_frequencies, dtype=np.int64), starts)
+
+
+def select_blocks(document_ids: np.ndarray, term_frequencies: np.ndarray, blocks: np.ndarray) \
+        -> tuple[np.ndarray, np.ndarray]:
+    """
+    Keep only the postings of some blocks of a decoded posting list.
+    :param blocks: sorted block numbers
+    """
+    positions = (np.asarray(blocks, dtype=np.int64)[:, np.newaxis] * BLOCK_SIZE + np.arange(BLOCK_SIZE)).ravel()
+    positions = positions[positions < len(document_ids)]
+    return document_ids[positions], term_frequencies[positions]
+
+
+def select_postings(all_document_ids: np.ndarray, term_frequencies: np.ndarray, document_ids: np.ndarray) \
+        -> tuple[np.ndarray, np.ndarray]:
+    """
+    Keep only the postings of the given documents.
+    :param all_document_ids: sorted document ids of the postings
+    :param term_frequencies: term frequency of each posting
+    :param document_ids: sorted ids of the documents to keep, at least one
+    """
+    if document_ids[-1] - document_ids[0] + 1 == len(document_ids):
+        # The documents are a contiguous range, such as the speeches of a date range
+        start, end = np.searchsorted(all_document_ids, [document_ids[0], document_ids[-1] + 1])
+        return all_document_ids[start:end], term_frequencies[start:end]
+    # Binary search of every posting among the documents, cheaper than sorting both when there are many documents
+    found = document_ids[np.minimum(np.searchsorted(document_ids, all_document_ids), len(document_ids) - 1)] == \
+        all_document_ids
+    return all_document_ids[found], term_frequencies[found]
@@ -0,0 +1,501 @@
+import os
+import threading
+
+import numpy as np
+
+from .builder import SpimiIndexBuilder, merge_posting_chunks, tokenize, DEFAULT_MEMORY_BUDGET
+from .bm25 import BM25
+from .boolean import BooleanQuery, search_boolean_query
+from .files import atomic_write
+from .inverted_index import InvertedIndex, DOCUMENT_DTYPE, search_index, get_average_document_length
+from .lexicon import MAX_EXPANSIONS
+
+# Number of segments after which adding documents starts a background merge
+DEFAULT_MAX_SEGMENTS = 8
+# Files that may belong to a segment, as suffixes of its index file
+SEGMENT_FILE_SUFFIXES = ("", "-lexicon", "-documents.npy", "-metadata", "-ngrams", "-positions", "-tier", "-catalog",
+                         "-lengths")
+
+
+def remove_index_files(index_names: list[str]) -> None:
+    """
+    Deletes every file of the indexes with the given names, such as segments that have been merged.
+    """
+    for index_name in index_names:
+        for suffix in SEGMENT_FILE_SUFFIXES:
+            file_name = "index/{}{}".format(index_name, suffix)
+            if not os.path.exists(file_name):
+                continue
+            try:
+                os.remove(file_name)
+            except OSError:
+                # Some platforms do not allow removing files that are still open. Such files are no longer in the
+                # manifest, so they are simply left behind.
+                pass
+
+
+def _read_segment(segment: InvertedIndex, document_offset: int, positions: bool):
+    """
+    Generator iterating over the posting lists of a segment in lexicon order, in the same format as the runs of
+    SpimiIndexBuilder, so that segments can be merged with merge_posting_chunks.
+    :param document_offset: Number added to every document id of the segment
+    :param positions: Include the positions of the postings
+    """
+    for term_id in range(len(segment.lexicon)):
+        term = segment.lexicon.get_term(term_id)
+        document_ids, term_frequencies = segment.get_postings(term)
+        if positions:
+            yield segment.lexicon[term_id], document_ids + document_offset, term_frequencies, \
+                segment.get_positions(term)[1]
+        else:
+            yield segment.lexicon[term_id], document_ids + document_offset, term_frequencies
+
+
+class SegmentSet:
+    """
+    An immutable list of segments, searched as a single index. The document ids of each segment are offset by the
+    number of documents in the segments before it. The number of documents and the document frequencies are calculated
+    over all segments, so scores are the same as the ones of a single index containing every document.
+    """
+
+    def __init__(self, segment_names: list[str], segments: list[InvertedIndex]):
+        self.segment_names = segment_names
+        self.segments = segments
+        # Global id of the first document of each segment
+        self.first_document_ids = np.cumsum([0] + [segment.total_documents for segment in segments])[:-1].tolist()
+        if len(segments) == 1:
+            self.documents = segments[0].documents
+        else:
+            self.documents = np.concatenate([np.zeros(0, dtype=DOCUMENT_DTYPE)] +
+                                            [segment.documents for segment in segments])
+        self.lengths = self.documents["length"]
+        self.total_documents = len(self.documents)
+        self.total_tokens = sum(segment.total_tokens for segment in segments)
+        self.average_document_length = get_average_document_length(self.total_tokens, self.total_documents)
+        # Positions are only available if every segment stores them
+        self.positional = len(segments) > 0 and all(segment.positional for segment in segments)
+        # First tiers are used if any segment has one. Segments without a tier return their full posting lists.
+        self.tier_size = max((segment.tier_size for segment in segments if segment.tier_size), default=None)
+
+    def get_document_frequency(self, term: str) -> int:
+        return sum(segment.get_document_frequency(term) for segment in self.segments)
+
+    def get_max_weight(self, term: str) -> float:
+        return max((segment.get_max_weight(term) for segment in self.segments), default=0.0)
+
+    def expand_pattern(self, pattern: str, max_terms=MAX_EXPANSIONS) -> list[str]:
+        """
+        Find the terms of any segment matching a pattern. See InvertedIndex.expand_pattern.
+        """
+        terms = sorted(set(term for segment in self.segments for term in segment.expand_pattern(pattern, max_terms)))
+        if len(terms) > max_terms:
+            # Keep the terms that are the most frequent over all segments
+            most_frequent = sorted(terms, key=lambda term: -self.get_document_frequency(term))[:max_terms]
+            terms = sorted(most_frequent)
+        return terms
+
+    def get_vocabulary(self) -> tuple[list[str], np.ndarray]:
+        """
+        Get every term of any segment along with its document frequency over all segments. See
+        InvertedIndex.get_vocabulary.
+        """
+        if len(self.segments) == 1:
+            return self.segments[0].get_vocabulary()
+        document_frequencies = {}
+        for segment in self.segments:
+            terms, segment_document_frequencies = segment.get_vocabulary()
+            for term, document_frequency in zip(terms, segment_document_frequencies.tolist()):
+                document_frequencies[term] = document_frequencies.get(term, 0) + document_frequency
+        terms = sorted(document_frequencies)
+        return terms, np.array([document_frequencies[term] for term in terms], dtype=np.int64)
+
+    def get_similar_terms(self, term: str, max_distance=None) -> list[tuple[str, int]]:
+        """
+        Find the terms of any segment within a small edit distance of a term. See InvertedIndex.get_similar_terms.
+        """
+        distances = {}
+        for segment in self.segments:
+            for similar_term, distance in segment.get_similar_terms(term, max_distance):
+                distances[similar_term] = min(distance, distances.get(similar_term, distance))
+        # Closest first, and then the most frequent over all segments
+        return sorted(distances.items(), key=lambda similar_term: (similar_term[1],
+                                                                   -self.get_document_frequency(similar_term[0]),
+                                                                   similar_term[0]))
+
+    def get_postings(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Gets the posting list of the given term across all segments, with global document ids.
+        """
+        document_ids = [np.zeros(0, dtype=np.int64)]
+        term_frequencies = [np.zeros(0, dtype=np.int64)]
+        for segment, first_document_id in zip(self.segments, self.first_document_ids):
+            segment_document_ids, segment_term_frequencies = segment.get_postings(term)
+            document_ids.append(segment_document_ids + first_document_id)
+            term_frequencies.append(segment_term_frequencies)
+        return np.concatenate(document_ids), np.concatenate(term_frequencies)
+
+    def get_blocks(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Gets the block tables of the posting lists of the term in every segment, one after the other, with global
+        document ids. See InvertedIndex.get_blocks.
+        """
+        last_document_ids = [np.zeros(0, dtype=np.int64)]
+        max_term_frequencies = [np.zeros(0, dtype=np.int64)]
+        for segment, first_document_id in zip(self.segments, self.first_document_ids):
+            segment_last_document_ids, segment_max_term_frequencies = segment.get_blocks(term)
+            last_document_ids.append(segment_last_document_ids + first_document_id)
+            max_term_frequencies.append(segment_max_term_frequencies)
+        return np.concatenate(last_document_ids), np.concatenate(max_term_frequencies)
+
+    def get_block_postings(self, term: str, blocks: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Decodes some blocks of the table returned by get_blocks, with global document ids. See
+        InvertedIndex.get_block_postings.
+        """
+        blocks = np.asarray(blocks, dtype=np.int64)
+        document_ids = [np.zeros(0, dtype=np.int64)]
+        term_frequencies = [np.zeros(0, dtype=np.int64)]
+        first_block = 0
+        for segment, first_document_id in zip(self.segments, self.first_document_ids):
+            end_block = first_block + len(segment.get_blocks(term)[0])
+            segment_blocks = blocks[(blocks >= first_block) & (blocks < end_block)] - first_block
+            if len(segment_blocks):
+                segment_document_ids, segment_term_frequencies = segment.get_block_postings(term, segment_blocks)
+                document_ids.append(segment_document_ids + first_document_id)
+                term_frequencies.append(segment_term_frequencies)
+            first_block = end_block
+        return np.concatenate(document_ids), np.concatenate(term_frequencies)
+
+    def get_tier_postings(self, term: str) -> tuple[np.ndarray, np.ndarray, float]:
+        """
+        Gets the postings of the term in the first tier of every segment, with global document ids. See
+        InvertedIndex.get_tier_postings.
+        """
+        document_ids = [np.zeros(0, dtype=np.int64)]
+        term_frequencies = [np.zeros(0, dtype=np.int64)]
+        impact_bound = 0.0
+        for segment, first_document_id in zip(self.segments, self.first_document_ids):
+            segment_document_ids, segment_term_frequencies, segment_impact_bound = segment.get_tier_postings(term)
+            document_ids.append(segment_document_ids + first_document_id)
+            term_frequencies.append(segment_term_frequencies)
+            impact_bound = max(impact_bound, segment_impact_bound)
+        return np.concatenate(document_ids), np.concatenate(term_frequencies), impact_bound
+
+    def __split_documents(self, document_ids: np.ndarray):
+        """
+        Generator splitting sorted global document ids by segment.
+        :return: tuples of (segment, id of its first document, local ids of the given documents in it)
+        """
+        bounds = np.searchsorted(document_ids, self.first_document_ids + [self.total_documents])
+        for segment_index, (segment, first_document_id) in enumerate(zip(self.segments, self.first_document_ids)):
+            local_document_ids = document_ids[bounds[segment_index]:bounds[segment_index + 1]] - first_document_id
+            if len(local_document_ids):
+                yield segment, first_document_id, local_document_ids
+
+    def intersect_postings(self, term: str, document_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Gets the postings of the term in the given documents only. See InvertedIndex.intersect_postings.
+        """
+        document_ids = np.asarray(document_ids, dtype=np.int64)
+        found_document_ids = [np.zeros(0, dtype=np.int64)]
+        term_frequencies = [np.zeros(0, dtype=np.int64)]
+        for segment, first_document_id, local_document_ids in self.__split_documents(document_ids):
+            segment_document_ids, segment_term_frequencies = segment.intersect_postings(term, local_document_ids)
+            found_document_ids.append(segment_document_ids + first_document_id)
+            term_frequencies.append(segment_term_frequencies)
+        return np.concatenate(found_document_ids), np.concatenate(term_frequencies)
+
+    def get_positions(self, term: str, document_ids=None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Gets the positions of the term in some of the documents containing it, across all segments. See
+        InvertedIndex.get_positions.
+        """
+        term_frequencies = [np.zeros(0, dtype=np.int64)]
+        positions = [np.zeros(0, dtype=np.int64)]
+        if document_ids is None:
+            split_documents = [(segment, 0, None) for segment in self.segments]
+        else:
+            split_documents = self.__split_documents(np.asarray(document_ids, dtype=np.int64))
+        for segment, _, segment_document_ids in split_documents:
+            segment_term_frequencies, segment_positions = segment.get_positions(term, segment_document_ids)
+            term_frequencies.append(segment_term_frequencies)
+            positions.append(segment_positions)
+        return np.concatenate(term_frequencies), np.concatenate(positions)
+
+    def search(self, query_tokens, number_of_results=10, dynamic_pruning=False, phrases=None,
+               documents=None, bm25: BM25 = None) -> list[int]:
+        return search_index(self, query_tokens, number_of_results, dynamic_pruning, phrases, documents, bm25)
+
+
+class SegmentedIndex:
+    """
+    An inverted index made of immutable segments, so that new speeches can be indexed without rebuilding the whole
+    index. New documents are indexed into a small new segment, which is searched together with the existing ones. When
+    there are too many segments, they are merged into one in a background thread. Searches keep using the old segments
+    until the merged one is complete.
+    The segments are listed, in document order, in a manifest file. An index created before segments were introduced
+    is opened as a single segment. The manifest is read again whenever it changes on disk, so that a running server
+    sees the segments appended or merged by another process.
+    """
+
+    def __init__(self, index_file_name="index", max_segments=DEFAULT_MAX_SEGMENTS):
+        """
+        Opens an existing index.
+        :param index_file_name: The file name of the index
+        :param max_segments: Number of segments after which adding documents starts a background merge
+        """
+        self.index_file_name = index_file_name
+        self.manifest_file_name = self.__get_manifest_file_name(index_file_name)
+        self.max_segments = max_segments
+        # Held while the list of segments is replaced
+        self.lock = threading.Lock()
+        # Held during a merge, so that only one merge runs at a time
+        self.merge_lock = threading.Lock()
+        self.merge_thread = None
+        # Modification time and size of the manifest when the segments were last read, used to notice when another
+        # process changes them
+        self.manifest_status = self.__get_manifest_status()
+        segment_names = self.__read_manifest()
+        self.__segment_set = SegmentSet(segment_names, [InvertedIndex(name) for name in segment_names])
+        # Incremented every time the segments are replaced, so that results cached for older segments can be discarded
+        self.__version = 0
+        # Number used in the name of the next new segment
+        self.next_generation = 1 + max([int(name.rsplit("-", 1)[1]) for name in segment_names
+                                        if name.startswith(self.__get_segment_prefix(index_file_name))], default=0)
+
+    @staticmethod
+    def __get_manifest_file_name(index_file_name: str) -> str:
+        return "index/{}-segments".format(index_file_name)
+
+    @staticmethod
+    def __get_segment_prefix(index_file_name: str) -> str:
+        return "{}-segment-".format(index_file_name)
+
+    def __read_manifest(self) -> list[str]:
+        if os.path.exists(self.manifest_file_name):
+            with open(self.manifest_file_name, "r", encoding="utf8") as manifest:
+                return manifest.read().split()
+        if os.path.exists("index/{}".format(self.index_file_name)):
+            return [self.index_file_name]
+        return []
+
+    def __get_manifest_status(self):
+        """
+        Get the modification time and size of the manifest. An index without a manifest is a single segment, so the
+        ones of its lexicon are used instead, since the lexicon is replaced when the index is rebuilt.
+        :return: tuple with the file name, modification time and size, or None if neither file exists
+        """
+        for file_name in (self.manifest_file_name, "index/{}-lexicon".format(self.index_file_name)):
+            try:
+                file_status = os.stat(file_name)
+                return file_name, file_status.st_mtime_ns, file_status.st_size
+            except FileNotFoundError:
+                pass
+        return None
+
+    def reload(self) -> None:
+        """
+        Opens the segments again if the manifest changed on disk since they were last read, such as when another process
+        adds documents to the index or rebuilds it. Segments still used by running searches stay usable.
+        """
+        if self.__get_manifest_status() == self.manifest_status:
+            return
+        with self.lock:
+            # Read the status before the manifest, so that a change made in the meantime is noticed next time
+            manifest_status = self.__get_manifest_status()
+            if manifest_status == self.manifest_status:
+                return
+            segment_names = self.__read_manifest()
+            self.__segment_set = SegmentSet(segment_names, [InvertedIndex(name) for name in segment_names])
+            self.manifest_status = manifest_status
+            self.__version += 1
+            self.next_generation = max([self.next_generation] + [
+                int(name.rsplit("-", 1)[1]) + 1 for name in segment_names
+                if name.startswith(self.__get_segment_prefix(self.index_file_name))])
+
+    @property
+    def segment_set(self) -> SegmentSet:
+        """
+        The current segments, read again first if they changed on disk. See reload.
+        """
+        self.reload()
+        return self.__segment_set
+
+    @property
+    def version(self) -> int:
+        """
+        Number incremented every time the segments change, either in this process or on disk.
+        """
+        self.reload()
+        return self.__version
+
+    @property
+    def total_documents(self) -> int:
+        return self.segment_set.total_documents
+
+    @property
+    def documents(self) -> np.ndarray:
+        return self.segment_set.documents
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return self.segment_set.lengths
+
+    @property
+    def average_document_length(self) -> float:
+        return self.segment_set.average_document_length
+
+    @property
+    def positional(self) -> bool:
+        return self.segment_set.positional
+
+    @property
+    def tier_size(self):
+        return self.segment_set.tier_size
+
+    def get_segment_names(self) -> list[str]:
+        return list(self.segment_set.segment_names)
+
+    def get_document_frequency(self, term: str) -> int:
+        return self.segment_set.get_document_frequency(term)
+
+    def get_max_weight(self, term: str) -> float:
+        return self.segment_set.get_max_weight(term)
+
+    def expand_pattern(self, pattern: str, max_terms=MAX_EXPANSIONS) -> list[str]:
+        return self.segment_set.expand_pattern(pattern, max_terms)
+
+    def get_vocabulary(self) -> tuple[list[str], np.ndarray]:
+        return self.segment_set.get_vocabulary()
+
+    def get_similar_terms(self, term: str, max_distance=None) -> list[tuple[str, int]]:
+        return self.segment_set.get_similar_terms(term, max_distance)
+
+    def get_postings(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        return self.segment_set.get_postings(term)
+
+    def get_blocks(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        return self.segment_set.get_blocks(term)
+
+    def get_block_postings(self, term: str, blocks: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        return self.segment_set.get_block_postings(term, blocks)
+
+    def get_tier_postings(self, term: str) -> tuple[np.ndarray, np.ndarray, float]:
+        return self.segment_set.get_tier_postings(term)
+
+    def intersect_postings(self, term: str, document_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        return self.segment_set.intersect_postings(term, document_ids)
+
+    def get_positions(self, term: str, document_ids=None) -> tuple[np.ndarray, np.ndarray]:
+        return self.segment_set.get_positions(term, document_ids)
+
+    def search(self, query_tokens, number_of_results=10, dynamic_pruning=False, phrases=None,
+               documents=None, bm25: BM25 = None) -> list[int]:
+        """
+        Searches all segments for documents matching the query. See InvertedIndex.search.
+        """
+        # The whole query is evaluated on the same segments, even if they are replaced in the meantime
+        return self.segment_set.search(query_tokens, number_of_results, dynamic_pruning, phrases, documents, bm25)
+
+    def search_boolean_query(self, query: BooleanQuery, number_of_results=10, documents=None, bm25: BM25 = None) \
+            -> list[int]:
+        """
+        Ranks the documents of all segments matching a boolean query. See search_boolean_query.
+        """
+        # The whole query is evaluated on the same segments, even if they are replaced in the meantime
+        return search_boolean_query(self.segment_set, query, number_of_results, documents, bm25)
+
+    def add_documents(self, processed_speeches, memory_budget=DEFAULT_MEMORY_BUDGET) -> None:
+        """
+        Indexes the given speeches into a new segment. They get the document ids following the ones already in the
+        index.
+        :param processed_speeches: Iterable with the contents of each speech, with the same preprocessing applied as in
+                                   the processed speeches file
+        :param memory_budget: Approximate number of bytes the in-memory postings may use
+        """
+        # New segments store positions if all the existing ones do, and have a first tier if any of them does
+        positional = self.positional or not self.segment_set.segments
+        builder = SpimiIndexBuilder(memory_budget=memory_budget, temporary_directory="index", positions=positional)
+        for processed_speech in processed_speeches:
+            builder.add_document(tokenize(processed_speech))
+        if builder.total_documents == 0:
+            return
+        segment_name = self.__get_new_segment_name()
+        segment = InvertedIndex(segment_name, replace=True, positions=positional, tier_size=self.tier_size)
+        builder.build(segment)
+        with self.lock:
+            segment_set = self.__segment_set
+            self.__replace_segments(segment_set.segment_names + [segment_name], segment_set.segments + [segment])
+        if len(self.segment_set.segments) > self.max_segments:
+            self.merge_in_background()
+
+    def merge(self) -> None:
+        """
+        Merges all the segments into one. Searches use the old segments until the merge is complete. Segments added
+        during the merge are kept after the merged one.
+        """
+        with self.merge_lock:
+            segment_set = self.segment_set
+            if len(segment_set.segments) <= 1:
+                return
+            segment_name = self.__get_new_segment_name()
+            merged = InvertedIndex(segment_name, replace=True, positions=segment_set.positional,
+                                   tier_size=segment_set.tier_size)
+            runs = [_read_segment(segment, first_document_id, segment_set.positional)
+                    for segment, first_document_id in zip(segment_set.segments, segment_set.first_document_ids)]
+            merged.populate_from_postings(np.array(segment_set.documents), merge_posting_chunks(runs))
+            with self.lock:
+                added_segments = len(segment_set.segments)
+                current_set = self.__segment_set
+                self.__replace_segments([segment_name] + current_set.segment_names[added_segments:],
+                                        [merged] + current_set.segments[added_segments:])
+            remove_index_files(segment_set.segment_names)
+
+    def merge_in_background(self) -> threading.Thread:
+        """
+        Starts merging the segments in a background thread, unless a merge is already running.
+        :return: the thread running the merge
+        """
+        with self.lock:
+            if self.merge_thread is None or not self.merge_thread.is_alive():
+                # The thread does not keep the process alive. An interrupted merge leaves the index unchanged.
+                self.merge_thread = threading.Thread(target=self.merge, daemon=True)
+                self.merge_thread.start()
+            return self.merge_thread
+
+    def wait_for_merge(self) -> None:
+        """
+        Waits for a running background merge to complete.
+        """
+        if self.merge_thread is not None:
+            self.merge_thread.join()
+
+    def __get_new_segment_name(self) -> str:
+        with self.lock:
+            segment_name = "{}{}".format(self.__get_segment_prefix(self.index_file_name), self.next_generation)
+            self.next_generation += 1
+        return segment_name
+
+    def __replace_segments(self, segment_names: list[str], segments: list[InvertedIndex]) -> None:
+        """
+        Stores the new list of segments in the manifest and starts using them. Must be called with the lock held.
+        """
+        with atomic_write(self.manifest_file_name, "w", encoding="utf8") as manifest:
+            manifest.writelines("{}\n".format(segment_name) for segment_name in segment_names)
+        self.__segment_set = SegmentSet(segment_names, segments)
+        self.manifest_status = self.__get_manifest_status()
+        self.__version += 1
+
+    @staticmethod
+    def remove_segments(index_file_name="index") -> None:
+        """
+        Deletes the manifest of an index and every segment added to it, keeping only the index with the given name.
+        Used before the index is rebuilt from scratch.
+        """
+        manifest_file_name = SegmentedIndex.__get_manifest_file_name(index_file_name)
+        if not os.path.exists(manifest_file_name):
+            return
+        with open(manifest_file_name, "r", encoding="utf8") as manifest:
+            segment_names = [name for name in manifest.read().split() if name != index_file_name]
+        os.remove(manifest_file_name)
+        remove_index_files(segment_names)
@@ -0,0 +1,365 @@
+import multiprocessing
+import os
+import threading
+from contextlib import ExitStack
+
+import numpy as np
+
+from .bm25 import BM25
+from .boolean import BooleanQuery, expand_wildcards, search_boolean_query
+from .builder import merge_posting_chunks
+from .files import atomic_write
+from .inverted_index import InvertedIndex, get_best_scores, score_documents, search_index
+from .lexicon import MAX_EXPANSIONS
+from .segments import SegmentSet, SegmentedIndex, remove_index_files
+
+# Default maximum number of shards an index is split into
+DEFAULT_MAX_SHARDS = 8
+
+
+def find_shard_boundaries(values, max_shards=DEFAULT_MAX_SHARDS) -> list[int]:
+    """
+    Split consecutive speeches into shards, such as the speeches of every parliamentary period. A new shard starts
+    wherever the value changes. If that makes too many shards, only the changes closest to splitting the speeches into
+    max_shards equal parts start a new one.
+    :param values: the value of every speech, in speech order, such as its parliamentary period or the year of its
+                   sitting
+    :return: the id of the first speech of every shard, followed by the number of speeches
+    """
+    values = np.asarray(values)
+    if len(values) == 0:
+        return [0]
+    changes = np.flatnonzero(values[1:] != values[:-1]) + 1
+    if len(changes) >= max_shards:
+        equal_boundaries = np.arange(1, max_shards) * len(values) / max_shards
+        changes = np.unique(changes[np.abs(changes[None, :] - equal_boundaries[:, None]).argmin(axis=1)])
+    return [0] + changes.tolist() + [len(values)]
+
+
+def _read_document_range(index, start: int, end: int, positions: bool):
+    """
+    Generator iterating over the postings of the documents in a range of ids, in the same format as the runs of
+    SpimiIndexBuilder, so that they can be written with merge_posting_chunks. The ids of the documents start from 0.
+    :param positions: Include the positions of the postings
+    """
+    terms, _ = index.get_vocabulary()
+    for term in terms:
+        document_ids, term_frequencies = index.get_postings(term)
+        first, last = np.searchsorted(document_ids, [start, end]).tolist()
+        if first == last:
+            continue
+        if positions:
+            yield term.encode("utf8"), document_ids[first:last] - start, term_frequencies[first:last], \
+                index.get_positions(term, document_ids[first:last])[1]
+        else:
+            yield term.encode("utf8"), document_ids[first:last] - start, term_frequencies[first:last]
+
+
+def create_shards(index_file_name: str, boundaries: list[int]) -> list[str]:
+    """
+    Split an index into shards of consecutive documents, which are listed in a manifest and searched by ShardedIndex.
+    Every shard is a separate index, with the positions and the first tier of the original one if it has them. The
+    original index is left as is. The shards no longer match it once it is rebuilt or documents are added to it, so
+    they have to be removed then, see ShardedIndex.remove_shards, and created again.
+    :param index_file_name: The file name of the index, which may have segments
+    :param boundaries: the id of the first document of every shard, followed by the number of documents. See
+                       find_shard_boundaries.
+    :return: the names of the shards
+    """
+    index = SegmentedIndex(index_file_name)
+    if boundaries[0] != 0 or boundaries[-1] != index.total_documents:
+        raise ValueError("The shards must contain all {} documents of the index.".format(index.total_documents))
+    shard_names = []
+    for shard_number, (start, end) in enumerate(zip(boundaries, boundaries[1:])):
+        shard_name = "{}-shard-{}".format(index_file_name, shard_number)
+        shard = InvertedIndex(shard_name, replace=True, positions=index.positional, tier_size=index.tier_size)
+        shard.populate_from_postings(np.array(index.documents[start:end]),
+                                     merge_posting_chunks([_read_document_range(index, start, end, index.positional)]))
+        shard_names.append(shard_name)
+    with atomic_write(ShardedIndex.get_manifest_file_name(index_file_name), "w", encoding="utf8") as manifest:
+        manifest.writelines("{}\n".format(shard_name) for shard_name in shard_names)
+    return shard_names
+
+
+class ShardView:
+    """
+    A shard searched with the statistics of the whole index, so that its documents get the same scores as in a single
+    index containing every shard. The number of documents, their average length and the document frequencies are the
+    ones of all shards, while the postings and the documents come from the shard.
+    """
+
+    def __init__(self, shard: InvertedIndex, total_documents: int, average_document_length: float,
+                 document_frequencies: dict[str, int]):
+        """
+        :param document_frequencies: number of documents of all shards containing each term of the query
+        """
+        self.shard = shard
+        self.total_documents = total_documents
+        self.average_document_length = average_document_length
+        self.document_frequencies = document_frequencies
+        self.documents = shard.documents
+        self.lengths = shard.lengths
+        self.positional = shard.positional
+        self.tier_size = shard.tier_size
+
+    def get_document_frequency(self, term: str) -> int:
+        return self.document_frequencies.get(term, 0)
+
+    def get_max_weight(self, term: str) -> float:
+        return self.shard.get_max_weight(term)
+
+    def expand_pattern(self, pattern: str, max_terms=MAX_EXPANSIONS) -> list[str]:
+        return self.shard.expand_pattern(pattern, max_terms)
+
+    def get_postings(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        return self.shard.get_postings(term)
+
+    def get_blocks(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        return self.shard.get_blocks(term)
+
+    def get_block_postings(self, term: str, blocks: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        return self.shard.get_block_postings(term, blocks)
+
+    def get_tier_postings(self, term: str) -> tuple[np.ndarray, np.ndarray, float]:
+        return self.shard.get_tier_postings(term)
+
+    def intersect_postings(self, term: str, document_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        return self.shard.intersect_postings(term, document_ids)
+
+    def get_positions(self, term: str, document_ids=None) -> tuple[np.ndarray, np.ndarray]:
+        return self.shard.get_positions(term, document_ids)
+
+    def search(self, query_tokens, number_of_results=10, dynamic_pruning=False, phrases=None,
+               documents=None, bm25: BM25 = None) -> list[int]:
+        return search_index(self, query_tokens, number_of_results, dynamic_pruning, phrases, documents, bm25)
+
+
+def _search_shard(shard: InvertedIndex, request: tuple) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Ranks the documents of a shard for a boolean query, with the statistics of the whole index.
+    :param request: tuple with the query, with its patterns already expanded, the number of results, the sorted ids of
+                    the documents of the shard that may match or None, the BM25 parameters or None, and the number of
+                    documents, the average document length and the document frequencies of all shards
+    :return: tuple with the sorted ids of the best documents of the shard and their scores
+    """
+    query, number_of_results, documents, bm25, total_documents, average_document_length, document_frequencies = \
+        request
+    view = ShardView(shard, total_documents, average_document_length, document_frequencies)
+    document_ids = np.sort(np.array(search_boolean_query(view, query, number_of_results, documents, bm25),
+                                    dtype=np.int64))
+    return document_ids, score_documents(view, query.get_scoring_terms(), document_ids, bm25)
+
+
+def _serve_shard(shard_name: str, connection) -> None:
+    """
+    Answers the requests sent to a shard, until None is received. Runs in a worker process.
+    """
+    shard = InvertedIndex(shard_name)
+    while (request := connection.recv()) is not None:
+        try:
+            connection.send((_search_shard(shard, request), None))
+        except Exception as error:
+            connection.send((None, error))
+    connection.close()
+
+
+class ShardedIndex:
+    """
+    An index split into shards of consecutive documents, such as the speeches of every parliamentary period, each one
+    searched by a separate worker process. A query is sent to every shard that may contain matching documents, along
+    with the statistics of the whole index, and the best documents of every shard are merged by their scores. So the
+    results are the same as the ones of the index the shards were created from. See create_shards.
+    The rest of the methods of an index are answered in the calling process, from the shards opened as segments.
+
+    Every worker searches one query at a time, and its connection is locked from sending it a request until its
+    response is received, so that every response belongs to the right query. So queries sent to the same shards are
+    searched one after the other, while queries restricted to different shards, such as to different periods, are
+    searched at the same time. Shards are opened once, so they are only replaced by newly created ones when the index
+    is opened again.
+    """
+
+    def __init__(self, index_file_name="index", processes=True):
+        """
+        Opens the shards of an index.
+        :param processes: Search every shard in its own worker process. Otherwise the shards are searched one after
+                          the other in the calling process.
+        """
+        with open(self.get_manifest_file_name(index_file_name), "r", encoding="utf8") as manifest:
+            shard_names = manifest.read().split()
+        self.segment_set = SegmentSet(shard_names, [InvertedIndex(shard_name) for shard_name in shard_names])
+        # The shards never change, so results can be cached for as long as they are open
+        self.version = 0
+        # The lock of the connection to every worker
+        self.locks = []
+        self.connections = []
+        self.processes = []
+        if processes:
+            context = multiprocessing.get_context("spawn")
+            for shard_name in shard_names:
+                connection, worker_connection = context.Pipe()
+                process = context.Process(target=_serve_shard, args=(shard_name, worker_connection), daemon=True)
+                process.start()
+                worker_connection.close()
+                self.locks.append(threading.Lock())
+                self.connections.append(connection)
+                self.processes.append(process)
+
+    @staticmethod
+    def get_manifest_file_name(index_file_name: str) -> str:
+        return "index/{}-shards".format(index_file_name)
+
+    @staticmethod
+    def exists(index_file_name="index") -> bool:
+        """
+        Check whether the index has been split into shards.
+        """
+        return os.path.exists(ShardedIndex.get_manifest_file_name(index_file_name))
+
+    @staticmethod
+    def remove_shards(index_file_name="index") -> None:
+        """
+        Deletes the manifest and every shard of an index, so that the index is searched as a whole. Used before the
+        index is rebuilt or documents are added to it, since the shards would no longer match it.
+        """
+        manifest_file_name = ShardedIndex.get_manifest_file_name(index_file_name)
+        if not os.path.exists(manifest_file_name):
+            return
+        with open(manifest_file_name, "r", encoding="utf8") as manifest:
+            shard_names = manifest.read().split()
+        os.remove(manifest_file_name)
+        remove_index_files(shard_names)
+
+    def close(self) -> None:
+        """
+        Stops the worker processes.
+        """
+        with ExitStack() as stack:
+            for lock in self.locks:
+                stack.enter_context(lock)
+            for connection, process in zip(self.connections, self.processes):
+                connection.send(None)
+                process.join()
+                connection.close()
+            self.connections = []
+            self.processes = []
+
+    @property
+    def total_documents(self) -> int:
+        return self.segment_set.total_documents
+
+    @property
+    def documents(self) -> np.ndarray:
+        return self.segment_set.documents
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return self.segment_set.lengths
+
+    @property
+    def average_document_length(self) -> float:
+        return self.segment_set.average_document_length
+
+    @property
+    def positional(self) -> bool:
+        return self.segment_set.positional
+
+    @property
+    def tier_size(self):
+        return self.segment_set.tier_size
+
+    def get_shard_names(self) -> list[str]:
+        return list(self.segment_set.segment_names)
+
+    def get_document_frequency(self, term: str) -> int:
+        return self.segment_set.get_document_frequency(term)
+
+    def get_max_weight(self, term: str) -> float:
+        return self.segment_set.get_max_weight(term)
+
+    def expand_pattern(self, pattern: str, max_terms=MAX_EXPANSIONS) -> list[str]:
+        return self.segment_set.expand_pattern(pattern, max_terms)
+
+    def get_vocabulary(self) -> tuple[list[str], np.ndarray]:
+        return self.segment_set.get_vocabulary()
+
+    def get_similar_terms(self, term: str, max_distance=None) -> list[tuple[str, int]]:
+        return self.segment_set.get_similar_terms(term, max_distance)
+
+    def get_postings(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        return self.segment_set.get_postings(term)
+
+    def get_blocks(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        return self.segment_set.get_blocks(term)
+
+    def get_block_postings(self, term: str, blocks: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        return self.segment_set.get_block_postings(term, blocks)
+
+    def get_tier_postings(self, term: str) -> tuple[np.ndarray, np.ndarray, float]:
+        return self.segment_set.get_tier_postings(term)
+
+    def intersect_postings(self, term: str, document_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        return self.segment_set.intersect_postings(term, document_ids)
+
+    def get_positions(self, term: str, document_ids=None) -> tuple[np.ndarray, np.ndarray]:
+        return self.segment_set.get_positions(term, document_ids)
+
+    def search(self, query_tokens, number_of_results=10, dynamic_pruning=False, phrases=None,
+               documents=None, bm25: BM25 = None) -> list[int]:
+        """
+        Searches all shards for documents matching the query, in the calling process. See InvertedIndex.search.
+        """
+        return self.segment_set.search(query_tokens, number_of_results, dynamic_pruning, phrases, documents, bm25)
+
+    def search_boolean_query(self, query: BooleanQuery, number_of_results=10, documents=None, bm25: BM25 = None) \
+            -> list[int]:
+        """
+        Ranks the documents matching a boolean query, sending the query to the shards that contain any of the
+        documents that may match. See search_boolean_query.
+        :param documents: sorted ids of the only documents that may match, such as the speeches of a date range.
+                          Shards without any of them are not searched.
+        """
+        # Patterns are expanded to the terms of all shards, so that every shard scores the same terms
+        query = expand_wildcards(self, query)
+        document_frequencies = {term: self.get_document_frequency(term) for term in query.get_terms()}
+        if documents is not None:
+            documents = np.asarray(documents, dtype=np.int64)
+        requests = []
+        for shard_number, first_document_id in enumerate(self.segment_set.first_document_ids):
+            shard_documents = None
+            if documents is not None:
+                end = first_document_id + self.segment_set.segments[shard_number].total_documents
+                shard_documents = documents[np.searchsorted(documents, first_document_id):
+                                            np.searchsorted(documents, end)] - first_document_id
+                if len(shard_documents) == 0:
+                    continue
+            requests.append((shard_number, (query, number_of_results, shard_documents, bm25, self.total_documents,
+                                            self.average_document_length, document_frequencies)))
+        document_ids = [np.zeros(0, dtype=np.int64)]
+        scores = [np.zeros(0)]
+        for (shard_number, _), (shard_document_ids, shard_scores) in zip(requests, self.__send_requests(requests)):
+            document_ids.append(shard_document_ids + self.segment_set.first_document_ids[shard_number])
+            scores.append(shard_scores)
+        # The best documents of every shard are scored the same way, so the best of them are the best overall
+        return get_best_scores(np.concatenate(document_ids), np.concatenate(scores), number_of_results)
+
+    def __send_requests(self, requests: list[tuple[int, tuple]]) -> list[tuple[np.ndarray, np.ndarray]]:
+        """
+        Sends each request to the worker of its shard and waits for all of them to respond. The workers search their
+        shards at the same time.
+        :param requests: tuples with the number of a shard and the request for it. See _search_shard.
+        :return: the response to every request
+        """
+        if not self.connections:
+            return [_search_shard(self.segment_set.segments[shard_number], request)
+                    for shard_number, request in requests]
+        with ExitStack() as stack:
+            # The requests are in shard order, so the locks are always taken in the same order
+            for shard_number, _ in requests:
+                stack.enter_context(self.locks[shard_number])
+            for shard_number, request in requests:
+                self.connections[shard_number].send(request)
+            responses = [self.connections[shard_number].recv() for shard_number, _ in requests]
+        for _, error in responses:
+            if error is not None:
+                raise error
+        return [response for response, _ in responses]
@@ -0,0 +1,66 @@
+import mmap
+import struct
+
+import numpy as np
+
+from .files import atomic_write
+
+TIER_MAGIC = b"GPTR\x01\x00\x00\x00"
+# Magic, number of postings kept for every term, number of terms with a tier
+TIER_HEADER = struct.Struct("<8sQQ")
+
+
+class TierFile:
+    """
+    The first tier of an index: for every term with more than tier_size postings, the tier_size postings with the
+    highest impact, tf / document length, sorted by descending impact. The impact does not depend on the idf of the
+    term, so the order stays valid when the tier is searched along with other segments. The file contains the sorted
+    lexicon ids of the terms with a tier, followed by a tier_size wide row of document ids and one of term frequencies
+    for each of them. Terms with fewer postings are answered from their full posting lists.
+    """
+
+    def __init__(self, tier_file_name: str):
+        self.tier_file = open(tier_file_name, "rb")
+        self.tier_map = mmap.mmap(self.tier_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.tier_size, total_terms = TIER_HEADER.unpack_from(self.tier_map)
+        if magic != TIER_MAGIC:
+            raise RuntimeError("{} is not a tier file.".format(tier_file_name))
+        position = TIER_HEADER.size
+        self.term_ids = np.frombuffer(self.tier_map, dtype=np.uint64, count=total_terms, offset=position)
+        position += self.term_ids.nbytes
+        self.document_ids = np.frombuffer(self.tier_map, dtype=np.uint32, count=total_terms * self.tier_size,
+                                          offset=position).reshape(total_terms, self.tier_size)
+        position += self.document_ids.nbytes
+        self.term_frequencies = np.frombuffer(self.tier_map, dtype=np.uint32, count=total_terms * self.tier_size,
+                                              offset=position).reshape(total_terms, self.tier_size)
+
+    def __len__(self):
+        return len(self.term_ids)
+
+    @staticmethod
+    def write(tier_file_name: str, tier_size: int, term_ids, document_ids, term_frequencies) -> None:
+        """
+        Creates a tier file.
+        :param term_ids: sorted lexicon ids of the terms with a tier
+        :param document_ids: array with a row of tier_size document ids for each term, by descending impact
+        :param term_frequencies: array with the term frequency of each posting in document_ids
+        """
+        with atomic_write(tier_file_name) as tier_file:
+            tier_file.write(TIER_HEADER.pack(TIER_MAGIC, tier_size, len(term_ids)))
+            tier_file.write(np.asarray(term_ids, dtype=np.uint64).tobytes())
+            tier_file.write(np.asarray(document_ids, dtype=np.uint32).tobytes())
+            tier_file.write(np.asarray(term_frequencies, dtype=np.uint32).tobytes())
+
+    def find(self, term_id: int) -> int:
+        """
+        Get the row of the tier of a term.
+        :return: the row, or -1 if the term has no tier
+        """
+        row = int(np.searchsorted(self.term_ids, term_id))
+        return row if row < len(self.term_ids) and int(self.term_ids[row]) == term_id else -1
+
+    def get_postings(self, row: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get the postings of a tier, by descending impact.
+        """
+        return self.document_ids[row].astype(np.int64), self.term_frequencies[row].astype(np.int64)
@@ -0,0 +1,110 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+from dataclasses import dataclass, field, fields
+from datetime import date
+from typing import Optional
+
+from .filters import SpeechFilter
+from .inverted.bm25 import BM25
+from .speech import Speech
+
+# Number of results ranked at once. Pages are served from the ranked list until they go past its end, and then a list
+# twice as deep is ranked.
+RANKING_DEPTH = 100
+# Largest number of results of a page, and largest number of results skipped before a page. A cursor asking for more
+# is rejected, since each page ranks every result up to its end.
+MAX_PAGE_SIZE = 100
+MAX_OFFSET = 10000
+
+
+@dataclass
+class SearchPage:
+    """
+    A page of search results. The cursors can be passed to SpeechBackend.search_page to get the next and the previous
+    page.
+    """
+    query: str
+    speeches: list[Speech]
+    offset: int
+    limit: int
+    # None if this is the last page
+    next_cursor: Optional[str] = None
+    # None if this is the first page
+    previous_cursor: Optional[str] = None
+    # Correction of a query with misspelled words, along with the cursor of its first page. See
+    # SpeechBackend.did_you_mean.
+    suggestion: Optional[str] = None
+    suggestion_cursor: Optional[str] = None
+    # Snippet of each speech with the words matching the query highlighted. See SnippetGenerator.get_snippet.
+    snippets: list[list[tuple[str, bool]]] = field(default_factory=list)
+
+
+def _encode_base64(data: bytes) -> str:
+    # Padding is restored when decoding, so that cursors do not need escaping in URLs
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def _decode_base64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(contents: str, secret_key: bytes) -> str:
+    return _encode_base64(hmac.new(secret_key, contents.encode("utf8"), hashlib.sha256).digest())
+
+
+def encode_cursor(query: str, offset: int, limit: int, speech_filter: SpeechFilter = None, bm25: BM25 = None,
+                  secret_key: bytes = None) -> str:
+    """
+    Creates an opaque cursor pointing to a page of results. The cursor contains everything needed to rank the results
+    again, so it remains valid after the cached ranking expires.
+    :param secret_key: key the cursor is signed with, so that only cursors created with the same key are accepted by
+                       decode_cursor. Cursors are not signed if it is None.
+    """
+    contents = {"query": query, "offset": offset, "limit": limit}
+    if speech_filter is not None:
+        contents["filter"] = {speech_field.name: value.isoformat() if isinstance(value, date) else value
+                              for speech_field in fields(speech_filter)
+                              if (value := getattr(speech_filter, speech_field.name)) is not None}
+    if bm25 is not None:
+        contents["bm25"] = [bm25.k1, bm25.b]
+    encoded = _encode_base64(json.dumps(contents, ensure_ascii=False).encode("utf8"))
+    if secret_key is None:
+        return encoded
+    return "{}.{}".format(encoded, _sign(encoded, secret_key))
+
+
+def decode_cursor(cursor: str, secret_key: bytes = None, max_limit=MAX_PAGE_SIZE, max_offset=MAX_OFFSET) \
+        -> tuple[str, int, int, Optional[SpeechFilter], Optional[BM25]]:
+    """
+    Reads a cursor created by encode_cursor.
+    :param secret_key: key the cursor must be signed with, or None for unsigned cursors
+    :param max_limit: largest number of results of a page
+    :param max_offset: largest number of results skipped before a page
+    :return: tuple with the query, the offset and limit of the page, the speech filter and the BM25 parameters
+    :raises ValueError if the cursor is not valid, not signed with the key, or its page is out of bounds
+    """
+    if secret_key is not None:
+        cursor, _, signature = cursor.partition(".")
+        if not hmac.compare_digest(signature.encode("utf8"), _sign(cursor, secret_key).encode("utf8")):
+            raise ValueError("Invalid cursor signature")
+    try:
+        contents = json.loads(_decode_base64(cursor).decode("utf8"))
+        speech_filter = None
+        if "filter" in contents:
+            filter_values = dict(contents["filter"])
+            for date_field in ("start_date", "end_date"):
+                if date_field in filter_values:
+                    filter_values[date_field] = date.fromisoformat(filter_values[date_field])
+            speech_filter = SpeechFilter(**filter_values)
+        bm25 = BM25(*contents["bm25"]) if "bm25" in contents else None
+        offset = int(contents["offset"])
+        limit = int(contents["limit"])
+        query = str(contents["query"])
+    except (binascii.Error, UnicodeDecodeError, TypeError, KeyError, AttributeError, ValueError) as error:
+        raise ValueError("Invalid cursor {}".format(cursor)) from error
+    if not 0 <= offset <= max_offset or not 0 < limit <= max_limit:
+        raise ValueError("Invalid cursor {}".format(cursor))
+    return query, offset, limit, speech_filter, bm25
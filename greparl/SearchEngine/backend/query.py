@@ -0,0 +1,193 @@
+import re
+from typing import Optional
+
+from .inverted.boolean import BooleanClause, BooleanQuery, Occur, Wildcard
+from .inverted.builder import tokenize
+from .inverted.lexicon import WILDCARDS, get_literal_prefix
+from .inverted.phrase import Phrase
+from ..preprocessing.funcs import process_raw_speech_text, remove_accents
+
+# Parts of a query: parentheses, optionally prefixed with + or -, phrases in double quotes followed by an optional
+# proximity operator, and words. Every part except the closing parenthesis may be prefixed with + or -.
+QUERY_TOKEN_PATTERN = re.compile(r'[+-]?\(|\)|[+-]?"[^"]*"(?:~\d+)?|[^\s()"]+')
+# A phrase followed by an optional proximity operator: "word1 word2"~N matches documents where the words appear in
+# order with at most N other words between them
+PHRASE_PATTERN = re.compile(r'"([^"]*)"(?:~(\d+))?')
+# Operators between clauses. Clauses without an operator between them are optional.
+AND_OPERATOR = "AND"
+OR_OPERATOR = "OR"
+
+
+def process_query_text(text: str) -> list[str]:
+    """
+    Process the free text of a query the same way as the indexed speeches. Stopwords are removed, unless the text only
+    consists of stopwords.
+    """
+    processed_query = process_raw_speech_text(text, perform_stemming=True, delete_stopwords=True)
+    # Check if query only has stopwords
+    if len(processed_query) == 0:
+        processed_query = process_raw_speech_text(text, perform_stemming=True, delete_stopwords=False)
+    return processed_query
+
+
+def _process_words(text: str, delete_stopwords: bool) -> list[str]:
+    """
+    Process some words of a query into the terms of the index.
+    """
+    return tokenize(" ".join(process_raw_speech_text(text, perform_stemming=True, delete_stopwords=delete_stopwords)))
+
+
+def _normalize_pattern(text: str) -> str:
+    """
+    Normalize a term pattern like the processed speeches, keeping its wildcards. The pattern is not stemmed, since it
+    is usually the beginning of the words it is meant to match.
+    """
+    text = re.sub(r"[^\w*?]", "", text.lower())
+    return remove_accents([text])[0].upper()
+
+
+class QueryParser:
+    """
+    Parses the query language of the search:
+    - word: optional term. Documents must contain at least one of the optional terms, unless there are required ones.
+    - +word: required term. -word: excluded term.
+    - "some words": phrase. "some words"~N: the words in order, with at most N other words between them. Phrases of
+      more than one word need the positions of the terms, which indexes only store if created with positions.
+    - a AND b: both a and b are required. a OR b: either a or b. AND binds tighter than OR.
+    - (...): group of clauses, which can be prefixed with + or - like words.
+    - word*, w?rd: term pattern, where * stands for any number of characters and ? for a single one. It matches the
+      terms of the index starting with the part before the first wildcard, so it must not start with a wildcard.
+    Words are processed like the speeches of the index. Optional stopwords are ignored, unless the whole query only
+    consists of stopwords, while required and excluded stopwords are kept.
+    """
+
+    def __init__(self, query: str):
+        self.tokens = QUERY_TOKEN_PATTERN.findall(query)
+        self.position = 0
+        self.keep_stopwords = False
+
+    def parse(self) -> BooleanQuery:
+        query = self.__parse_group(nested=False)
+        if not query.clauses:
+            # The query only has stopwords
+            self.position = 0
+            self.keep_stopwords = True
+            query = self.__parse_group(nested=False)
+        return query
+
+    def __parse_group(self, nested: bool) -> BooleanQuery:
+        """
+        Parse clauses until the end of the group.
+        :param nested: The group is in parentheses, so it ends at the closing one
+        """
+        # Clauses of each alternative separated by OR
+        alternatives = [[]]
+        required_next = False
+        while self.position < len(self.tokens):
+            token = self.tokens[self.position]
+            self.position += 1
+            if token == ")":
+                if nested:
+                    break
+                # Ignore unbalanced closing parentheses
+                continue
+            if token == OR_OPERATOR:
+                alternatives.append([])
+                required_next = False
+                continue
+            if token == AND_OPERATOR:
+                # Both sides of AND are required
+                clauses = alternatives[-1]
+                if clauses and clauses[-1].occur == Occur.SHOULD:
+                    clauses[-1].occur = Occur.MUST
+                required_next = True
+                continue
+            occur = Occur.SHOULD
+            if token[0] in "+-" and len(token) > 1:
+                occur = Occur.MUST if token[0] == "+" else Occur.MUST_NOT
+                token = token[1:]
+            if required_next and occur == Occur.SHOULD:
+                occur = Occur.MUST
+            required_next = False
+            query = self.__parse_clause(token, occur)
+            if query is not None:
+                alternatives[-1].append(BooleanClause(occur, query))
+        alternatives = [clauses for clauses in alternatives if clauses]
+        if len(alternatives) <= 1:
+            return BooleanQuery(alternatives[0] if alternatives else [])
+        # Each alternative is an optional clause of the group
+        group = BooleanQuery()
+        for clauses in alternatives:
+            if len(clauses) == 1 and clauses[0].occur != Occur.MUST_NOT:
+                group.clauses.append(BooleanClause(Occur.SHOULD, clauses[0].query))
+            else:
+                group.clauses.append(BooleanClause(Occur.SHOULD, BooleanQuery(clauses)))
+        return group
+
+    def __parse_clause(self, token: str, occur: Occur):
+        """
+        Parse a word, phrase or group.
+        :return: the query of the clause, or None if it does not contain any terms
+        """
+        if token == "(":
+            query = self.__parse_group(nested=True)
+            return query if query.clauses else None
+        if phrase_match := PHRASE_PATTERN.fullmatch(token):
+            # Stopwords are kept, since they occupy positions in the processed speeches
+            terms = _process_words(phrase_match.group(1), delete_stopwords=False)
+            if len(terms) <= 1:
+                return terms[0] if terms else None
+            return Phrase(terms, int(phrase_match.group(2) or 0))
+        if any(wildcard in token for wildcard in WILDCARDS):
+            pattern = _normalize_pattern(token)
+            if get_literal_prefix(pattern):
+                return Wildcard(pattern)
+            # Patterns starting with a wildcard would require scanning the whole lexicon, so they are treated as words
+            token = re.sub(r"[*?]", "", token)
+        terms = _process_words(token, delete_stopwords=occur == Occur.SHOULD and not self.keep_stopwords)
+        if len(terms) <= 1:
+            return terms[0] if terms else None
+        # A word split into several terms requires all of them
+        return BooleanQuery([BooleanClause(Occur.MUST, term) for term in terms])
+
+
+def _correct_word(index, word: str) -> str:
+    """
+    Correct a word of a query whose term is not in the index, using the closest and most frequent term that is.
+    """
+    terms = _process_words(word, delete_stopwords=True)
+    if len(terms) != 1 or index.get_document_frequency(terms[0]) > 0:
+        return word
+    similar_terms = index.get_similar_terms(terms[0])
+    if not similar_terms:
+        return word
+    correction = similar_terms[0][0]
+    # The term is a stem, so the ending the stemmer removed from the word is put back after the corrected stem
+    normalized_word = _normalize_pattern(word)
+    if normalized_word.startswith(terms[0]):
+        correction += normalized_word[len(terms[0]):]
+    return correction.lower()
+
+
+def suggest_query(index, query: str) -> Optional[str]:
+    """
+    Suggest a correction of a query, replacing the words that are not in the index with the closest words that are,
+    for "did you mean" links. Operators, stopwords and term patterns are kept as they are.
+    :return: the corrected query, or None if all of its words are in the index or cannot be corrected
+    """
+    def correct(word_match: re.Match) -> str:
+        word = word_match.group(0)
+        if word in (AND_OPERATOR, OR_OPERATOR) or any(wildcard in word for wildcard in WILDCARDS):
+            return word
+        return _correct_word(index, word)
+
+    # Words along with any wildcards in them
+    suggestion = re.sub(r"[\w*?]+", correct, query)
+    return suggestion if suggestion != query else None
+
+
+def parse_query(query: str) -> BooleanQuery:
+    """
+    Parse a search query. See QueryParser for the syntax.
+    """
+    return QueryParser(query).parse()
@@ -0,0 +1,129 @@
+import re
+from collections import Counter
+
+# Number of characters of a snippet, as many as the description of a speech
+SNIPPET_LENGTH = 250
+# Maximum number of characters a word may have after the term it matches, which is a stem
+MAX_SUFFIX_LENGTH = 6
+# Every form of the letters of the terms, which are capital and not accented
+LETTER_FORMS = {
+    "Α": "αάΑΆ", "Ε": "εέΕΈ", "Η": "ηήΗΉ", "Ι": "ιίϊΐΙΊΪ", "Ο": "οόΟΌ", "Υ": "υύϋΰΥΎΫ", "Ω": "ωώΩΏ", "Σ": "σςΣ",
+}
+
+
+def _get_term_patterns(term: str) -> list[str]:
+    """
+    Get regular expressions matching a term in a speech, regardless of the case and the accents of its letters. There
+    is an expression for every form of the first letter of the term, since the regular expression engine searches for a
+    single first letter much faster than for any of several ones.
+    """
+    letter_forms = [LETTER_FORMS.get(letter, letter.lower() + letter if letter.lower() != letter else letter)
+                    for letter in term.upper()]
+    rest = "".join("[{}]".format(re.escape(forms)) for forms in letter_forms[1:])
+    return [re.escape(first_letter) + rest for first_letter in letter_forms[0]] if letter_forms else []
+
+
+def _is_word_start(text: str, position: int) -> bool:
+    return position == 0 or not (text[position - 1].isalnum() or text[position - 1] == "_")
+
+
+class SnippetGenerator:
+    """
+    Finds the part of a speech where the terms of a query are the densest, with the words matching them highlighted.
+    The terms are stems, so they are matched against the beginnings of the words of the speech with regular
+    expressions, instead of processing the speech like the indexed speeches. Every term has a separate expression
+    starting with its first letter, which the regular expression engine searches for quickly, so the speech is never
+    copied or processed as a whole.
+    """
+
+    def __init__(self, terms: list[str], prefixes=(), length=SNIPPET_LENGTH):
+        """
+        :param terms: the processed terms of the query
+        :param prefixes: beginnings of words that match regardless of their length, such as the literal prefixes of
+                         term patterns
+        :param length: number of characters of a snippet
+        """
+        self.length = length
+        # The expressions of every term, along with the index of the term
+        self.term_regexes = []
+        # Words may only have a few more letters than a term, but any number of letters after a prefix
+        term_suffixes = [(term, r"\w{{0,{}}}(?!\w)".format(MAX_SUFFIX_LENGTH)) for term in sorted(set(terms))] + \
+                        [(prefix, r"\w*") for prefix in sorted(set(prefixes))]
+        for term_index, (term, suffix) in enumerate(term_suffixes):
+            self.term_regexes.extend((term_index, re.compile(pattern + suffix)) for pattern in _get_term_patterns(term))
+
+    def get_snippet(self, text: str) -> list[tuple[str, bool]]:
+        """
+        Get the snippet of a speech.
+        :return: list of tuples with the consecutive fragments of the snippet and whether each of them is highlighted.
+                 If no word of the speech matches the terms, the snippet is the beginning of the speech.
+        """
+        matches = self.__find_matches(text)
+        if not matches:
+            return [(self.__get_beginning(text), False)]
+        first, last = self.__find_best_window(matches)
+        # Center the matches of the window in the snippet
+        start = max(0, matches[first][0] - (self.length - (matches[last][1] - matches[first][0])) // 2)
+        end = max(matches[last][1], min(len(text), start + self.length))
+        # Do not cut the first and the last words
+        if start > 0 and not text[start - 1].isspace():
+            word_start = text.find(" ", start, matches[first][0])
+            start = word_start + 1 if word_start != -1 else matches[first][0]
+        if end < len(text) and not text[end].isspace():
+            word_end = text.rfind(" ", matches[last][1], end)
+            end = word_end if word_end != -1 else matches[last][1]
+        fragments = []
+        position = start
+        for match_start, match_end, _ in matches:
+            if match_start < start or match_end > end:
+                continue
+            if match_start > position:
+                fragments.append((text[position:match_start], False))
+            fragments.append((text[match_start:match_end], True))
+            position = match_end
+        if end > position:
+            fragments.append((text[position:end], False))
+        return fragments
+
+    def __find_matches(self, text: str) -> list[tuple[int, int, int]]:
+        """
+        Find the words of the speech starting with any of the terms.
+        :return: tuples with the start and end of every matching word and the index of the term it matched, in the
+                 order of the words
+        """
+        matches = []
+        for term_index, term_regex in self.term_regexes:
+            matches.extend((match.start(), match.end(), term_index) for match in term_regex.finditer(text)
+                           if _is_word_start(text, match.start()))
+        # A word matching several terms is only kept once
+        matches.sort(key=lambda match: (match[0], match[2]))
+        return [match for i, match in enumerate(matches) if i == 0 or match[0] != matches[i - 1][0]]
+
+    def __find_best_window(self, matches: list[tuple[int, int, int]]) -> tuple[int, int]:
+        """
+        Find the consecutive matches fitting in a snippet that contain the most distinct terms, and then the most
+        matches.
+        :param matches: tuples with the start and end of every match and the index of the term it matched
+        :return: tuple with the indices of the first and the last match of the window
+        """
+        best_window = (0, 0)
+        best_score = (0, 0)
+        terms_in_window = Counter()
+        first = 0
+        for last, (_, end, term) in enumerate(matches):
+            terms_in_window[term] += 1
+            while end - matches[first][0] > self.length and first < last:
+                terms_in_window[matches[first][2]] -= 1
+                if terms_in_window[matches[first][2]] == 0:
+                    del terms_in_window[matches[first][2]]
+                first += 1
+            score = (len(terms_in_window), last - first + 1)
+            if score > best_score:
+                best_score = score
+                best_window = (first, last)
+        return best_window
+
+    def __get_beginning(self, text: str) -> str:
+        if len(text) <= self.length:
+            return text
+        return text[:self.length].rsplit(" ", 1)[0]
@@ -1,43 +1,111 @@
-from collections import defaultdict
+import mmap
+import os
+import struct
 
+import numpy as np
+
+from .inverted.files import atomic_write
 from .speech import Speech
 from ..preprocessing.funcs import process_csv_line
 
+OFFSETS_MAGIC = b"GPOF\x01\x00\x00\x00"
+# Magic, size and modification time in nanoseconds of the speeches file the offsets were calculated from, number of
+# speeches
+OFFSETS_HEADER = struct.Struct("<8sQQQ")
+# Number of bytes of the speeches file searched for line ends at once when calculating the offsets
+OFFSETS_CHUNK_SIZE = 1 << 26
+# Number of consecutive speeches decoded at once when iterating over the speeches
+SPEECHES_PER_READ = 256
+
+
+def get_offsets_file_name(speeches_csv_name: str) -> str:
+    return "{}.offsets".format(speeches_csv_name)
+
+
+def calculate_offsets(speeches_csv_name: str) -> np.ndarray:
+    """
+    Find the offset of every speech in a speeches file.
+    :return: array with the offset of the line of each speech, skipping the header, followed by the size of the file
+    """
+    line_starts = [np.zeros(1, dtype=np.uint64)]
+    position = 0
+    with open(speeches_csv_name, "rb") as speeches_file:
+        while chunk := speeches_file.read(OFFSETS_CHUNK_SIZE):
+            line_ends = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == ord("\n"))
+            line_starts.append(line_ends.astype(np.uint64) + np.uint64(position + 1))
+            position += len(chunk)
+    line_starts = np.concatenate(line_starts)
+    # The file usually ends with a line end, which does not start another line
+    if line_starts[-1] == position:
+        line_starts = line_starts[:-1]
+    # Skip the header and add the end of the last speech
+    return np.append(line_starts[1:], np.uint64(position)) if len(line_starts) > 0 else np.zeros(1, dtype=np.uint64)
+
 
 class SpeechFile:
     """
     A file containing speeches of parliament. The speeches must be sorted from oldest to newest (otherwise date_range
     does not work).
+    The speeches file is memory-mapped and the offset of every speech is kept in a file next to it, so that a speech is
+    sliced from the map without any reads or seeks. The offsets file is created the first time the speeches file is
+    opened and again whenever the size or the modification time of the speeches file changes. Later it is
+    memory-mapped, so opening the speeches is fast.
     """
 
     def __init__(self, speeches_csv_name):
-        self.speeches_file = open(speeches_csv_name, "r", encoding='utf8')
-        # Dict matching the ID of every 100 speeches to its offset in the speeches file.
-        self.speeches_offset = {}
-        self.total_speeches = 0
-        self.__calculate_offsets()
+        self.speeches_csv_name = speeches_csv_name
+        self.speeches_file = open(speeches_csv_name, "rb")
+        # Speeches are sliced from the mapped file, so fetching them does not move a shared file position
+        self.speeches_map = mmap.mmap(self.speeches_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.offsets_file = None
+        self.offsets_map = None
+        # Array with the offset of every speech in the speeches file, followed by the end of the last speech
+        self.speeches_offset = self.__load_offsets()
+        self.total_speeches = len(self.speeches_offset) - 1
         self._calculate_date_range()
 
-    def __calculate_offsets(self) -> None:
-        """
-        Adds the offsets of each speech to the speeches_offset dictionary. The speeches_offset dictionary matches
-        the ID of each speech to its offset in the speeches file
-        """
-        self.speeches_file.seek(0)
-        # Ignore the first line by starting document ids at -1. The first line is read but ignored, and the next line is
-        # read and stored normally.
-        document_id = -1
-        # Read the next line before storing the offset to make sure there is one
-        while self.speeches_file.readline():
-            # Save document_id every 100 documents
-            if document_id % 100 == 0:
-                self.speeches_offset[document_id//100] = offset
-            # Keep the offset of the new line before reading it
-            if (document_id + 1) % 100 == 0:
-                offset = self.speeches_file.tell()
-            document_id += 1
-        # Speech ids start at 0, so we add 1 and subtract 1 because the last line is empty
-        self.total_speeches = document_id
+    def __load_offsets(self) -> np.ndarray:
+        """
+        Open the offsets file of the speeches file, creating it if it does not exist or it is out of date.
+        :return: array with the offset of every speech, followed by the end of the last speech
+        """
+        offsets_file_name = get_offsets_file_name(self.speeches_csv_name)
+        status = os.stat(self.speeches_file.fileno())
+        if os.path.exists(offsets_file_name):
+            offsets = self.__open_offsets(offsets_file_name, status)
+            if offsets is not None:
+                return offsets
+        offsets = calculate_offsets(self.speeches_csv_name)
+        try:
+            with atomic_write(offsets_file_name) as offsets_file:
+                offsets_file.write(OFFSETS_HEADER.pack(OFFSETS_MAGIC, status.st_size, status.st_mtime_ns,
+                                                       len(offsets) - 1))
+                offsets_file.write(offsets.tobytes())
+        except OSError:
+            # The directory of the speeches may be read-only, in which case the offsets are only kept in memory
+            pass
+        return offsets
+
+    def __open_offsets(self, offsets_file_name: str, status: os.stat_result):
+        """
+        Memory-map an offsets file.
+        :param status: status of the speeches file
+        :return: the offsets, or None if the file does not match the speeches file
+        """
+        offsets_file = open(offsets_file_name, "rb")
+        if os.fstat(offsets_file.fileno()).st_size < OFFSETS_HEADER.size:
+            offsets_file.close()
+            return None
+        offsets_map = mmap.mmap(offsets_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, size, modification_time, total_speeches = OFFSETS_HEADER.unpack_from(offsets_map)
+        if magic != OFFSETS_MAGIC or size != status.st_size or modification_time != status.st_mtime_ns or \
+                len(offsets_map) != OFFSETS_HEADER.size + 8 * (total_speeches + 1):
+            offsets_map.close()
+            offsets_file.close()
+            return None
+        self.offsets_file = offsets_file
+        self.offsets_map = offsets_map
+        return np.frombuffer(offsets_map, dtype=np.uint64, count=total_speeches + 1, offset=OFFSETS_HEADER.size)
 
     def _calculate_date_range(self) -> None:
         """
@@ -47,28 +115,32 @@ class SpeechFile:
         self._start_date = self.get_speech(0).sitting_date
         self._end_date = self.get_speech(self.total_speeches-1).sitting_date
 
+    def __read_speeches(self, first_id: int, last_id: int) -> list[Speech]:
+        """
+        Read consecutive speeches from the file.
+        :param first_id: id of the first speech
+        :param last_id: id of the last speech
+        """
+        # Decode all the lines at once, which is faster than decoding each of them for ranges of speeches
+        text = self.speeches_map[int(self.speeches_offset[first_id]):int(self.speeches_offset[last_id + 1])]
+        lines = text.decode("utf8").split("\n")
+        speeches = []
+        for speech_id, line in enumerate(lines[:last_id - first_id + 1], first_id):
+            speech = process_csv_line(line.removesuffix("\r"))
+            # Set the ID of the speech object
+            speech.id = speech_id
+            speeches.append(speech)
+        return speeches
+
     def get_speech(self, speech_id: int) -> Speech:
         """
         Gets a speech object given its ID
         :param speech_id:
         :return:
         """
-        # Go to the offset of the nearest document stored in speeches_offset and then to the exact line the speech is
-        # in.
         if speech_id > self.total_speeches - 1 or speech_id < 0:
             raise RuntimeError("Speech ID out of bounds. (Max speech ID: {}".format(self.total_speeches - 1))
-        # Find the nearest offset in the offsets dict
-        offset = self.speeches_offset[speech_id//100]
-        # Read the line at the offset
-        self.speeches_file.seek(offset)
-        line = self.speeches_file.readline()
-        # Read remaining lines and get to the requested one
-        for i in range(speech_id % 100):
-            line = self.speeches_file.readline()
-        # Set the ID of the speech object
-        speech = process_csv_line(line)
-        speech.id = speech_id
-        return speech
+        return self.__read_speeches(int(speech_id), int(speech_id))[0]
 
     def get_speeches(self, speech_ids: list[int], preserve_order=False) -> list[Speech]:
         """
@@ -79,38 +151,18 @@ class SpeechFile:
                               speeches are returned in random order.
         :return:
         """
-        # Instead of going directly to the speeches, first group them and then read each bucket. This way each bucket
-        # of 100 speeches is only read once.
-        # Group speeches by their position in the offsets dict
-        buckets = defaultdict(list)
-        results = []
+        speech_ids = [int(speech_id) for speech_id in speech_ids]
         for speech_id in speech_ids:
-            buckets[speech_id//100].append(speech_id)
-        for bucket, speeches in buckets.items():
-            # Get the offset of the first speech in the bucket
-            offset = self.speeches_offset[bucket]
-            # Sort the speeches by their id
-            speeches.sort()
-            # Read the line at the offset and check if it is included in the desired speech IDs
-            self.speeches_file.seek(offset)
-            line = self.speeches_file.readline()
-            if speeches[0] % 100 == 0:
-                speech = process_csv_line(line)
-                # Set the speech ID
-                speech.id = speeches[0]
-                results.append(speech)
-                speeches.pop(0)
-            if len(speeches) > 0:
-                # Read until the largest speech ID in the given bucket
-                for i in range(speeches[-1] % 100):
-                    line = self.speeches_file.readline()
-                    # Check if we want the current speech ID
-                    if bucket*100 + i + 1 == speeches[0]:
-                        # Set the speech ID
-                        speech = process_csv_line(line)
-                        speech.id = speeches[0]
-                        results.append(speech)
-                        speeches.pop(0)
+            if speech_id > self.total_speeches - 1 or speech_id < 0:
+                raise RuntimeError("Speech ID out of bounds. (Max speech ID: {}".format(self.total_speeches - 1))
+        # Read the speeches in the order they are in the file, with each range of consecutive speeches read at once
+        results = []
+        sorted_ids = sorted(set(speech_ids))
+        first = 0
+        for last, speech_id in enumerate(sorted_ids):
+            if last + 1 == len(sorted_ids) or sorted_ids[last + 1] != speech_id + 1:
+                results.extend(self.__read_speeches(sorted_ids[first], speech_id))
+                first = last + 1
         if preserve_order:
             speeches_by_id = {speech.id: speech for speech in results}
             results = [speeches_by_id[speech_id] for speech_id in speech_ids]
@@ -122,15 +174,9 @@ class SpeechFile:
         Speech IDs start at 0, so to iterate over speeches with IDs use the enumerate function.
         :return: Speech object
         """
-        self.speeches_file.seek(0)
-        # Ignore the first line
-        self.speeches_file.readline()
-        current_speech_id = 0
-        while line := self.speeches_file.readline():
-            speech = process_csv_line(line)
-            speech.id = current_speech_id
-            current_speech_id += 1
-            yield speech
+        # Read a few speeches at a time, instead of decoding the whole file at once
+        for first_id in range(0, self.total_speeches, SPEECHES_PER_READ):
+            yield from self.__read_speeches(first_id, min(first_id + SPEECHES_PER_READ, self.total_speeches) - 1)
 
     @property
     def date_range(self):
@@ -0,0 +1,154 @@
+import os
+import pickle
+import re
+from bisect import bisect_left
+from typing import Iterable
+
+import numpy as np
+
+from .inverted.files import atomic_write
+from ..preprocessing.funcs import remove_accents, remove_punctuation, stem
+from ..preprocessing.stopwords import STOPWORDS
+
+# File with the completions of the terms, created along with the inverted index. See create_term_completions_file.
+TERM_COMPLETIONS_FILE = "completions/terms.pkl"
+# File with the number of speeches of the index containing each word, from which the completions of the terms are
+# created again when speeches are appended to the index
+WORD_FREQUENCIES_FILE = "completions/word_frequencies.pkl"
+# Default number of completions returned for each kind
+MAX_SUGGESTIONS = 10
+# The best completions of every prefix up to this length are precomputed, since these prefixes match the most strings
+PRECOMPUTED_PREFIX_LENGTH = 2
+# Terms shorter than this are not suggested
+MIN_TERM_LENGTH = 3
+# Stopwords as they are written in the speeches, in lowercase with accents
+WORD_STOPWORDS = frozenset(STOPWORDS)
+
+
+def normalize_prefix(text: str) -> str:
+    """
+    Normalize the text being typed like the processed speeches, without stemming it, since it is the beginning of a
+    word.
+    """
+    return remove_accents([text.lower().strip()])[0].upper()
+
+
+class CompletionIndex:
+    """
+    Finds the most frequent strings starting with a prefix. The normalized keys of the strings are sorted, so the keys
+    starting with a prefix are a range found with binary search. The best completions of the short prefixes, whose
+    ranges are the longest, are precomputed, so that every lookup only sorts a short range.
+    """
+
+    def __init__(self, keys: list[str], values: list[str], frequencies, max_suggestions=MAX_SUGGESTIONS):
+        """
+        :param keys: normalized strings the prefixes are matched against. See normalize_prefix.
+        :param values: string suggested for each key. A value may have several keys, such as a name that can be typed
+                       starting from any of its words.
+        :param frequencies: how common each value is. More frequent values are suggested first.
+        :param max_suggestions: number of completions precomputed for the short prefixes
+        """
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self.keys = [keys[i] for i in order]
+        self.values = [values[i] for i in order]
+        self.frequencies = np.asarray(frequencies, dtype=np.int64)[np.array(order, dtype=np.int64)]
+        self.max_suggestions = max_suggestions
+        # The ids of the best keys of every short prefix, best first, with a distinct value each
+        self.top_completions = {}
+        values_of_prefix = {}
+        for key_id in np.argsort(-self.frequencies, kind="stable").tolist():
+            key = self.keys[key_id]
+            for length in range(1, min(len(key), PRECOMPUTED_PREFIX_LENGTH) + 1):
+                completions = self.top_completions.setdefault(key[:length], [])
+                prefix_values = values_of_prefix.setdefault(key[:length], set())
+                if len(completions) < max_suggestions and self.values[key_id] not in prefix_values:
+                    completions.append(key_id)
+                    prefix_values.add(self.values[key_id])
+
+    def __len__(self):
+        return len(self.keys)
+
+    def write(self, file_name: str) -> None:
+        directory = os.path.dirname(file_name)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with atomic_write(file_name) as completions_file:
+            pickle.dump(self, completions_file)
+
+    @staticmethod
+    def read(file_name: str) -> "CompletionIndex":
+        with open(file_name, "rb") as completions_file:
+            return pickle.load(completions_file)
+
+    def complete(self, prefix: str, k=MAX_SUGGESTIONS) -> list[str]:
+        """
+        Get the most frequent values with a key starting with the prefix.
+        :param prefix: normalized prefix. See normalize_prefix.
+        :param k: maximum number of values
+        :return: the values, most frequent first
+        """
+        if not prefix or k <= 0:
+            return []
+        if len(prefix) <= PRECOMPUTED_PREFIX_LENGTH and k <= self.max_suggestions:
+            return [self.values[key_id] for key_id in self.top_completions.get(prefix, [])[:k]]
+        start = bisect_left(self.keys, prefix)
+        # Every key starting with the prefix is smaller than the prefix followed by the largest character
+        end = bisect_left(self.keys, prefix + chr(0x10ffff), start)
+        completions = []
+        for key_id in (start + np.argsort(-self.frequencies[start:end], kind="stable")).tolist():
+            if self.values[key_id] not in completions:
+                completions.append(self.values[key_id])
+                if len(completions) == k:
+                    break
+        return completions
+
+
+def get_words(text: str) -> set[str]:
+    """
+    Get the distinct words of a speech that can be suggested, as they are written in it, in lowercase. Stopwords and
+    short words are left out.
+    """
+    return {word for word in re.findall(r"\w+", remove_punctuation(text))
+            if len(word) >= MIN_TERM_LENGTH and word not in WORD_STOPWORDS}
+
+
+def create_term_completions(word_frequencies: dict[str, int], terms: Iterable[str]) -> CompletionIndex:
+    """
+    Create the completions of the terms of an index, out of the words of the speeches, ranked by the number of speeches
+    containing them. The words are suggested as they are written in the speeches, since the terms of the index are
+    stems, which are processed into different terms when searched. The spellings of a word that only differ in their
+    accents are suggested once, in their most common spelling, and words whose stem is not a term of the index are
+    left out.
+    :param word_frequencies: number of speeches containing each word, see get_words
+    :param terms: the terms of the index, as returned by get_vocabulary
+    """
+    # The most common spelling of every word and the number of speeches containing any of its spellings
+    spellings = {}
+    frequencies = {}
+    for word, frequency in sorted(word_frequencies.items(), key=lambda word_frequency: -word_frequency[1]):
+        key = normalize_prefix(word)
+        spellings.setdefault(key, word)
+        frequencies[key] = frequencies.get(key, 0) + frequency
+    # The keys are already processed like the speeches of the index, except for stemming
+    keys = list(spellings)
+    terms = set(terms)
+    keys = [key for key, term in zip(keys, stem(keys)) if term in terms]
+    return CompletionIndex(keys, [spellings[key] for key in keys], [frequencies[key] for key in keys])
+
+
+def create_name_completions(speeches_of_name: dict[str, list[int]]) -> CompletionIndex:
+    """
+    Create the completions of the names of the members, ranked by their number of speeches. A name can be completed
+    starting from any of its words.
+    :param speeches_of_name: the speeches of each member, as in the speaker_name group file
+    """
+    keys = []
+    values = []
+    frequencies = []
+    for name, speech_ids in speeches_of_name.items():
+        words = normalize_prefix(name).split()
+        for word_index in range(len(words)):
+            keys.append(" ".join(words[word_index:]))
+            values.append(name)
+            frequencies.append(len(speech_ids))
+    return CompletionIndex(keys, values, frequencies)
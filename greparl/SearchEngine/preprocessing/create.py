@@ -1,5 +1,6 @@
 import os
 import pickle
+from collections import Counter
 from typing import Dict
 
 import numpy as np
@@ -9,7 +10,14 @@ from sklearn.metrics.pairwise import linear_kernel
 from .extract_processed_speeches import extract_processed_speeches
 from .funcs import remove_accents
 from .stopwords import STOPWORDS
+from ..backend.filters import SITTING_DATES_FILE
+from ..backend.inverted.files import atomic_write
+from ..backend.inverted.builder import build_index_from_file, build_index_in_parallel, DEFAULT_MEMORY_BUDGET
 from ..backend.inverted.inverted_index import InvertedIndex
+from ..backend.inverted.segments import SegmentedIndex
+from ..backend.inverted.shards import DEFAULT_MAX_SHARDS, ShardedIndex, create_shards, find_shard_boundaries
+from ..backend.speech_file import SPEECHES_PER_READ, SpeechFile
+from ..backend.suggestions import TERM_COMPLETIONS_FILE, WORD_FREQUENCIES_FILE, create_term_completions, get_words
 from ..backend.top.suggested_stopwords import suggested_stopwords
 from .create_group import *
 from .create_lsa import *
@@ -17,22 +25,120 @@ from .create_ai import create_sampled_model
 
 
 def create_inverted_index(processed_speeches_file_name,
-                          index_file_name="index", speeches_file="speeches.csv",speech_number=-1):
+                          index_file_name="index", speeches_file="speeches.csv",speech_number=-1, binary=True,
+                          memory_budget=DEFAULT_MEMORY_BUDGET, workers=4, positions=False, tier_size=None):
     """
-    Create the inverted index from the initial speeches file. Speeches are extracted, tokenized and stemmed before
-    being inserted into the index. The process takes multiple hours for all speeches.
+    Create the inverted index from the processed speeches file. The file is streamed one speech at a time and postings
+    are flushed to temporary runs whenever they exceed the memory budget, so memory usage does not grow with the size
+    of the corpus. With more than one worker, consecutive ranges of speeches are indexed by separate processes and
+    their runs are merged into the final index.
     :param processed_speeches_file_name File containing the speeches' contents with any preprocessing applied
 
     :param speech_number number of speeches to include in the index, if -1 include all speeches
+    :param binary store the posting lists in the compressed binary format instead of text
+    :param memory_budget approximate number of bytes the in-memory postings may use before being flushed to disk
+    :param workers number of processes building the index
+    :param positions store the positions of the terms, needed for exact phrase and proximity queries. Without them a
+    phrase only requires all of its terms to appear in a speech. The positions file has an entry for every appearance
+    of every term, so it is about as large as the posting lists or larger, and the build takes longer.
+    :param tier_size store a first tier with this many postings of each term, which answers most searches without
+    reading the full posting lists. See InvertedIndex.create_tier.
+    :param speeches_file the speeches file the processed speeches were extracted from, whose words are suggested as
+    the terms of the index are typed. See create_term_completions_file.
     """
-    processed_speeches = open(processed_speeches_file_name, "r", encoding='utf8')
-    # Ignore the first line
-    processed_speeches.readline()
-    lines = processed_speeches.readlines()
-    vectorizer = CountVectorizer(lowercase=False)
-    count_matrix = vectorizer.fit_transform(lines)
-    index = InvertedIndex(index_file_name)
-    index.populate_index(count_matrix, vectorizer.get_feature_names_out())
+    # Segments added to a previous index, and shards created from it, are replaced by the new index
+    SegmentedIndex.remove_segments(index_file_name)
+    ShardedIndex.remove_shards(index_file_name)
+    index = InvertedIndex(index_file_name, replace=True, binary=binary, positions=positions, tier_size=tier_size)
+    if workers > 1:
+        build_index_in_parallel(processed_speeches_file_name, index, speech_number=speech_number,
+                                memory_budget=memory_budget, workers=workers)
+    else:
+        build_index_from_file(processed_speeches_file_name, index, speech_number=speech_number,
+                              memory_budget=memory_budget)
+    create_term_completions_file(SpeechFile(speeches_file), index_file_name)
+
+
+def append_to_inverted_index(processed_speeches_file_name, index_file_name="index", speeches_file="speeches.csv",
+                             memory_budget=DEFAULT_MEMORY_BUDGET):
+    """
+    Index the speeches of the processed speeches file that are not in the index yet, such as the speeches of newly
+    added sittings. They are indexed into a new segment instead of rebuilding the whole index.
+    :param processed_speeches_file_name File containing the speeches' contents with any preprocessing applied
+    :param speeches_file the speeches file the processed speeches were extracted from
+    :param memory_budget approximate number of bytes the in-memory postings may use before being flushed to disk
+    """
+    # The shards would not contain the new speeches, so the index is searched as a whole until they are created again
+    ShardedIndex.remove_shards(index_file_name)
+    index = SegmentedIndex(index_file_name)
+    with open(processed_speeches_file_name, "r", encoding="utf8") as processed_speeches:
+        # Ignore the first line and the speeches already in the index
+        for _ in range(index.total_documents + 1):
+            processed_speeches.readline()
+        index.add_documents(processed_speeches, memory_budget=memory_budget)
+    # Adding a segment may have started a merge
+    index.wait_for_merge()
+    create_term_completions_file(SpeechFile(speeches_file), index_file_name, append=True)
+
+
+def create_term_completions_file(speeches_file: SpeechFile, index_file_name="index", append=False,
+                                 completions_file_name=TERM_COMPLETIONS_FILE,
+                                 word_frequencies_file_name=WORD_FREQUENCIES_FILE) -> None:
+    """
+    Stores the completions of the terms of the index, suggested as words are typed in the search box. The words of the
+    speeches of the index are counted, and the counts are stored along with the completions, so that only the words of
+    speeches appended to the index later have to be counted. See create_term_completions.
+    :param append only count the words of the speeches added to the index since the completions were last created
+    """
+    index = SegmentedIndex(index_file_name)
+    counted_speeches = 0
+    word_frequencies = Counter()
+    if append and os.path.exists(word_frequencies_file_name):
+        with open(word_frequencies_file_name, "rb") as word_frequencies_file:
+            counted_speeches, word_frequencies = pickle.load(word_frequencies_file)
+    for first_id in range(counted_speeches, index.total_documents, SPEECHES_PER_READ):
+        last_id = min(first_id + SPEECHES_PER_READ, index.total_documents) - 1
+        for speech in speeches_file.get_speeches(list(range(first_id, last_id + 1))):
+            word_frequencies.update(get_words(speech.contents))
+    completions = create_term_completions(word_frequencies, index.get_vocabulary()[0])
+    completions.write(completions_file_name)
+    with atomic_write(word_frequencies_file_name) as word_frequencies_file:
+        pickle.dump((index.total_documents, word_frequencies), word_frequencies_file)
+
+
+def create_sharded_index(index_file_name="index", speeches_file_name="speeches.csv", by="parliamentary_period",
+                         max_shards=DEFAULT_MAX_SHARDS) -> list[str]:
+    """
+    Split the inverted index into shards of consecutive speeches, each one searched by its own worker process. The
+    search engine uses the shards once they exist. Rebuilding the index or appending speeches to it removes them, so
+    they have to be created again afterwards.
+    :param by "parliamentary_period" to start a new shard with every parliamentary period, or "year" to start one with
+              every year. Periods or years are joined into larger shards if there are more than max_shards of them.
+    :param max_shards maximum number of shards, and so of worker processes
+    :return: the names of the shards
+    """
+    if by == "parliamentary_period":
+        values = [speech.parliamentary_period for speech in SpeechFile(speeches_file_name).speeches()]
+    elif by == "year":
+        values = [speech.sitting_date.year for speech in SpeechFile(speeches_file_name).speeches()]
+    else:
+        raise ValueError("Shards are either by parliamentary_period or by year, not by {}.".format(by))
+    # Speeches appended to the speeches file after the index was created are left out
+    values = values[:SegmentedIndex(index_file_name).total_documents]
+    return create_shards(index_file_name, find_shard_boundaries(values, max_shards))
+
+
+def create_sitting_dates(speeches_file: SpeechFile, dates_file_name=SITTING_DATES_FILE) -> None:
+    """
+    Stores the sitting date of every speech, so that date ranges can be turned into ranges of speech ids. See
+    FilterManager.
+    """
+    sitting_dates = np.array([speech.sitting_date for speech in speeches_file.speeches()], dtype="datetime64[D]")
+    dates_directory = os.path.dirname(dates_file_name)
+    if dates_directory:
+        os.makedirs(dates_directory, exist_ok=True)
+    with atomic_write(dates_file_name) as dates_file:
+        np.save(dates_file, sitting_dates)
 
 
 def create_transformer_vectorizer(speech_file: SpeechFile) -> None:
@@ -117,13 +223,15 @@ def create_folder_if_not_exists(folder_name: str):
         os.mkdir(folder_name)
 
 
-def create_all(speeches_to_include_in_index=-1, lsa_speeches=100000):
+def create_all(speeches_to_include_in_index=-1, lsa_speeches=100000, positions=True):
     """
     Creates all the necessary files necessary for the program to function. Creating everything from scratch should
     take about 1.5-2 hours for all speeches. The majority of time is spent creating the inverted index.
     :param speeches_to_include_in_index If -1 include all speeches, else include only the first n speeches in the
                                         inverted index.
     :param lsa_speeches Speeches to use in LSA
+    :param positions Store the positions of the terms in the inverted index, for the phrase queries of the search,
+                     which cannot be searched otherwise. See create_inverted_index.
     """
     speeches_file_name = "speeches.csv"
     speeches_file = SpeechFile("speeches.csv")
@@ -134,14 +242,17 @@ def create_all(speeches_to_include_in_index=-1, lsa_speeches=100000):
     # Create the inverted index using the previously generated speeches file
     create_folder_if_not_exists("index")
     create_inverted_index(processed_speeches_file_name, speeches_file=speeches_file_name,
-                          speech_number=speeches_to_include_in_index)
+                          speech_number=speeches_to_include_in_index, positions=positions)
     # Create the CountVectorizer and TfidfTransformer trained on all speeches, and used for keyword extraction
     # and similarity.
     create_folder_if_not_exists("tfidf")
     create_transformer_vectorizer(speeches_file)
-    # Create the group files, used for grouping speeches by attribute. Group by party and member_name.
-    create_folder_if_not_exists("group")
-    create_groups(speeches_file, [party, speaker_name], replace=True)
+    # Create the group files, used for grouping speeches by attribute and for filtering the search results. Group by
+    # party, member_name, gender and member_region.
+    create_folder_if_not_exists("groups")
+    create_groups(speeches_file, [party, speaker_name, gender, member_region], replace=True)
+    # Store the sitting date of every speech, used for filtering the search results by date
+    create_sitting_dates(speeches_file)
     # Create the similarity matrix
     # First group all speeches by member name for similarity matching
     member_name_grouped_speeches = defaultdict(list)
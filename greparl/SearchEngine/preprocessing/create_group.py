@@ -19,6 +19,14 @@ def speaker_name(speech: Speech):
     return speech.member_name
 
 
+def gender(speech: Speech):
+    return speech.gender
+
+
+def member_region(speech: Speech):
+    return speech.member_region
+
+
 def create_groups(speech_file: SpeechFile, attributes: list[Callable[[Speech], str]], replace=False):
     """
     Read all speeches from the speeches file and group them using the functions in the attributes list.
@@ -9,8 +9,10 @@ from flask import request
 from flask import redirect
 from flask import url_for
 from flask import flash
+from flask import jsonify
 
 from .SearchEngine import SearchEngine
+from .SearchEngine import SpeechFilter
 
 def abs_path(relative):
     """Takes the relative path and returns its absolute position in filesystem.
@@ -19,6 +21,18 @@ def abs_path(relative):
     """
     return os.path.join(os.path.dirname(__file__), relative)
 
+def get_speech_filter(form):
+    """Builds the filter of a search from the optional filter fields of the search
+    form. Empty fields are not filtered on.
+    """
+    def value(name):
+        return form.get(name) or None
+    def date_value(name):
+        return datetime.strptime(form.get(name), "%Y-%m-%d").date() if form.get(name) else None
+    return SpeechFilter(start_date=date_value("start"), end_date=date_value("end"),
+                        political_party=value("party"), member_name=value("member"),
+                        gender=value("gender"), member_region=value("region"))
+
 def create_app(mode="deploy"):
     app = Flask(__name__)
 
@@ -30,7 +44,8 @@ def create_app(mode="deploy"):
 
     app.config['SECRET_KEY'] = b'69eaedecc0b3fc06a705dc0e6e238497108aacd368d55723bbf5067c08c4ddd5'
 
-    engine = SearchEngine()
+    # Cursors of result pages are signed, so that they cannot be forged to request huge pages
+    engine = SearchEngine(cursor_key=app.config['SECRET_KEY'])
 
     @app.errorhandler(404)
     def page_not_found(e):
@@ -40,19 +55,36 @@ def create_app(mode="deploy"):
     def index():
         return render_template("index.html")
 
-    @app.route("/search", methods=["POST"])
+    @app.route("/search", methods=["GET", "POST"])
     def search():
-        if request.form.get("randomGrep"):
+        if request.method == "GET":
+            # Other pages of earlier results
+            t1 = time.time()
+            try:
+                page = engine.search_page(cursor=request.args.get("cursor", ""))
+            except ValueError:
+                return redirect(url_for("index"))
+        elif request.form.get("randomGrep"):
             max_ = engine.get_total_speeches()
             id_ = random.randint(0, max_)
             return redirect(url_for("speech", speech_id=id_))
         else:
             q_string = request.form.get("qString")
             t1 = time.time()
-            speeches = engine.search(q_string)
-            t2 = time.time()
-            time_str = f"{(t2-t1):.2f}"
-            return render_template("results.html", speeches=speeches, count=len(speeches), time=time_str, q_string=q_string)
+            try:
+                page = engine.search_page(q_string, speech_filter=get_speech_filter(request.form))
+            except ValueError as error:
+                # The speeches cannot be filtered by one of the fields of the form
+                flash(str(error), "danger")
+                return redirect(url_for("index"))
+        t2 = time.time()
+        time_str = f"{(t2-t1):.2f}"
+        return render_template("results.html", speeches=page.speeches, count=len(page.speeches), time=time_str,
+                               q_string=page.query, page=page)
+
+    @app.route("/suggest")
+    def suggest():
+        return jsonify(engine.suggest(request.args.get("q", "")))
 
     @app.route("/deep-search", methods=["POST"])
     def deep_search():
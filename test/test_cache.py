@@ -0,0 +1,55 @@
+import unittest
+
+from greparl.SearchEngine.backend.cache import QueryCache
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self):
+        return self.time
+
+
+class TestQueryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = QueryCache(max_entries=2, time_to_live=10.0, clock=self.clock)
+        self.cache.check_version(0)
+
+    def test_least_recently_used_eviction(self):
+        self.cache.put("a", 1)
+        self.cache.put("b", 2)
+        self.assertEqual(self.cache.get("a"), 1)
+        # b is the least recently used one
+        self.cache.put("c", 3)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("a"), 1)
+        self.assertEqual(self.cache.get("c"), 3)
+        statistics = self.cache.get_statistics()
+        self.assertEqual((statistics["hits"], statistics["misses"], statistics["evictions"]), (3, 1, 1))
+        self.assertEqual(statistics["entries"], 2)
+
+    def test_expiration(self):
+        self.cache.put("a", 1)
+        self.clock.time = 9.0
+        self.assertEqual(self.cache.get("a"), 1)
+        self.clock.time = 10.0
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.get_statistics()["expirations"], 1)
+        self.assertEqual(self.cache.get_statistics()["entries"], 0)
+
+    def test_version_change(self):
+        self.cache.put("a", 1)
+        self.cache.check_version(0)
+        self.assertEqual(self.cache.get("a"), 1)
+        self.cache.check_version(1)
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.get_statistics()["invalidations"], 1)
+
+    def test_disabled(self):
+        cache = QueryCache(max_entries=0)
+        cache.put("a", 1)
+        self.assertIsNone(cache.get("a"))
@@ -0,0 +1,120 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+
+import numpy as np
+
+from greparl.SearchEngine.backend.facets import FacetManager
+from greparl.SearchEngine.backend.filters import FilterManager, SpeechFilter
+from greparl.SearchEngine.backend.top.group_manager import GroupManager
+
+# Sitting date of each speech, sorted like the speeches file
+SITTING_DATES = ["1990-01-01", "1990-01-01", "1990-01-02", "1991-05-10", "1991-05-10", "1991-05-10", "1995-03-01",
+                 "2000-07-07", "2000-07-08", "2000-07-08"]
+GROUPS = {
+    "party": {"Α": [0, 2, 3, 7, 9], "Β": [1, 4, 5, 6, 8]},
+    "speaker_name": {"Μέλος 1": [0, 3, 9], "Μέλος 2": [2, 7], "Μέλος 3": [1, 4, 5, 6, 8]},
+    "gender": {"male": [0, 1, 3, 4, 5, 6, 8, 9], "female": [2, 7]},
+}
+
+
+def create_groups_and_dates():
+    """Create the group files and the dates file of the speeches in the current directory.
+    """
+    os.mkdir("groups")
+    for attribute, values in GROUPS.items():
+        with open("groups/{}".format(attribute), "w", encoding="utf8") as group_file:
+            group_file.write("\n".join("{},{}".format(value, ",".join(str(i) for i in ids))
+                                       for value, ids in values.items()))
+    os.mkdir("dates")
+    np.save("dates/sitting_dates.npy", np.array(SITTING_DATES, dtype="datetime64[D]"))
+
+
+class TestFilterManager(unittest.TestCase):
+
+    def setUp(self):
+        self.original_directory = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+        create_groups_and_dates()
+        self.filter_manager = FilterManager(GroupManager())
+
+    def tearDown(self):
+        os.chdir(self.original_directory)
+        self.directory.cleanup()
+
+    def expected(self, start_date=None, end_date=None, **attributes):
+        documents = set(range(len(SITTING_DATES)))
+        if start_date is not None:
+            documents &= {i for i, day in enumerate(SITTING_DATES) if date.fromisoformat(day) >= start_date}
+        if end_date is not None:
+            documents &= {i for i, day in enumerate(SITTING_DATES) if date.fromisoformat(day) <= end_date}
+        groups = {"political_party": "party", "member_name": "speaker_name", "gender": "gender"}
+        for attribute, value in attributes.items():
+            documents &= set(GROUPS[groups[attribute]].get(value, []))
+        return sorted(documents)
+
+    def test_date_range(self):
+        self.assertEqual(self.filter_manager.get_date_range(date(1990, 1, 2), date(2000, 7, 7)), (2, 8))
+        self.assertEqual(self.filter_manager.get_date_range(None, date(1991, 5, 10)), (0, 6))
+        self.assertEqual(self.filter_manager.get_date_range(date(1992, 1, 1), date(1993, 1, 1)), (6, 6))
+        self.assertEqual(self.filter_manager.get_date_range(date(2001, 1, 1), date(1989, 1, 1)), (10, 10))
+
+    def test_documents(self):
+        self.assertIsNone(self.filter_manager.get_documents(None))
+        self.assertIsNone(self.filter_manager.get_documents(SpeechFilter()))
+        filters = [
+            dict(start_date=date(1990, 1, 2), end_date=date(2000, 7, 7)),
+            dict(political_party="Α"),
+            dict(political_party="Β", start_date=date(1991, 1, 1)),
+            dict(member_name="Μέλος 1", end_date=date(1999, 1, 1)),
+            dict(gender="female", political_party="Α"),
+            dict(gender="female", political_party="Β"),
+            dict(political_party="Γ"),
+        ]
+        for speech_filter in filters:
+            self.assertEqual(self.filter_manager.get_documents(SpeechFilter(**speech_filter)).tolist(),
+                             self.expected(**speech_filter))
+
+    def test_missing_group(self):
+        self.assertEqual(self.filter_manager.get_filterable_attributes(), {"political_party", "member_name", "gender"})
+        with self.assertRaises(ValueError):
+            self.filter_manager.get_documents(SpeechFilter(member_region="Αττική"))
+
+    def test_missing_dates_file(self):
+        os.remove("dates/sitting_dates.npy")
+        with self.assertRaises(RuntimeError):
+            FilterManager(GroupManager())
+
+
+class TestFacetManager(unittest.TestCase):
+
+    def setUp(self):
+        self.original_directory = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+        create_groups_and_dates()
+        self.facet_manager = FacetManager(GroupManager(), np.load("dates/sitting_dates.npy"))
+
+    def tearDown(self):
+        os.chdir(self.original_directory)
+        self.directory.cleanup()
+
+    def test_counts(self):
+        documents = np.array([0, 1, 2, 4, 7, 9])
+        counts = self.facet_manager.get_facet_counts(documents)
+        self.assertEqual(counts["political_party"], {"Α": 4, "Β": 2})
+        self.assertEqual(list(counts["political_party"]), ["Α", "Β"])
+        self.assertEqual(counts["member_name"], {"Μέλος 2": 2, "Μέλος 1": 2, "Μέλος 3": 2})
+        self.assertEqual(counts["year"], {"1990": 3, "2000": 2, "1991": 1})
+        self.assertEqual(self.facet_manager.count("gender", np.arange(10)), {"male": 8, "female": 2})
+        self.assertEqual(self.facet_manager.count("political_party", np.zeros(0, dtype=np.int64)), {})
+        # Speeches without groups are not counted
+        self.assertEqual(self.facet_manager.count("political_party", np.array([3, 10, 11])), {"Α": 1})
+
+    def test_unknown_facet(self):
+        with self.assertRaises(ValueError):
+            self.facet_manager.count("party", np.arange(10))
+        with self.assertRaises(ValueError):
+            self.facet_manager.get_facet_counts(np.arange(10), ("political_party", "speech"))
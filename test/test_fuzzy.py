@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from greparl.SearchEngine.backend.inverted.fuzzy import TermNGramIndex, edit_distance, get_max_distance
+
+
+def reference_edit_distance(first, second):
+    distances = np.zeros((len(first) + 1, len(second) + 1), dtype=int)
+    distances[:, 0] = np.arange(len(first) + 1)
+    distances[0, :] = np.arange(len(second) + 1)
+    for i in range(1, len(first) + 1):
+        for j in range(1, len(second) + 1):
+            distances[i, j] = min(distances[i - 1, j] + 1, distances[i, j - 1] + 1,
+                                  distances[i - 1, j - 1] + (first[i - 1] != second[j - 1]))
+    return int(distances[-1, -1])
+
+
+def random_terms(rng, count, alphabet="ΑΒΓΔΕ"):
+    return ["".join(rng.choice(list(alphabet), rng.integers(1, 9))) for _ in range(count)]
+
+
+class TestTermNGramIndex(unittest.TestCase):
+
+    def test_edit_distance(self):
+        rng = np.random.default_rng(1)
+        for first, second in zip(random_terms(rng, 300), random_terms(rng, 300)):
+            distance = reference_edit_distance(first, second)
+            for max_distance in range(4):
+                self.assertEqual(edit_distance(first, second, max_distance), min(distance, max_distance + 1))
+
+    def test_find(self):
+        rng = np.random.default_rng(2)
+        terms = sorted(set(random_terms(rng, 2000)))
+        queries = random_terms(rng, 100) + ["", "ΖΗΘ", "ΑΑΑΑΑΑΑΑ"]
+        distances = [[reference_edit_distance(term, other_term) for other_term in terms] for term in queries]
+        with tempfile.TemporaryDirectory() as directory:
+            ngram_file_name = os.path.join(directory, "ngrams")
+            TermNGramIndex.write(ngram_file_name, terms)
+            for term_ngrams in (TermNGramIndex.from_terms(terms), TermNGramIndex.open(ngram_file_name,
+                                                                                      terms.__getitem__)):
+                self.assertEqual(len(term_ngrams), len(terms))
+                for term, term_distances in zip(queries, distances):
+                    for max_distance in (1, 2):
+                        expected = {(term_id, distance) for term_id, distance in enumerate(term_distances)
+                                    if distance <= max_distance}
+                        similar_terms = term_ngrams.find(term, max_distance)
+                        self.assertEqual(set(similar_terms), expected)
+                        # Closest first
+                        self.assertEqual([distance for _, distance in similar_terms],
+                                         sorted(distance for _, distance in similar_terms))
+
+    def test_empty_vocabulary(self):
+        self.assertEqual(TermNGramIndex.from_terms([]).find("ΑΒΓ", 1), [])
+
+    def test_max_distance(self):
+        self.assertEqual([get_max_distance(term) for term in ("ΑΒ", "ΑΒΓ", "ΑΒΓΔΕ", "ΑΒΓΔΕΖ")], [0, 1, 1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
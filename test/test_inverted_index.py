@@ -0,0 +1,838 @@
+import heapq
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from math import log
+from unittest import mock
+
+import numpy as np
+from scipy.sparse import random as sparse_random
+from sklearn.feature_extraction.text import CountVectorizer
+
+from greparl.SearchEngine.backend.inverted import inverted_index
+from greparl.SearchEngine.backend.inverted.builder import build_index_from_file, build_index_in_parallel, tokenize
+from greparl.SearchEngine.backend.inverted.inverted_index import InvertedIndex, convert_to_binary, is_binary_index, \
+    calculate_idf, calculate_tf, search_exhaustive, search_first_tier, METADATA_HEADER, METADATA_MAGIC
+from greparl.SearchEngine.backend.inverted.lexicon import Lexicon
+from greparl.SearchEngine.backend.inverted.batch import search_many
+from greparl.SearchEngine.backend.inverted.bm25 import BM25
+from greparl.SearchEngine.backend.inverted.boolean import BooleanQuery, BooleanClause, Occur, Wildcard, \
+    evaluate_query, expand_misspellings, search_boolean_query, union_documents
+from greparl.SearchEngine.backend.inverted.files import atomic_write
+from greparl.SearchEngine.backend.inverted.fuzzy import edit_distance
+from greparl.SearchEngine.backend.inverted.phrase import Phrase, match_phrase
+from greparl.SearchEngine.backend.inverted.positions import encode_position_lists, encode_position_list, \
+    decode_position_list, decode_positions
+from greparl.SearchEngine.backend.inverted.segments import SegmentedIndex
+from greparl.SearchEngine.backend.inverted import shards
+from greparl.SearchEngine.backend.inverted.shards import ShardedIndex, create_shards, find_shard_boundaries
+from greparl.SearchEngine.backend.inverted.postings import encode_varints, decode_varints, encode_posting_list, \
+    encode_posting_lists, decode_posting_list, decode_block, BLOCK_SIZE
+
+PROCESSED_SPEECHES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "processed",
+                                  "stemmed-with-stopwords.txt")
+
+
+def random_count_matrix(documents=600, terms=40, density=0.2, seed=0):
+    """Create a random document-term count matrix with small integer counts.
+    """
+    matrix = sparse_random(documents, terms, density=density, format="csr", random_state=seed)
+    matrix.data = np.ceil(matrix.data * 20)
+    return matrix.astype(np.int64)
+
+
+def reference_search(index, query_tokens, number_of_results=10):
+    """Score the query one posting at a time, the way the index originally did.
+    """
+    rankings = {}
+    for token in query_tokens:
+        entries = index.get_term_appearances(token)
+        if not entries:
+            continue
+        idf = calculate_idf(index.total_documents, len(entries))
+        for entry in entries:
+            rankings[entry.document_id] = rankings.get(entry.document_id, 0) + (1 + log(entry.term_frequency)) * idf
+    scores = [(score / index.lengths[document_id], document_id) for document_id, score in rankings.items()]
+    return [document_id for score, document_id in heapq.nlargest(number_of_results, scores)]
+
+
+def reference_bm25_scores(count_matrix, terms, query_tokens, k1, b):
+    """Score the query with the textbook BM25 formula, one document at a time.
+    :return: dictionary with the score of every matching document
+    """
+    count_matrix = count_matrix.tocsc()
+    total_documents = count_matrix.shape[0]
+    document_tokens = count_matrix.sum(axis=1).A1
+    average_length = document_tokens.mean()
+    terms = terms.tolist()
+    rankings = {}
+    for token in query_tokens:
+        if token not in terms:
+            continue
+        column = count_matrix.getcol(terms.index(token)).tocoo()
+        document_frequency = len(column.row)
+        idf = log(1 + (total_documents - document_frequency + 0.5) / (document_frequency + 0.5))
+        for document_id, term_frequency in zip(column.row.tolist(), column.data.tolist()):
+            normalization = k1 * (1 - b + b * document_tokens[document_id] / average_length)
+            rankings[document_id] = rankings.get(document_id, 0) + \
+                idf * term_frequency * (k1 + 1) / (term_frequency + normalization)
+    return rankings
+
+
+class TestPostings(unittest.TestCase):
+
+    def test_varints(self):
+        values = np.array([0, 1, 127, 128, 300, 16384, 2**32 - 1, 5])
+        self.assertEqual(decode_varints(encode_varints(values)).tolist(), values.tolist())
+        self.assertEqual(decode_varints(encode_varints([])).tolist(), [])
+
+    def test_posting_list(self):
+        document_ids = np.unique(np.random.default_rng(1).integers(0, 100000, 1000))
+        term_frequencies = np.arange(len(document_ids)) % 7 + 1
+        encoded = b"padding" + encode_posting_list(document_ids, term_frequencies)
+        decoded_ids, decoded_tfs = decode_posting_list(encoded, offset=len(b"padding"))
+        self.assertEqual(decoded_ids.tolist(), document_ids.tolist())
+        self.assertEqual(decoded_tfs.tolist(), term_frequencies.tolist())
+        # Every block can also be decoded on its own
+        block_ids, block_tfs = decode_block(encoded, 2, offset=len(b"padding"))
+        self.assertEqual(block_ids.tolist(), document_ids[2 * BLOCK_SIZE:3 * BLOCK_SIZE].tolist())
+        self.assertEqual(block_tfs.tolist(), term_frequencies[2 * BLOCK_SIZE:3 * BLOCK_SIZE].tolist())
+
+    def test_encode_many_posting_lists(self):
+        rng = np.random.default_rng(3)
+        lists = [np.unique(rng.integers(0, 5000, size)) for size in (0, 1, 127, 128, 129, 600, 0, 3)]
+        frequencies = [rng.integers(1, 300, len(document_ids)) for document_ids in lists]
+        indptr = np.cumsum([7] + [len(document_ids) for document_ids in lists])
+        padding = np.zeros(7, dtype=np.int64)
+        encoded, offsets = encode_posting_lists(indptr, np.concatenate([padding] + lists),
+                                                np.concatenate([padding] + frequencies))
+        expected = [encode_posting_list(*posting_list) for posting_list in zip(lists, frequencies)]
+        self.assertEqual(encoded.tobytes(), b"".join(expected))
+        self.assertEqual(offsets.tolist(), np.cumsum([0] + [len(entry) for entry in expected])[:-1].tolist())
+
+    def test_positions(self):
+        rng = np.random.default_rng(5)
+        lists = []
+        for document_frequency in (0, 1, 127, 128, 300, 2):
+            term_frequencies = rng.integers(1, 6, document_frequency)
+            positions = [np.sort(rng.choice(5000, count, replace=False)) for count in term_frequencies]
+            lists.append((term_frequencies, np.concatenate([np.zeros(0, dtype=np.int64)] + positions), positions))
+        indptr = np.cumsum([0] + [len(term_frequencies) for term_frequencies, _, _ in lists])
+        encoded, offsets = encode_position_lists(indptr, np.concatenate([entry[0] for entry in lists]),
+                                                 np.concatenate([entry[1] for entry in lists]))
+        encoded = encoded.tobytes()
+        self.assertEqual(encoded, b"".join(encode_position_list(*entry[:2]) for entry in lists))
+        for (term_frequencies, all_positions, positions), offset in zip(lists, offsets.tolist()):
+            self.assertEqual(decode_position_list(encoded, term_frequencies, offset).tolist(), all_positions.tolist())
+            selected = np.flatnonzero(np.arange(len(term_frequencies)) % 3 == 1)
+            expected = np.concatenate([np.zeros(0, dtype=np.int64)] + [positions[i] for i in selected])
+            self.assertEqual(decode_positions(encoded, term_frequencies, selected, offset).tolist(),
+                             expected.tolist())
+
+
+class TestAtomicWrite(unittest.TestCase):
+
+    def test_atomic_write(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, "file")
+            with atomic_write(file_name, "w", encoding="utf8") as file:
+                file.write("old")
+            with self.assertRaises(ValueError):
+                with atomic_write(file_name, "w", encoding="utf8") as file:
+                    file.write("partial")
+                    raise ValueError()
+            # A failed write leaves the old file untouched
+            with open(file_name, encoding="utf8") as file:
+                self.assertEqual(file.read(), "old")
+            self.assertEqual(os.listdir(directory), ["file"])
+
+
+class TestLexicon(unittest.TestCase):
+
+    def test_find(self):
+        with tempfile.TemporaryDirectory() as directory:
+            terms = ["ΚΥΒΕΡΝΗΣ", "ΑΓΙΑΣΜ", "ΒΟΥΛ", "Α", "ΩΡ"]
+            lexicon_file_name = os.path.join(directory, "lexicon")
+            Lexicon.write(lexicon_file_name, terms, [10, 20, 30, 40, 50], [1, 2, 3, 4, 5], [6, 7, 8, 9, 10],
+                          [0.1, 0.2, 0.3, 0.4, 0.5])
+            lexicon = Lexicon(lexicon_file_name)
+            self.assertEqual(list(lexicon.terms()), sorted(terms))
+            for position, term in enumerate(terms):
+                term_id = lexicon.find(term)
+                self.assertEqual(lexicon.get_term(term_id), term)
+                self.assertEqual(lexicon.offsets[term_id], (position + 1) * 10)
+                self.assertEqual(lexicon.document_frequencies[term_id], position + 1)
+                self.assertEqual(lexicon.max_term_frequencies[term_id], position + 6)
+            for missing in ("", "ΑΑ", "ΚΥΒ", "ΩΩ"):
+                self.assertEqual(lexicon.find(missing), -1)
+
+    def test_expand(self):
+        with tempfile.TemporaryDirectory() as directory:
+            terms = ["ΜΕΤΑΝΑΣΤ", "ΜΕΤΑΝΑΣΤΕΥΣ", "ΜΕΤΑΝΑΣΤΕΣ", "ΜΕΤΑ", "ΜΕΤΡ", "ΜΕ", "ΜΗ", "Α", "ΩΡ", "ΜΕΤΑΝΟ"]
+            document_frequencies = [5, 3, 8, 20, 1, 30, 2, 7, 1, 4]
+            lexicon_file_name = os.path.join(directory, "lexicon")
+            Lexicon.write(lexicon_file_name, terms, np.zeros(len(terms)), document_frequencies, np.ones(len(terms)),
+                          np.ones(len(terms)))
+            lexicon = Lexicon(lexicon_file_name)
+            for prefix in ("", "ΜΕΤΑ", "ΜΕΤΑΝΑΣΤΕ", "ΜΗ", "Ω", "ΖΖ", "ΩΡΑ"):
+                start, end = lexicon.find_prefix(prefix)
+                self.assertEqual([lexicon.get_term(term_id) for term_id in range(start, end)],
+                                 sorted(term for term in terms if term.startswith(prefix)))
+
+            def expand(pattern, max_terms=10):
+                return [lexicon.get_term(term_id) for term_id in lexicon.expand(pattern, max_terms)]
+
+            self.assertEqual(expand("ΜΕΤΑΝΑΣΤ*"), ["ΜΕΤΑΝΑΣΤ", "ΜΕΤΑΝΑΣΤΕΣ", "ΜΕΤΑΝΑΣΤΕΥΣ"])
+            self.assertEqual(expand("ΜΕΤ?"), ["ΜΕΤΑ", "ΜΕΤΡ"])
+            self.assertEqual(expand("ΜΕΤΑ*Σ"), ["ΜΕΤΑΝΑΣΤΕΣ", "ΜΕΤΑΝΑΣΤΕΥΣ"])
+            self.assertEqual(expand("ΜΗ"), ["ΜΗ"])
+            self.assertEqual(expand("ΖΖ*"), [])
+            # Only the most frequent terms are kept
+            self.assertEqual(expand("ΜΕ*", 3), ["ΜΕ", "ΜΕΤΑ", "ΜΕΤΑΝΑΣΤΕΣ"])
+
+
+class TestInvertedIndex(unittest.TestCase):
+
+    def setUp(self):
+        # The index is always created in the index folder of the working directory
+        self.original_directory = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+        self.count_matrix = random_count_matrix()
+        self.terms = np.array(["TERM{}".format(i) for i in range(self.count_matrix.shape[1])])
+
+    def tearDown(self):
+        os.chdir(self.original_directory)
+        self.directory.cleanup()
+
+    def assert_postings_match_matrix(self, index):
+        columns = self.count_matrix.tocsc()
+        for term_index, term in enumerate(self.terms):
+            column = columns.getcol(term_index).tocoo()
+            document_ids, term_frequencies = index.get_postings(term)
+            self.assertEqual(document_ids.tolist(), column.row.tolist())
+            self.assertEqual(term_frequencies.tolist(), column.data.tolist())
+
+    def test_binary_and_text_formats(self):
+        for binary in (True, False):
+            index = InvertedIndex("index", replace=True, binary=binary)
+            index.populate_index(self.count_matrix, self.terms)
+            self.assertEqual(is_binary_index("index/index"), binary)
+            self.assert_postings_match_matrix(InvertedIndex("index"))
+
+    def test_blocks(self):
+        self.count_matrix = random_count_matrix(density=0.6)
+        for binary in (True, False):
+            InvertedIndex("index", replace=True, binary=binary).populate_index(self.count_matrix, self.terms)
+            index = InvertedIndex("index")
+            for term in self.terms:
+                document_ids, term_frequencies = index.get_postings(term)
+                last_document_ids, max_term_frequencies = index.get_blocks(term)
+                self.assertEqual(last_document_ids.tolist(), document_ids[BLOCK_SIZE - 1::BLOCK_SIZE].tolist() +
+                                 ([document_ids[-1]] if len(document_ids) % BLOCK_SIZE else []))
+                self.assertEqual(max_term_frequencies.tolist(), [term_frequencies[start:start + BLOCK_SIZE].max()
+                                 for start in range(0, len(document_ids), BLOCK_SIZE)])
+                for blocks in ([0], [1, 2], [0, 2], list(range(len(last_document_ids)))):
+                    blocks = [block for block in blocks if block < len(last_document_ids)]
+                    selected = np.concatenate([np.zeros(0, dtype=np.int64)] +
+                                              [np.arange(block * BLOCK_SIZE, min((block + 1) * BLOCK_SIZE,
+                                                                                 len(document_ids)))
+                                               for block in blocks])
+                    self.assertEqual([postings.tolist() for postings in index.get_block_postings(term, blocks)],
+                                     [document_ids[selected].tolist(), term_frequencies[selected].tolist()])
+
+    def test_convert_to_binary(self):
+        text_index = InvertedIndex("index", replace=True, binary=False)
+        text_index.populate_index(self.count_matrix, self.terms)
+        query = ["TERM1", "TERM7", "TERM30"]
+        expected = InvertedIndex("index").search(query)
+        convert_to_binary("index")
+        binary_index = InvertedIndex("index")
+        self.assertTrue(binary_index.binary)
+        self.assert_postings_match_matrix(binary_index)
+        self.assertEqual(binary_index.search(query), expected)
+
+    def test_populate_in_chunks(self):
+        with mock.patch.object(inverted_index, "POSTINGS_PER_CHUNK", 50):
+            for binary in (True, False):
+                InvertedIndex("index", replace=True, binary=binary).populate_index(self.count_matrix, self.terms)
+                self.assert_postings_match_matrix(InvertedIndex("index"))
+
+    def test_document_statistics(self):
+        InvertedIndex("index", replace=True).populate_index(self.count_matrix, self.terms)
+        index = InvertedIndex("index")
+        self.assertEqual(index.total_documents, self.count_matrix.shape[0])
+        squared_counts = self.count_matrix.multiply(self.count_matrix)
+        self.assertTrue(np.allclose(index.lengths, np.sqrt(squared_counts.sum(axis=1)).A1))
+        self.assertEqual(index.documents["tokens"].tolist(), self.count_matrix.sum(axis=1).A1.tolist())
+        self.assertEqual(index.documents["unique_terms"].tolist(), np.diff(self.count_matrix.indptr).tolist())
+        # The total number of tokens is stored at build time, so the tokens of the documents are not summed again
+        self.assertEqual(index.total_tokens, self.count_matrix.sum())
+        with open("index/index-metadata", "wb") as metadata_file:
+            metadata_file.write(METADATA_HEADER.pack(METADATA_MAGIC, self.count_matrix.shape[0], 12345))
+        self.assertEqual(InvertedIndex("index").average_document_length, 12345 / self.count_matrix.shape[0])
+        # Indexes without the metadata file get it when they are opened
+        os.remove("index/index-metadata")
+        self.assertEqual(InvertedIndex("index").total_tokens, self.count_matrix.sum())
+        self.assertTrue(os.path.exists("index/index-metadata"))
+
+    def test_open_older_index(self):
+        index = InvertedIndex("index", replace=True, binary=False)
+        index.populate_index(self.count_matrix, self.terms)
+        expected_documents = np.array(index.documents)
+        # Recreate the text catalog and lengths file of older indexes and remove the files that replaced them
+        with open("index/index-catalog", "w", encoding="utf8") as catalog:
+            for term_id, term in enumerate(index.lexicon.terms()):
+                catalog.write("{},{}\n".format(term, index.lexicon.offsets[term_id]))
+        with open("index/index-lengths", "w", encoding="utf8") as lengths:
+            lengths.writelines("{}\n".format(length) for length in index.lengths)
+        os.remove("index/index-lexicon")
+        os.remove("index/index-documents.npy")
+        index = InvertedIndex("index")
+        self.assert_postings_match_matrix(index)
+        for term_index, term in enumerate(self.terms):
+            self.assertEqual(index.get_document_frequency(term), self.count_matrix[:, term_index].count_nonzero())
+        self.assertEqual(index.documents.tolist(), expected_documents.tolist())
+
+    def test_search_matches_reference(self):
+        InvertedIndex("index", replace=True).populate_index(self.count_matrix, self.terms)
+        index = InvertedIndex("index")
+        for query in (["TERM0"], ["TERM3", "TERM12", "TERM25"], ["TERM5", "TERM5", "MISSING"], ["MISSING"]):
+            for number_of_results in (1, 10, 1000):
+                self.assertEqual(index.search(query, number_of_results),
+                                 reference_search(index, query, number_of_results))
+
+    def test_bm25(self):
+        InvertedIndex("index", replace=True).populate_index(self.count_matrix, self.terms)
+        index = InvertedIndex("index")
+        self.assertAlmostEqual(index.average_document_length, self.count_matrix.sum() / self.count_matrix.shape[0])
+        rng = np.random.default_rng(3)
+        for k1, b in ((1.2, 0.75), (2.0, 0.0), (0.5, 1.0)):
+            bm25 = BM25(k1=k1, b=b)
+            for _ in range(10):
+                query = ["TERM{}".format(i) for i in rng.integers(0, len(self.terms) + 3, rng.integers(1, 6))]
+                scores = reference_bm25_scores(self.count_matrix, self.terms, query, k1, b)
+                expected = sorted(scores.values(), reverse=True)[:20]
+                # Scores are accumulated in single precision, so documents with almost equal scores may be swapped
+                ranking = index.search(query, 20, bm25=bm25)
+                self.assertTrue(np.allclose([scores[document_id] for document_id in ranking], expected, rtol=1e-5))
+                self.assertEqual(index.search(query, 20, dynamic_pruning=True, bm25=bm25), ranking)
+                documents = np.arange(100, 400)
+                self.assertEqual(index.search(query, 20, documents=documents, bm25=bm25),
+                                 [document_id for document_id in index.search(query, 600, bm25=bm25)
+                                  if 100 <= document_id < 400][:20])
+
+    def test_dynamic_pruning_matches_exhaustive(self):
+        InvertedIndex("index", replace=True).populate_index(self.count_matrix, self.terms)
+        index = InvertedIndex("index")
+        rng = np.random.default_rng(2)
+        for _ in range(30):
+            query = ["TERM{}".format(i) for i in rng.integers(0, len(self.terms) + 3, rng.integers(1, 6))]
+            for number_of_results in (1, 10, 50):
+                self.assertEqual(index.search(query, number_of_results, dynamic_pruning=True),
+                                 index.search(query, number_of_results))
+
+    def test_tiers(self):
+        InvertedIndex("index", replace=True, tier_size=30).populate_index(self.count_matrix, self.terms)
+        index = InvertedIndex("index")
+        self.assertEqual(index.tier_size, 30)
+        columns = self.count_matrix.tocsc()
+        for term_index, term in enumerate(self.terms):
+            document_ids, term_frequencies, impact_bound = index.get_tier_postings(term)
+            impacts = calculate_tf(term_frequencies) / index.lengths[document_ids]
+            all_document_ids, all_term_frequencies = index.get_postings(term)
+            all_impacts = calculate_tf(all_term_frequencies) / index.lengths[all_document_ids]
+            self.assertEqual(len(document_ids), min(30, columns.getcol(term_index).nnz))
+            # The tier holds the postings with the highest impacts, by descending impact
+            self.assertTrue(np.all(np.diff(impacts) <= 0))
+            self.assertEqual(impacts.tolist(), sorted(all_impacts.tolist(), reverse=True)[:30])
+            self.assertEqual(impact_bound, impacts[-1] if len(all_document_ids) > 30 else 0.0)
+        # An index replaced without a tier does not keep the old one
+        InvertedIndex("index", replace=True).populate_index(self.count_matrix, self.terms)
+        self.assertIsNone(InvertedIndex("index").tier_size)
+
+    def test_tiered_search_matches_exhaustive(self):
+        InvertedIndex("index", replace=True, tier_size=30).populate_index(self.count_matrix, self.terms)
+        index = InvertedIndex("index")
+        rng = np.random.default_rng(11)
+        for _ in range(30):
+            query = ["TERM{}".format(i) for i in rng.integers(0, len(self.terms) + 3, rng.integers(1, 6))]
+            for number_of_results in (1, 10, 50):
+                self.assertEqual(index.search(query, number_of_results),
+                                 search_exhaustive(index, query, number_of_results))
+                approximate = search_first_tier(index, query, number_of_results, certify=False)
+                self.assertLessEqual(len(approximate), number_of_results)
+                self.assertTrue(set(approximate) <= set(search_exhaustive(index, query, 1000)))
+        # The results of a single term found in its tier are certain, so its full posting list is not searched
+        for term in self.terms:
+            self.assertEqual(search_first_tier(index, [term], 10), search_exhaustive(index, [term], 10))
+
+
+class TestBooleanQuery(unittest.TestCase):
+
+    def setUp(self):
+        self.original_directory = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+        # Long posting lists, with many blocks each
+        count_matrix = random_count_matrix(documents=6000, terms=12, density=0.3, seed=7).tolil()
+        # A rare term
+        count_matrix[:, 11] = 0
+        count_matrix[[5, 700, 2500, 5999], 11] = 1
+        self.count_matrix = count_matrix.tocsc()
+        self.count_matrix.eliminate_zeros()
+        terms = np.array(["TERM{}".format(i) for i in range(self.count_matrix.shape[1])])
+        InvertedIndex("index", replace=True).populate_index(self.count_matrix, terms)
+        self.index = InvertedIndex("index")
+
+    def tearDown(self):
+        os.chdir(self.original_directory)
+        self.directory.cleanup()
+
+    def documents_of(self, term_index):
+        return set(self.count_matrix[:, term_index].nonzero()[0].tolist())
+
+    def test_intersect_postings(self):
+        rng = np.random.default_rng(8)
+        ranges = [np.arange(0, 6000), np.arange(130, 131), np.arange(2000, 3100)]
+        for document_ids in [np.unique(rng.integers(0, 6000, size)) for size in (0, 1, 10, 300, 6000)] + ranges:
+            for term_index in (0, 11):
+                found, term_frequencies = self.index.intersect_postings("TERM{}".format(term_index), document_ids)
+                expected = sorted(self.documents_of(term_index) & set(document_ids.tolist()))
+                self.assertEqual(found.tolist(), expected)
+                self.assertEqual(term_frequencies.tolist(), [self.count_matrix[i, term_index] for i in expected])
+        self.assertEqual(self.index.intersect_postings("MISSING", np.arange(10))[0].tolist(), [])
+
+    def test_evaluate_query(self):
+        def clause(occur, term_index):
+            return BooleanClause(occur, "TERM{}".format(term_index))
+
+        everything = set(range(6000))
+        queries = [
+            (BooleanQuery([clause(Occur.MUST, 0), clause(Occur.MUST, 1)]), self.documents_of(0) & self.documents_of(1)),
+            (BooleanQuery([clause(Occur.MUST, 0), clause(Occur.SHOULD, 1), clause(Occur.MUST_NOT, 2)]),
+             self.documents_of(0) - self.documents_of(2)),
+            (BooleanQuery([clause(Occur.SHOULD, 3), clause(Occur.SHOULD, 11), clause(Occur.MUST_NOT, 4)]),
+             (self.documents_of(3) | self.documents_of(11)) - self.documents_of(4)),
+            (BooleanQuery([clause(Occur.MUST, 11), clause(Occur.MUST, 5)]),
+             self.documents_of(11) & self.documents_of(5)),
+            (BooleanQuery([clause(Occur.MUST_NOT, 0)]), set()),
+            (BooleanQuery([clause(Occur.MUST, 6), BooleanClause(Occur.MUST, BooleanQuery(
+                [clause(Occur.SHOULD, 7), clause(Occur.SHOULD, 8)]))]),
+             self.documents_of(6) & (self.documents_of(7) | self.documents_of(8))),
+            (BooleanQuery([clause(Occur.MUST, 6), BooleanClause(Occur.MUST_NOT, BooleanQuery(
+                [clause(Occur.MUST, 7), clause(Occur.MUST, 8)]))]),
+             self.documents_of(6) - (self.documents_of(7) & self.documents_of(8))),
+            (BooleanQuery([clause(Occur.MUST, 0), BooleanClause(Occur.MUST, "MISSING")]), set()),
+        ]
+        for query, expected in queries:
+            self.assertEqual(evaluate_query(self.index, query).tolist(), sorted(expected & everything))
+
+    def test_ranking(self):
+        query = BooleanQuery([BooleanClause(Occur.MUST, "TERM0"), BooleanClause(Occur.SHOULD, "TERM1"),
+                              BooleanClause(Occur.MUST_NOT, "TERM2")])
+        allowed = self.documents_of(0) - self.documents_of(2)
+        # Matching documents are ranked with the scores of the plain search
+        expected = [document_id for document_id in self.index.search(["TERM0", "TERM1"], 6000)
+                    if document_id in allowed]
+        self.assertEqual(search_boolean_query(self.index, query, 6000), expected)
+        self.assertEqual(search_boolean_query(self.index, query, 10), expected[:10])
+        disjunction = BooleanQuery([BooleanClause(Occur.SHOULD, "TERM3"), BooleanClause(Occur.SHOULD, "TERM11")])
+        self.assertEqual(search_boolean_query(self.index, disjunction, 20), self.index.search(["TERM3", "TERM11"], 20))
+
+    def test_filtered_ranking(self):
+        query = BooleanQuery([BooleanClause(Occur.MUST, "TERM0"), BooleanClause(Occur.SHOULD, "TERM1")])
+        disjunction = BooleanQuery([BooleanClause(Occur.SHOULD, "TERM3"), BooleanClause(Occur.SHOULD, "TERM11")])
+        rng = np.random.default_rng(9)
+        # A contiguous range of documents, like a date range, and a scattered set, like the speeches of a party
+        for documents in (np.arange(1000, 2500), np.unique(rng.integers(0, 6000, 800))):
+            allowed = set(documents.tolist())
+            for boolean_query, terms in ((query, ["TERM0", "TERM1"]), (disjunction, ["TERM3", "TERM11"])):
+                expected = [document_id for document_id in search_boolean_query(self.index, boolean_query, 6000)
+                            if document_id in allowed]
+                self.assertEqual(search_boolean_query(self.index, boolean_query, 6000, documents=documents), expected)
+                self.assertEqual(search_boolean_query(self.index, boolean_query, 10, documents=documents),
+                                 expected[:10])
+
+    def test_wildcards(self):
+        # TERM1, TERM10 and TERM11
+        expansion = ["TERM1", "TERM10", "TERM11"]
+        self.assertEqual(self.index.expand_pattern("TERM1*"), expansion)
+        self.assertEqual(self.index.expand_pattern("TERM1?"), ["TERM10", "TERM11"])
+        self.assertEqual(self.index.expand_pattern("TERM1*", 1), ["TERM10"] if self.index.get_document_frequency(
+            "TERM10") > self.index.get_document_frequency("TERM1") else ["TERM1"])
+        union = self.documents_of(1) | self.documents_of(10) | self.documents_of(11)
+        optional = BooleanQuery([BooleanClause(Occur.SHOULD, Wildcard("TERM1*"))])
+        self.assertEqual(evaluate_query(self.index, optional).tolist(), sorted(union))
+        self.assertEqual(search_boolean_query(self.index, optional, 50), self.index.search(expansion, 50))
+        required = BooleanQuery([BooleanClause(Occur.MUST, "TERM0"), BooleanClause(Occur.MUST, Wildcard("TERM1*"))])
+        expected = [document_id for document_id in self.index.search(["TERM0"] + expansion, 6000)
+                    if document_id in self.documents_of(0) & union]
+        self.assertEqual(search_boolean_query(self.index, required, 6000), expected)
+        excluded = BooleanQuery([BooleanClause(Occur.MUST, "TERM0"), BooleanClause(Occur.MUST_NOT, Wildcard("TERM1*"))])
+        self.assertEqual(evaluate_query(self.index, excluded).tolist(), sorted(self.documents_of(0) - union))
+        missing = BooleanQuery([BooleanClause(Occur.MUST, "TERM0"), BooleanClause(Occur.MUST, Wildcard("OTHER*"))])
+        self.assertEqual(search_boolean_query(self.index, missing, 10), [])
+
+    def test_misspellings(self):
+        terms = ["TERM{}".format(i) for i in range(self.count_matrix.shape[1])]
+        for term in ("TERN11", "TERM1X", "TEM", "XTERM", "ZZZZZZ", "TERM3"):
+            expected = sorted(((other_term, edit_distance(term, other_term, 2)) for other_term in terms
+                               if edit_distance(term, other_term, 2) <= 2),
+                              key=lambda similar_term: (similar_term[1],
+                                                        -self.index.get_document_frequency(similar_term[0])))
+            self.assertEqual(self.index.get_similar_terms(term, 2), expected)
+        self.assertEqual(self.index.get_similar_terms("TERM1X", 0), [])
+        # The n-gram index is built along with the index, and indexes without it get it when they are opened
+        self.assertTrue(os.path.exists(self.index.ngrams_file_name))
+        os.remove(self.index.ngrams_file_name)
+        self.assertEqual(InvertedIndex("index").get_similar_terms("TERN11", 1), [("TERM11", 1)])
+        self.assertTrue(os.path.exists(self.index.ngrams_file_name))
+        query = BooleanQuery([BooleanClause(Occur.SHOULD, "TERN11"), BooleanClause(Occur.MUST, "TERM0"),
+                              BooleanClause(Occur.MUST_NOT, "TERN2"), BooleanClause(Occur.SHOULD, "ZZZZZZ")])
+        self.assertEqual(expand_misspellings(self.index, query), BooleanQuery([
+            BooleanClause(Occur.SHOULD, "TERM11"), BooleanClause(Occur.MUST, "TERM0"),
+            BooleanClause(Occur.MUST_NOT, "TERN2"), BooleanClause(Occur.SHOULD, "ZZZZZZ")]))
+        # Only the closest and most frequent terms replace a misspelled one
+        closest_terms = [term for term, distance in self.index.get_similar_terms("TERM1X") if distance == 1]
+        self.assertEqual(sorted(closest_terms), ["TERM1", "TERM10", "TERM11"])
+        required = BooleanQuery([BooleanClause(Occur.MUST, BooleanQuery([BooleanClause(Occur.MUST, "TERM1X")]))])
+        self.assertEqual(expand_misspellings(self.index, required, max_terms=2), BooleanQuery([
+            BooleanClause(Occur.MUST, BooleanQuery([BooleanClause(Occur.MUST, BooleanQuery([
+                BooleanClause(Occur.SHOULD, term) for term in closest_terms[:2]]))]))]))
+
+    def test_union_documents(self):
+        rng = np.random.default_rng(10)
+        for sizes in ((), (5,), (3, 4), (2000, 3000, 10)):
+            lists = [np.unique(rng.integers(0, 6000, size)) for size in sizes]
+            expected = sorted(set(document_id for documents in lists for document_id in documents.tolist()))
+            self.assertEqual(union_documents(lists, 6000).tolist(), expected)
+
+    def test_search_many(self):
+        def clause(occur, term_index):
+            return BooleanClause(occur, "TERM{}".format(term_index))
+
+        queries = [
+            BooleanQuery([clause(Occur.SHOULD, 3), clause(Occur.SHOULD, 11)]),
+            BooleanQuery([clause(Occur.MUST, 0), clause(Occur.SHOULD, 1), clause(Occur.MUST_NOT, 2)]),
+            BooleanQuery([clause(Occur.SHOULD, 3), clause(Occur.SHOULD, 0)]),
+            BooleanQuery([clause(Occur.MUST, 11), clause(Occur.MUST, 5)]),
+            BooleanQuery([clause(Occur.SHOULD, 0), BooleanClause(Occur.SHOULD, "MISSING")]),
+        ]
+        for documents, bm25 in ((None, None), (np.arange(1000, 4000), None), (None, BM25())):
+            expected = [search_boolean_query(self.index, query, 20, documents, bm25) for query in queries]
+            with mock.patch.object(self.index, "get_postings", wraps=self.index.get_postings) as get_postings:
+                self.assertEqual(search_many(self.index, queries, 20, documents, bm25), expected)
+            # Each distinct term is read once
+            read_terms = [call.args[0] for call in get_postings.call_args_list]
+            self.assertEqual(sorted(read_terms), sorted(set(term for query in queries for term in query.get_terms())))
+
+
+class TestSpimiIndexBuilder(unittest.TestCase):
+
+    def setUp(self):
+        self.original_directory = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+
+    def tearDown(self):
+        os.chdir(self.original_directory)
+        self.directory.cleanup()
+
+    def test_matches_count_matrix_index(self):
+        with open(PROCESSED_SPEECHES, "r", encoding="utf8") as processed_speeches:
+            lines = processed_speeches.readlines()[1:]
+        vectorizer = CountVectorizer(lowercase=False)
+        InvertedIndex("expected", replace=True).populate_index(vectorizer.fit_transform(lines),
+                                                                 vectorizer.get_feature_names_out())
+        expected = InvertedIndex("expected")
+        # A tiny budget forces many runs to be merged
+        for memory_budget in (2000, 10 ** 9):
+            build_index_from_file(PROCESSED_SPEECHES, InvertedIndex("index", replace=True),
+                                  memory_budget=memory_budget)
+            index = InvertedIndex("index")
+            self.assertEqual(list(index.lexicon.terms()), list(expected.lexicon.terms()))
+            self.assertEqual(index.documents.tolist(), expected.documents.tolist())
+            for term in expected.lexicon.terms():
+                self.assertEqual([postings.tolist() for postings in index.get_postings(term)],
+                                 [postings.tolist() for postings in expected.get_postings(term)])
+            self.assertEqual(index.lexicon.max_weights.tolist(), expected.lexicon.max_weights.tolist())
+
+    def test_positions(self):
+        with open(PROCESSED_SPEECHES, "r", encoding="utf8") as processed_speeches:
+            documents = [tokenize(line) for line in processed_speeches.readlines()[1:]]
+        for memory_budget in (5000, 10 ** 9):
+            build_index_from_file(PROCESSED_SPEECHES, InvertedIndex("index", replace=True, positions=True),
+                                  memory_budget=memory_budget)
+            index = InvertedIndex("index")
+            self.assertTrue(index.positional)
+            for term in ["ΒΟΥΛ", "ΚΑΙ", "ΝΑ", "ΚΥΒΕΡΝΗΣ"]:
+                document_ids, term_frequencies = index.get_postings(term)
+                expected = [position for document_id in document_ids.tolist()
+                            for position, token in enumerate(documents[document_id]) if token == term]
+                all_frequencies, all_positions = index.get_positions(term)
+                self.assertEqual(all_frequencies.tolist(), term_frequencies.tolist())
+                self.assertEqual(all_positions.tolist(), expected)
+                some_frequencies, some_positions = index.get_positions(term, document_ids[1::2])
+                self.assertEqual(some_frequencies.tolist(), term_frequencies[1::2].tolist())
+                self.assertEqual(some_positions.tolist(),
+                                 [position for document_id in document_ids[1::2].tolist()
+                                  for position, token in enumerate(documents[document_id]) if token == term])
+        build_index_in_parallel(PROCESSED_SPEECHES, InvertedIndex("parallel", replace=True, positions=True),
+                                memory_budget=5000, workers=3)
+        parallel = InvertedIndex("parallel")
+        for term in index.lexicon.terms():
+            self.assertEqual([values.tolist() for values in parallel.get_positions(term)],
+                             [values.tolist() for values in index.get_positions(term)])
+
+    def test_phrases(self):
+        with open(PROCESSED_SPEECHES, "r", encoding="utf8") as processed_speeches:
+            documents = [tokenize(line) for line in processed_speeches.readlines()[1:]]
+
+        def contains(tokens, phrase):
+            # Look for the terms in order, with at most max_gap words between them
+            reachable = [position for position, token in enumerate(tokens) if token == phrase.terms[0]]
+            for term in phrase.terms[1:]:
+                reachable = [position for position, token in enumerate(tokens) if token == term and
+                             any(1 <= position - previous <= phrase.max_gap + 1 for previous in reachable)]
+            return bool(reachable)
+
+        build_index_from_file(PROCESSED_SPEECHES, InvertedIndex("index", replace=True, positions=True))
+        index = InvertedIndex("index")
+        phrases = [Phrase(["ΚΥΡΙ", "ΠΡΟΕΔΡ"]), Phrase(["ΤΗΣ", "ΚΥΒΕΡΝΗΣ"]), Phrase(["ΝΑ", "ΝΑ"], 3),
+                   Phrase(["ΚΑΙ", "ΤΟ"], 2), Phrase(["ΜΙΑ", "ΦΟΡΑ"]), Phrase(["ΤΟ", "MISSING"]), Phrase(["ΒΟΥΛ"])]
+        for phrase in phrases:
+            expected = [document_id for document_id, tokens in enumerate(documents) if contains(tokens, phrase)]
+            self.assertEqual(match_phrase(index, phrase).tolist(), expected)
+        # Only documents containing the phrase are ranked
+        phrase = Phrase(["ΤΗΣ", "ΚΥΒΕΡΝΗΣ"])
+        expected = [document_id for document_id in index.search(["ΚΥΒΕΡΝΗΣ"], 100)
+                    if contains(documents[document_id], phrase)]
+        self.assertEqual(index.search(["ΚΥΒΕΡΝΗΣ"], 100, phrases=[phrase]), expected)
+
+    def test_speech_number(self):
+        build_index_from_file(PROCESSED_SPEECHES, InvertedIndex("index", replace=True), speech_number=10)
+        self.assertEqual(InvertedIndex("index").total_documents, 10)
+
+    def test_parallel_build_matches_serial(self):
+        build_index_from_file(PROCESSED_SPEECHES, InvertedIndex("expected", replace=True))
+        expected = InvertedIndex("expected")
+        for workers, speech_number, memory_budget in ((3, -1, 3000), (2, 41, 10 ** 9), (8, 5, 10 ** 9)):
+            build_index_in_parallel(PROCESSED_SPEECHES, InvertedIndex("index", replace=True),
+                                    speech_number=speech_number, memory_budget=memory_budget, workers=workers)
+            index = InvertedIndex("index")
+            if speech_number == -1:
+                self.assertEqual(list(index.lexicon.terms()), list(expected.lexicon.terms()))
+                self.assertEqual(index.documents.tolist(), expected.documents.tolist())
+                self.assertEqual(index.lexicon.max_weights.tolist(), expected.lexicon.max_weights.tolist())
+                terms = expected.lexicon.terms()
+            else:
+                self.assertEqual(index.total_documents, speech_number)
+                self.assertEqual(index.documents.tolist(), expected.documents[:speech_number].tolist())
+                terms = index.lexicon.terms()
+            for term in terms:
+                document_ids, term_frequencies = expected.get_postings(term)
+                kept = document_ids < index.total_documents
+                self.assertEqual([postings.tolist() for postings in index.get_postings(term)],
+                                 [document_ids[kept].tolist(), term_frequencies[kept].tolist()])
+
+
+class TestSegmentedIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.original_directory = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+        with open(PROCESSED_SPEECHES, "r", encoding="utf8") as processed_speeches:
+            self.lines = processed_speeches.readlines()[1:]
+        build_index_from_file(PROCESSED_SPEECHES, InvertedIndex("expected", replace=True))
+        self.expected = InvertedIndex("expected")
+        build_index_from_file(PROCESSED_SPEECHES, InvertedIndex("positions", replace=True, positions=True))
+        # The first 60 speeches are in a regular index, the rest are appended later
+        build_index_from_file(PROCESSED_SPEECHES, InvertedIndex("index", replace=True, positions=True),
+                              speech_number=60)
+
+    def tearDown(self):
+        os.chdir(self.original_directory)
+        self.directory.cleanup()
+
+    def assert_matches_expected(self, index):
+        self.assertEqual(index.total_documents, self.expected.total_documents)
+        self.assertEqual(index.documents.tolist(), self.expected.documents.tolist())
+        terms, document_frequencies = self.expected.get_vocabulary()
+        self.assertEqual([vocabulary_part if isinstance(vocabulary_part, list) else vocabulary_part.tolist()
+                          for vocabulary_part in index.get_vocabulary()], [terms, document_frequencies.tolist()])
+        for term in terms:
+            self.assertEqual(index.get_document_frequency(term), self.expected.get_document_frequency(term))
+            self.assertEqual([postings.tolist() for postings in index.get_postings(term)],
+                             [postings.tolist() for postings in self.expected.get_postings(term)])
+            blocks = np.arange(len(index.get_blocks(term)[0]))
+            self.assertEqual([postings.tolist() for postings in index.get_block_postings(term, blocks)],
+                             [postings.tolist() for postings in self.expected.get_postings(term)])
+        rng = np.random.default_rng(4)
+        for _ in range(20):
+            query = [terms[i] for i in rng.integers(0, len(terms), rng.integers(1, 5))]
+            self.assertEqual(index.search(query, 20), self.expected.search(query, 20))
+            self.assertEqual(index.search(query, 5, dynamic_pruning=True), self.expected.search(query, 5))
+
+    def test_add_and_merge_segments(self):
+        index = SegmentedIndex("index")
+        self.assertEqual(index.get_segment_names(), ["index"])
+        index.add_documents(self.lines[60:85])
+        index.add_documents(self.lines[85:])
+        self.assertEqual(len(index.get_segment_names()), 3)
+        # Every change of the segments is a new version
+        self.assertEqual(index.version, 2)
+        self.assert_matches_expected(index)
+        # Segments are listed in the manifest
+        self.assert_matches_expected(SegmentedIndex("index"))
+        phrase = Phrase(["ΤΗΣ", "ΚΥΒΕΡΝΗΣ"])
+        expected = match_phrase(InvertedIndex("positions"), phrase).tolist()
+        self.assertEqual(match_phrase(index, phrase).tolist(), expected)
+        index.merge()
+        self.assertEqual(index.version, 3)
+        self.assertTrue(index.positional)
+        self.assertEqual(match_phrase(index, phrase).tolist(), expected)
+        self.assertEqual(index.get_segment_names(), ["index-segment-3"])
+        self.assertFalse(os.path.exists("index/index"))
+        self.assert_matches_expected(index)
+        self.assert_matches_expected(SegmentedIndex("index"))
+
+    def test_background_merge(self):
+        index = SegmentedIndex("index", max_segments=2)
+        for start in range(60, 100, 10):
+            index.add_documents(self.lines[start:start + 10])
+        index.wait_for_merge()
+        # Segments added during the merge are kept after the merged one
+        self.assertLess(len(index.get_segment_names()), 5)
+        self.assert_matches_expected(index)
+        index.merge_in_background().join()
+        self.assertEqual(len(index.get_segment_names()), 1)
+        self.assert_matches_expected(SegmentedIndex("index"))
+
+    def test_reload_manifest(self):
+        index = SegmentedIndex("index")
+        self.assertEqual(index.search(["ΚΥΒΕΡΝΗΣ"], 200), InvertedIndex("index").search(["ΚΥΒΕΡΝΗΣ"], 200))
+        # Segments added by another process are searched once the manifest changes
+        SegmentedIndex("index").add_documents(self.lines[60:])
+        self.assertEqual(index.version, 1)
+        self.assertEqual(len(index.get_segment_names()), 2)
+        self.assert_matches_expected(index)
+        # Rebuilding the index removes the manifest
+        SegmentedIndex.remove_segments("index")
+        self.assertEqual(index.total_documents, 60)
+        self.assertEqual(index.version, 2)
+
+    def test_tiers(self):
+        build_index_from_file(PROCESSED_SPEECHES, InvertedIndex("index", replace=True, positions=True, tier_size=5),
+                              speech_number=60)
+        index = SegmentedIndex("index")
+        index.add_documents(self.lines[60:85])
+        index.add_documents(self.lines[85:])
+        # New segments have a tier like the existing one
+        self.assertEqual(index.tier_size, 5)
+        self.assertTrue(all(os.path.exists("index/{}-tier".format(name)) for name in index.get_segment_names()))
+        self.assert_matches_expected(index)
+        index.merge()
+        self.assertTrue(os.path.exists("index/{}-tier".format(index.get_segment_names()[0])))
+        self.assert_matches_expected(SegmentedIndex("index"))
+
+    def test_remove_segments(self):
+        index = SegmentedIndex("index")
+        index.add_documents(self.lines[60:])
+        SegmentedIndex.remove_segments("index")
+        self.assertEqual(os.listdir("index").count("index-segment-1"), 0)
+        self.assertEqual(SegmentedIndex("index").total_documents, 60)
+
+
+class TestShardedIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.original_directory = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+        with open(PROCESSED_SPEECHES, "r", encoding="utf8") as processed_speeches:
+            lines = processed_speeches.readlines()[1:]
+        build_index_from_file(PROCESSED_SPEECHES, InvertedIndex("index", replace=True, positions=True, tier_size=5),
+                              speech_number=60)
+        SegmentedIndex("index").add_documents(lines[60:])
+        self.index = SegmentedIndex("index")
+        self.boundaries = [0, 30, 55, self.index.total_documents]
+        create_shards("index", self.boundaries)
+
+    def tearDown(self):
+        os.chdir(self.original_directory)
+        self.directory.cleanup()
+
+    def get_queries(self) -> list[BooleanQuery]:
+        terms, document_frequencies = self.index.get_vocabulary()
+        # Common terms, so that the queries match documents of several shards
+        probabilities = document_frequencies / document_frequencies.sum()
+        rng = np.random.default_rng(12)
+        queries = [BooleanQuery([BooleanClause(Occur.SHOULD, Phrase(["ΤΗΣ", "ΚΥΒΕΡΝΗΣ"])),
+                                 BooleanClause(Occur.SHOULD, Wildcard("ΚΥΒΕΡ*"))])]
+        for _ in range(15):
+            occurs = rng.choice([Occur.SHOULD, Occur.SHOULD, Occur.MUST, Occur.MUST_NOT], rng.integers(1, 5))
+            term_ids = rng.choice(len(terms), len(occurs), p=probabilities)
+            queries.append(BooleanQuery([BooleanClause(Occur(occur), terms[i]) for occur, i in zip(occurs, term_ids)]))
+        return queries
+
+    def test_find_shard_boundaries(self):
+        periods = [1] * 5 + [2] * 3 + [3] * 10 + [4] * 2
+        self.assertEqual(find_shard_boundaries(periods), [0, 5, 8, 18, 20])
+        self.assertEqual(find_shard_boundaries(periods, max_shards=2), [0, 8, 20])
+        self.assertEqual(find_shard_boundaries([]), [0])
+
+    def test_matches_single_index(self):
+        sharded_index = ShardedIndex("index", processes=False)
+        self.assertEqual(sharded_index.get_shard_names(), ["index-shard-0", "index-shard-1", "index-shard-2"])
+        self.assertEqual(sharded_index.documents.tolist(), self.index.documents.tolist())
+        self.assertEqual(sharded_index.tier_size, 5)
+        for query in self.get_queries():
+            for documents, bm25 in ((None, None), (np.arange(20, 80), None), (None, BM25())):
+                for number_of_results in (1, 10, 100):
+                    self.assertEqual(sharded_index.search_boolean_query(query, number_of_results, documents, bm25),
+                                     self.index.search_boolean_query(query, number_of_results, documents, bm25))
+
+    def test_filtered_queries_skip_shards(self):
+        sharded_index = ShardedIndex("index", processes=False)
+        query = self.get_queries()[0]
+        with mock.patch.object(shards, "_search_shard", wraps=shards._search_shard) as search_shard:
+            # Only the second shard has speeches in the range
+            self.assertEqual(sharded_index.search_boolean_query(query, 10, np.arange(35, 50)),
+                             self.index.search_boolean_query(query, 10, np.arange(35, 50)))
+            self.assertEqual([call.args[0] for call in search_shard.call_args_list],
+                             [sharded_index.segment_set.segments[1]])
+
+    def test_worker_processes(self):
+        sharded_index = ShardedIndex("index")
+        try:
+            for query in self.get_queries()[:5]:
+                self.assertEqual(sharded_index.search_boolean_query(query, 10, np.arange(20, 80)),
+                                 self.index.search_boolean_query(query, 10, np.arange(20, 80)))
+                self.assertEqual(sharded_index.search_boolean_query(query, 20, bm25=BM25()),
+                                 self.index.search_boolean_query(query, 20, bm25=BM25()))
+            # Queries sent from several threads at once, to the same or to different shards, get their own results
+            requests = [(query, documents) for query in self.get_queries()
+                        for documents in (None, np.arange(0, 30), np.arange(35, 50))]
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                results = list(executor.map(lambda request: sharded_index.search_boolean_query(request[0], 10,
+                                                                                               request[1]), requests))
+            self.assertEqual(results, [self.index.search_boolean_query(query, 10, documents)
+                                       for query, documents in requests])
+        finally:
+            sharded_index.close()
+
+    def test_remove_shards(self):
+        ShardedIndex.remove_shards("index")
+        self.assertFalse(ShardedIndex.exists("index"))
+        self.assertFalse(any(file_name.startswith("index-shard-") for file_name in os.listdir("index")))
+        # The index itself is left as is
+        self.assertEqual(SegmentedIndex("index").documents.tolist(), self.index.documents.tolist())
+        # Indexes without shards are left as is too
+        ShardedIndex.remove_shards("index")
+
+
+if __name__ == '__main__':
+    unittest.main()
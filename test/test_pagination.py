@@ -0,0 +1,41 @@
+import unittest
+from datetime import date
+
+from greparl.SearchEngine.backend.filters import SpeechFilter
+from greparl.SearchEngine.backend.inverted.bm25 import BM25
+from greparl.SearchEngine.backend.pagination import encode_cursor, decode_cursor, MAX_PAGE_SIZE, MAX_OFFSET
+
+
+class TestCursor(unittest.TestCase):
+
+    def test_round_trip(self):
+        speech_filter = SpeechFilter(start_date=date(1990, 1, 2), political_party="ΝΕΑ ΔΗΜΟΚΡΑΤΙΑ")
+        pages = [
+            ("κυβέρνηση", 0, 10, None, None),
+            ('"ελληνική δημοκρατία"~2 -ευρώ', 20, 10, speech_filter, BM25(k1=1.5, b=0.5)),
+            ("", 5, 1, SpeechFilter(), None),
+        ]
+        for page in pages:
+            cursor = encode_cursor(*page)
+            # Cursors can be used in URLs as is
+            self.assertRegex(cursor, r"^[A-Za-z0-9_-]+$")
+            self.assertEqual(decode_cursor(cursor), page)
+
+    def test_invalid_cursor(self):
+        for cursor in ("", "not a cursor", "e30", encode_cursor("α", -10, 10), encode_cursor("α", 0, 0),
+                       encode_cursor("α", 0, MAX_PAGE_SIZE + 1), encode_cursor("α", MAX_OFFSET + 1, 10)):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    def test_signed_cursor(self):
+        page = ("κυβέρνηση", 10, 10, SpeechFilter(political_party="ΝΕΑ ΔΗΜΟΚΡΑΤΙΑ"), None)
+        cursor = encode_cursor(*page, secret_key=b"key")
+        self.assertRegex(cursor, r"^[A-Za-z0-9_.-]+$")
+        self.assertEqual(decode_cursor(cursor, b"key"), page)
+        # Cursors signed with another key, tampered with, or not signed at all are rejected
+        payload, signature = cursor.split(".")
+        forged = encode_cursor("κυβέρνηση", 0, 1000, secret_key=b"key").split(".")[0]
+        for invalid in (encode_cursor(*page, secret_key=b"other key"), "{}.{}".format(forged, signature),
+                        payload, encode_cursor(*page), "{}.".format(payload)):
+            with self.assertRaises(ValueError):
+                decode_cursor(invalid, b"key")
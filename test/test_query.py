@@ -0,0 +1,100 @@
+import unittest
+from unittest import mock
+
+from greparl.SearchEngine.backend import query
+from greparl.SearchEngine.backend.inverted.boolean import BooleanQuery, BooleanClause, Occur, Wildcard
+from greparl.SearchEngine.backend.inverted.phrase import Phrase
+from greparl.SearchEngine.backend.query import parse_query, suggest_query
+
+STOPWORDS = {"και", "το"}
+
+
+def process_words(text, delete_stopwords):
+    """Simplified processing, which only capitalizes the words and optionally removes stopwords.
+    """
+    return [word.upper() for word in text.split() if not (delete_stopwords and word in STOPWORDS)]
+
+
+@mock.patch.object(query, "_process_words", process_words)
+class TestQueryParser(unittest.TestCase):
+
+    def test_terms(self):
+        self.assertEqual(parse_query("α β"), BooleanQuery([BooleanClause(Occur.SHOULD, "Α"),
+                                                           BooleanClause(Occur.SHOULD, "Β")]))
+        self.assertEqual(parse_query("+α -β γ"), BooleanQuery([BooleanClause(Occur.MUST, "Α"),
+                                                               BooleanClause(Occur.MUST_NOT, "Β"),
+                                                               BooleanClause(Occur.SHOULD, "Γ")]))
+
+    def test_stopwords(self):
+        # Optional stopwords are ignored, unless the query only has stopwords
+        self.assertEqual(parse_query("α και +το"), BooleanQuery([BooleanClause(Occur.SHOULD, "Α"),
+                                                                 BooleanClause(Occur.MUST, "ΤΟ")]))
+        self.assertEqual(parse_query("και το"), BooleanQuery([BooleanClause(Occur.SHOULD, "ΚΑΙ"),
+                                                              BooleanClause(Occur.SHOULD, "ΤΟ")]))
+
+    def test_operators(self):
+        self.assertEqual(parse_query("α AND β"), BooleanQuery([BooleanClause(Occur.MUST, "Α"),
+                                                               BooleanClause(Occur.MUST, "Β")]))
+        self.assertEqual(parse_query("α AND β OR γ"), BooleanQuery([
+            BooleanClause(Occur.SHOULD, BooleanQuery([BooleanClause(Occur.MUST, "Α"), BooleanClause(Occur.MUST, "Β")])),
+            BooleanClause(Occur.SHOULD, "Γ")]))
+        self.assertEqual(parse_query("+α (β OR γ) -(δ ε"), BooleanQuery([
+            BooleanClause(Occur.MUST, "Α"),
+            BooleanClause(Occur.SHOULD, BooleanQuery([BooleanClause(Occur.SHOULD, "Β"),
+                                                      BooleanClause(Occur.SHOULD, "Γ")])),
+            BooleanClause(Occur.MUST_NOT, BooleanQuery([BooleanClause(Occur.SHOULD, "Δ"),
+                                                        BooleanClause(Occur.SHOULD, "Ε")]))]))
+        self.assertEqual(parse_query(") α OR"), BooleanQuery([BooleanClause(Occur.SHOULD, "Α")]))
+
+    def test_phrases(self):
+        self.assertEqual(parse_query('"α και β"~2 -"γ"'), BooleanQuery([
+            BooleanClause(Occur.SHOULD, Phrase(["Α", "ΚΑΙ", "Β"], 2)), BooleanClause(Occur.MUST_NOT, "Γ")]))
+        self.assertEqual(parse_query('+"α β"').get_scoring_terms(), ["Α", "Β"])
+        self.assertTrue(parse_query('γ (δ OR "α β"~1)').has_phrases())
+        self.assertFalse(parse_query('"α" γ').has_phrases())
+
+
+    def test_wildcards(self):
+        self.assertEqual(parse_query("μετανάστ* +κ?βερνηση"), BooleanQuery([
+            BooleanClause(Occur.SHOULD, Wildcard("ΜΕΤΑΝΑΣΤ*")), BooleanClause(Occur.MUST, Wildcard("Κ?ΒΕΡΝΗΣΗ"))]))
+        # Patterns starting with a wildcard are words
+        self.assertEqual(parse_query("*α"), BooleanQuery([BooleanClause(Occur.SHOULD, "Α")]))
+        self.assertEqual(parse_query("*"), BooleanQuery([]))
+        self.assertEqual(parse_query("μετανάστ* (α OR κυβ*) -βουλ*").get_scoring_patterns(), ["ΜΕΤΑΝΑΣΤ*", "ΚΥΒ*"])
+
+
+
+class MisspellingIndex:
+    """Index with a few terms, finding the similar terms of a term by their first letters.
+    """
+    document_frequencies = {"ΚΥΒΕΡΝΗΣ": 10, "ΚΥΒΕΡΝΗΤ": 3, "ΒΟΥΛ": 5}
+
+    def get_document_frequency(self, term):
+        return self.document_frequencies.get(term, 0)
+
+    def get_similar_terms(self, term, max_distance=None):
+        similar_terms = [(other_term, 1) for other_term in self.document_frequencies if other_term[:3] == term[:3]]
+        return sorted(similar_terms, key=lambda similar_term: -self.document_frequencies[similar_term[0]])
+
+
+def stem_words(text, delete_stopwords):
+    """Simplified stemming, which removes the last letter of every word.
+    """
+    return [word[:-1] for word in process_words(text, delete_stopwords)]
+
+
+@mock.patch.object(query, "_process_words", stem_words)
+class TestSuggestion(unittest.TestCase):
+
+    def test_suggest_query(self):
+        index = MisspellingIndex()
+        # The ending removed by stemming is put back
+        self.assertEqual(suggest_query(index, "κυβερνιση"), "κυβερνηση")
+        self.assertEqual(suggest_query(index, '+"κυβερνισε" AND -βουλι'), '+"κυβερνησε" AND -βουλι')
+        # Stopwords, patterns and words without similar terms are kept
+        self.assertEqual(suggest_query(index, "και κυβερνισ* ξυλο"), None)
+        self.assertEqual(suggest_query(index, "βουλη"), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+
+from greparl.SearchEngine.backend.snippets import SnippetGenerator
+
+SPEECH = "Κύριε Πρόεδρε, η ΚΥΒΈΡΝΗΣΗ δεν έχει σχέδιο. " * 3 + \
+         "Το μεταναστευτικό είναι σοβαρό ζήτημα και η κυβέρνηση πρέπει να δράσει για τους μετανάστες. " + \
+         "Άλλο θέμα. " * 50
+
+
+class TestSnippetGenerator(unittest.TestCase):
+
+    def test_best_window(self):
+        snippet = SnippetGenerator(["ΚΥΒΕΡΝΗΣ", "ΜΕΤΑΝΑΣΤ"], length=80).get_snippet(SPEECH)
+        # The window with both terms, regardless of their case and accents
+        self.assertEqual(snippet, [("ΚΥΒΈΡΝΗΣΗ", True), (" δεν έχει σχέδιο. Το ", False), ("μεταναστευτικό", True),
+                                   (" είναι σοβαρό ζήτημα και η ", False), ("κυβέρνηση", True)])
+        self.assertLessEqual(sum(len(fragment) for fragment, _ in snippet), 80)
+
+    def test_words_and_prefixes(self):
+        snippet = SnippetGenerator(["ΣΧΕΔ"], ["ΜΕΤ"], length=60).get_snippet(SPEECH)
+        # Prefixes match words of any length, while terms only match words a few letters longer
+        self.assertIn(("μεταναστευτικό", True), snippet)
+        self.assertIn(("σχέδιο", True), snippet)
+        snippet = SnippetGenerator(["ΜΕΤ"], length=60).get_snippet(SPEECH)
+        self.assertNotIn(("μεταναστευτικό", True), snippet)
+        # Only whole words match
+        self.assertEqual(SnippetGenerator(["ΕΔΡ"]).get_snippet(SPEECH), SnippetGenerator([]).get_snippet(SPEECH))
+
+    def test_no_matches(self):
+        snippet = SnippetGenerator(["ΞΥΛ"], length=30).get_snippet(SPEECH)
+        self.assertEqual(snippet, [("Κύριε Πρόεδρε, η ΚΥΒΈΡΝΗΣΗ", False)])
+        self.assertEqual(SnippetGenerator(["ΞΥΛ"]).get_snippet("Σύντομη ομιλία"), [("Σύντομη ομιλία", False)])
+
+
+if __name__ == '__main__':
+    unittest.main()
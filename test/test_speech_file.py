@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from greparl.SearchEngine.backend import speech_file
+from greparl.SearchEngine.backend.speech_file import SpeechFile, get_offsets_file_name
+from greparl.SearchEngine.preprocessing.funcs import process_csv_line
+
+HEADER = "member_name,sitting_date,parliamentary_period,parliamentary_session,parliamentary_sitting,political_party," \
+         "government,member_region,roles,member_gender,speech\n"
+
+
+def create_speech_line(speech_id: int) -> str:
+    """
+    Create the line of a speech, with Greek text of varying length so that the offsets are not regular.
+    """
+    return "μέλος {},{:02d}/0{}/19{},περιοδος {},συνοδος 1,συνεδριαση {},κόμμα {},['κυβέρνηση {}'],περιφέρεια," \
+           "\"['ρόλος α', 'ρόλος β']\",male,Ομιλία {} {}\n".format(speech_id % 5, speech_id % 28 + 1, speech_id % 9 + 1,
+                                                                   90 + speech_id // 100, speech_id // 100,
+                                                                   speech_id, speech_id % 3, speech_id // 50,
+                                                                   speech_id, "λέξη " * (speech_id % 17))
+
+
+class TestSpeechFile(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.speeches_csv_name = os.path.join(self.directory.name, "speeches.csv")
+        self.write_speeches(250)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_speeches(self, total_speeches: int) -> None:
+        self.lines = [create_speech_line(speech_id) for speech_id in range(total_speeches)]
+        with open(self.speeches_csv_name, "w", encoding="utf8") as speeches_csv:
+            speeches_csv.write(HEADER + "".join(self.lines))
+
+    def expected(self, speech_id: int):
+        speech = process_csv_line(self.lines[speech_id])
+        speech.id = speech_id
+        return speech
+
+    def test_get_speech(self):
+        speeches = SpeechFile(self.speeches_csv_name)
+        self.assertEqual(speeches.total_speeches, len(self.lines))
+        for speech_id in (0, 1, 99, 100, 101, 173, len(self.lines) - 1):
+            self.assertEqual(speeches.get_speech(speech_id), self.expected(speech_id))
+        self.assertEqual(speeches.date_range, (self.expected(0).sitting_date, self.expected(249).sitting_date))
+        with self.assertRaises(RuntimeError):
+            speeches.get_speech(len(self.lines))
+
+    def test_get_speeches(self):
+        speeches = SpeechFile(self.speeches_csv_name)
+        speech_ids = [201, 3, 150, 4, 0, 249, 99, 100]
+        self.assertEqual(speeches.get_speeches(speech_ids, preserve_order=True),
+                         [self.expected(speech_id) for speech_id in speech_ids])
+        self.assertEqual(sorted(speeches.get_speeches(speech_ids), key=lambda speech: speech.id),
+                         [self.expected(speech_id) for speech_id in sorted(speech_ids)])
+
+    def test_speeches(self):
+        speeches = SpeechFile(self.speeches_csv_name)
+        self.assertEqual(list(speeches.speeches()), [self.expected(speech_id) for speech_id in range(len(self.lines))])
+
+    def test_last_line_without_line_end(self):
+        with open(self.speeches_csv_name, "w", encoding="utf8") as speeches_csv:
+            speeches_csv.write(HEADER + "".join(self.lines).removesuffix("\n"))
+        speeches = SpeechFile(self.speeches_csv_name)
+        self.assertEqual(speeches.total_speeches, len(self.lines))
+        self.assertEqual(speeches.get_speech(len(self.lines) - 1), self.expected(len(self.lines) - 1))
+
+    def test_offsets_file(self):
+        SpeechFile(self.speeches_csv_name)
+        self.assertTrue(os.path.exists(get_offsets_file_name(self.speeches_csv_name)))
+        # The offsets are not calculated again while the speeches file does not change
+        with mock.patch.object(speech_file, "calculate_offsets", wraps=speech_file.calculate_offsets) as calculate:
+            speeches = SpeechFile(self.speeches_csv_name)
+            calculate.assert_not_called()
+            self.assertEqual(speeches.get_speech(123), self.expected(123))
+            # Changing the speeches file makes the offsets file out of date
+            self.write_speeches(180)
+            speeches = SpeechFile(self.speeches_csv_name)
+            calculate.assert_called_once()
+        self.assertEqual(speeches.total_speeches, 180)
+        self.assertEqual(speeches.get_speeches(list(range(180))), [self.expected(i) for i in range(180)])
+
+    def test_invalid_offsets_file(self):
+        with open(get_offsets_file_name(self.speeches_csv_name), "wb") as offsets_file:
+            offsets_file.write(b"not offsets")
+        speeches = SpeechFile(self.speeches_csv_name)
+        self.assertEqual(speeches.get_speech(42), self.expected(42))
+
+
+if __name__ == '__main__':
+    unittest.main()
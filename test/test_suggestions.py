@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from greparl.SearchEngine.backend.suggestions import CompletionIndex, create_name_completions, \
+    create_term_completions, get_words, normalize_prefix
+
+
+class TestCompletionIndex(unittest.TestCase):
+
+    def test_complete(self):
+        rng = np.random.default_rng(3)
+        keys = sorted(set("".join(rng.choice(list("ΑΒΓΔ"), rng.integers(1, 7))) for _ in range(500)))
+        frequencies = rng.integers(0, 20, len(keys))
+        completions = CompletionIndex(keys, [key.lower() for key in keys], frequencies, max_suggestions=5)
+        self.assertEqual(len(completions), len(keys))
+        for prefix in ["", "Α", "ΒΓ", "ΓΔΑ", "ΔΔΔΔ", "Ε", "ΑΒΓΔΑΒΓ"]:
+            # Most frequent first, and alphabetically among equally frequent ones
+            expected = [key.lower() for key in sorted((key for key in keys if key.startswith(prefix)),
+                                                      key=lambda key: (-frequencies[keys.index(key)], key))]
+            for k in (1, 5, 8):
+                self.assertEqual(completions.complete(prefix, k), expected[:k] if prefix else [])
+
+    def test_names(self):
+        completions = create_name_completions({
+            "μητσοτάκης κυριάκος κωνσταντίνου": [1, 2, 3],
+            "κυριακίδης ευάγγελος": [4, 5],
+            "μητσοτάκης κωνσταντίνος κυριάκου": [6],
+            "": [7, 8, 9, 10],
+        })
+        # Names can be typed starting from any of their words, without accents
+        self.assertEqual(completions.complete(normalize_prefix("Κυρια")), ["μητσοτάκης κυριάκος κωνσταντίνου",
+                                                                            "κυριακίδης ευάγγελος",
+                                                                            "μητσοτάκης κωνσταντίνος κυριάκου"])
+        self.assertEqual(completions.complete(normalize_prefix("μητσοτάκης κω")),
+                         ["μητσοτάκης κωνσταντίνος κυριάκου"])
+        self.assertEqual(completions.complete(normalize_prefix("μ")), ["μητσοτάκης κυριάκος κωνσταντίνου",
+                                                                        "μητσοτάκης κωνσταντίνος κυριάκου"])
+
+    def test_words(self):
+        # Stopwords and short words are left out, and the rest are kept as written, in lowercase
+        self.assertEqual(get_words("Η Κυβέρνηση και η κυβέρνηση, ο κύριος Υπουργός."),
+                         {"κυβέρνηση", "κύριος", "υπουργός"})
+
+    def test_terms(self):
+        word_frequencies = {"κυβέρνηση": 10, "κυβέρνησης": 4, "κυβερνηση": 1, "κυβερνητικός": 3, "κύριε": 20,
+                            "κυρίες": 2, "κυπριακό": 5}
+        completions = create_term_completions(word_frequencies, ["ΚΥΒΕΡΝΗΣ", "ΚΥΒΕΡΝΗΤ", "ΚΥΡΙ"])
+        # Words are suggested as written, not as stems, and words without a term in the index are left out
+        self.assertEqual(completions.complete("Κ"), ["κύριε", "κυβέρνηση", "κυβέρνησης", "κυβερνητικός", "κυρίες"])
+        # Spellings differing in their accents are suggested once, in the most common spelling
+        self.assertEqual(completions.complete("ΚΥΒΕΡΝΗΣΗ"), ["κυβέρνηση", "κυβέρνησης"])
+        self.assertEqual(completions.complete("ΚΥΒ", 1), ["κυβέρνηση"])
+        with tempfile.TemporaryDirectory() as directory:
+            completions_file_name = os.path.join(directory, "completions", "terms.pkl")
+            completions.write(completions_file_name)
+            self.assertEqual(CompletionIndex.read(completions_file_name).complete("Κ"), completions.complete("Κ"))
+
+
+if __name__ == '__main__':
+    unittest.main()